@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Commit, Hash, Path, Publication, Repository
+from .models import Commit, Hash, HashMemo, Path, Publication, Repository
 
 # Register your models here.
 admin.site.register(Repository)
@@ -8,3 +8,4 @@ admin.site.register(Publication)
 admin.site.register(Commit)
 admin.site.register(Hash)
 admin.site.register(Path)
+admin.site.register(HashMemo)
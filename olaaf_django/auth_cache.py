@@ -0,0 +1,113 @@
+"""
+Cache of results of authentication of documents, so that popular documents are not parsed,
+hashed and looked up again each time they are authenticated. Results are stored in the
+Django cache whose alias is set by the `AUTHENTICATION_CACHE` setting, caching is disabled
+if it is not set. Results are keyed by the repository, the requested url (which determines
+the publication and the date) and a digest of the submitted content.
+
+Keys also include the sync generation, which `sync_hashes` bumps whenever it changes
+hashes or publications, so results cached before a sync are never returned after it. The
+generation is stored in the same cache, so syncs are only detected if the cache is shared
+by the server and the processes which sync hashes, e.g. a memcached, Redis or database
+cache if they run on different hosts.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import registry
+
+GENERATION_KEY = 'olaaf:sync-generation'
+# results are invalidated by syncs, so they only expire to free up space
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+AUTHENTICATION_CACHE_REQUESTS = registry.counter(
+    'olaaf_authentication_cache_requests_total',
+    'Number of lookups of cached authentication results', ('result',))
+
+
+def _get_cache():
+  alias = getattr(settings, 'AUTHENTICATION_CACHE', None)
+  return caches[alias] if alias is not None else None
+
+
+def get_sync_generation(cache=None):
+  """
+  Return the current sync generation, initializing it if it is not cached, or None if
+  caching is disabled
+  """
+  cache = cache or _get_cache()
+  if cache is None:
+    return None
+  # a new generation is never lower than the ones used before the counter was evicted, so
+  # results cached before the eviction can not be returned
+  return cache.get_or_set(GENERATION_KEY, time.time_ns, timeout=None)
+
+
+def bump_sync_generation():
+  """
+  <Purpose>
+    Invalidate all cached authentication results. Called by `sync_hashes` once it commits
+    changes of hashes or publications
+  <Arguments>
+    None
+  <Returns>
+    The new sync generation, or None if caching is disabled
+  """
+  cache = _get_cache()
+  if cache is None:
+    return None
+  try:
+    return cache.incr(GENERATION_KEY)
+  except ValueError:
+    # the counter was never set or it was evicted
+    generation = time.time_ns()
+    cache.set(GENERATION_KEY, generation, timeout=None)
+    return generation
+
+
+def response_key(repo_name, url, content):
+  """
+  <Purpose>
+    Calculate the cache key of the result of authentication of the given content
+  <Arguments>
+    repo_name:
+      Name of the repository of the host
+    url:
+      Requested url, including the publication and the date if specified
+    content:
+      Submitted content, either a string or an uploaded file, which is rewound once read
+  <Returns>
+    The cache key, or None if caching is disabled
+  """
+  cache = _get_cache()
+  if cache is None:
+    return None
+  digest = hashlib.sha256()
+  if isinstance(content, str):
+    digest.update(content.encode('utf-8', 'surrogateescape'))
+  else:
+    for chunk in content.chunks():
+      digest.update(chunk)
+    content.seek(0)
+  url_digest = hashlib.sha256(f'{repo_name}\n{url}'.encode('utf-8')).hexdigest()
+  return f'olaaf:auth:{get_sync_generation(cache)}:{url_digest}:{digest.hexdigest()}'
+
+
+def get_response(key):
+  """Return the cached `AuthenticationResponse` stored under the given key, or None"""
+  if key is None:
+    return None
+  response = _get_cache().get(key)
+  AUTHENTICATION_CACHE_REQUESTS.inc(result='miss' if response is None else 'hit')
+  return response
+
+
+def set_response(key, response):
+  """Cache the given `AuthenticationResponse` under the given key"""
+  if key is None:
+    return
+  timeout = getattr(settings, 'AUTHENTICATION_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+  _get_cache().set(key, response, timeout=timeout)
@@ -1,10 +1,13 @@
 import datetime
 import mimetypes
 
+from django.db.models import Q
 from django.http import HttpResponse
 from django.template import loader
 from lxml import html as et_html
 
+from .hashers import get_hasher
+from .metrics import registry
 from .models import Hash, Path, Publication
 from .utils import (calc_hash, get_auth_div_content, get_html_document,
                     reset_local_urls)
@@ -12,44 +15,51 @@ from .utils import (calc_hash, get_auth_div_content, get_html_document,
 HTML_CONTENT_TYPE = mimetypes.types_map.get('.html')
 PDF_CONTENT_TYPE = mimetypes.types_map.get('.pdf')
 
+CHECK_AUTHENTICITY_DURATION = registry.histogram(
+    'olaaf_check_authenticity_duration_seconds',
+    'Duration of hashing of submitted documents and lookup of their hashes')
 
+
+@CHECK_AUTHENTICITY_DURATION.time()
 def check_authenticity(publication, pub_name, date, path, url, content, content_type):
-  hashing_func = {
-      HTML_CONTENT_TYPE: _calculate_html_hash,
-      PDF_CONTENT_TYPE: _calculate_binary_content_hash
-  }.get(content_type)
+  # content is either a string or an uploaded file, which is hashed chunk by chunk unless
+  # it has to be parsed
+  file_hasher = get_hasher(content_type)
 
-  if hashing_func is None or not _is_authenticable(publication, path):
+  if file_hasher is None or not _is_authenticable(publication, path):
     return AuthenticationResponse(url, authenticable=False)
 
-  if content_type == HTML_CONTENT_TYPE:
-    content = reset_local_urls(content, pub_name, date)
-
   try:
-    hash_value = hashing_func(content, content_type)
+    if file_hasher.needs_document:
+      if not isinstance(content, str):
+        content = content.read().decode('utf-8')
+      if content_type == HTML_CONTENT_TYPE:
+        content = reset_local_urls(content, pub_name, date)
+      hash_value = _calculate_html_hash(content, content_type)
+    else:
+      hash_value = _calculate_binary_content_hash(content, file_hasher)
   except Exception:
     return AuthenticationResponse(url, authenticable=False)
 
   if date is not None:
     date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
 
-  hash_type = Hash.RENDERED if content_type == HTML_CONTENT_TYPE else Hash.BITSTREAM
-  hash_data = (
-      Hash.objects
-      .filter(
-          path__url=path,
-          value=hash_value,
-          hash_type=hash_type,
-          start_commit__publication=publication)
-      .values('start_commit__date', 'end_commit__date')
-  )
-
-  if not len(hash_data):
+  hash_type = Hash.RENDERED if file_hasher.needs_document else Hash.BITSTREAM
+  hashes = Hash.objects.filter(path__url=path, path__publication=publication, value=hash_value,
+                               hash_type=hash_type)
+  if date is not None:
+    # only a hash which was valid at the given date authenticates the document
+    hashes = hashes.filter(Q(valid_to__isnull=True) | Q(valid_to__gte=date), valid_from__lte=date)
+  # the same content might have been valid multiple times, in which case the newest interval
+  # is used
+  hash_data = hashes.order_by('-valid_from').values('valid_from', 'valid_to').first()
+
+  if hash_data is None:
     # not authentic
     return AuthenticationResponse(url, date=date)
 
-  start_commit_date = hash_data[0]['start_commit__date']
-  end_commit_date = hash_data[0]['end_commit__date']
+  start_commit_date = hash_data['valid_from']
+  end_commit_date = hash_data['valid_to']
 
   if date is None:
     if publication.name == publication.latest and end_commit_date is None:
@@ -58,18 +68,20 @@ def check_authenticity(publication, pub_name, date, path, url, content, content_
       return AuthenticationResponse(url, authentic=True, from_date=start_commit_date,
                                     to_date=end_commit_date)
 
-  if date >= start_commit_date and (end_commit_date is None or date <= end_commit_date):
-    return AuthenticationResponse(url, authentic=True, from_date=start_commit_date, date=date)
-  else:
-    return AuthenticationResponse(url, authentic=False, date=date)
+  return AuthenticationResponse(url, authentic=True, from_date=start_commit_date, date=date)
 
 
 def _is_authenticable(publication, path):
-  return Path.objects.filter(publication=publication, url=path).count() > 0
+  # urls of publications loaded by the publication cache are cached as well
+  authenticable_urls = getattr(publication, 'authenticable_urls', None)
+  if authenticable_urls is not None:
+    return path in authenticable_urls
+  return Path.objects.filter(publication=publication, url=path).exists()
 
 
-def _calculate_binary_content_hash(binary_content, file_type):
-  return calc_hash(binary_content, file_type)
+def _calculate_binary_content_hash(content, file_hasher):
+  chunks = [content] if isinstance(content, (bytes, str)) else content.chunks()
+  return file_hasher.hash_chunks(chunks)
 
 
 def _calculate_html_hash(html_content, file_type):
@@ -0,0 +1,48 @@
+"""
+Benchmarks of the synchronization and authentication code. They are run by management
+commands against a throwaway test database created using the configured database engine,
+so the same benchmark can be compared on SQLite and PostgreSQL.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def benchmark_database(verbosity=0, keepdb=False):
+  """
+  Create a test database (named the same way as the one used by the tests), switch the
+  default connection to it and destroy it afterwards
+  """
+  old_name = connection.settings_dict['NAME']
+  connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=keepdb)
+  try:
+    yield connection
+  finally:
+    connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+
+
+def measure(func, repeat=3, setup=None):
+  """
+  <Purpose>
+    Call a function several times and measure how long each call takes
+  <Arguments>
+    func:
+      Function which is measured
+    repeat:
+      Number of calls
+    setup:
+      Function called before each call of `func`. It is not measured
+  <Returns>
+    A dictionary containing the minimal and the median time, in seconds
+  """
+  timings = []
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+    start_time = time.perf_counter()
+    func()
+    timings.append(time.perf_counter() - start_time)
+  return {'min': min(timings), 'median': statistics.median(timings)}
@@ -0,0 +1,392 @@
+"""
+Load tests of the authentication endpoints (`views.authenticate` and `views.check_hashes`).
+A dataset of synthetic publications with millions of hashes is generated once into the
+configured database, which should be a dedicated one, and mixed authentication traffic is
+then replayed against it through the Django test client or a local WSGI server.
+
+Most hash values are synthetic. Hashes of the first `documents` paths of each publication
+are calculated from generated documents, so that the same documents can be submitted to
+`authenticate` and found to be authentic.
+"""
+import datetime
+import hashlib
+import http.client
+import json
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+import olaaf_django
+from olaaf_django import auth_cache
+from olaaf_django.authentication import _calculate_html_hash
+from olaaf_django.models import Commit, Hash, Path, Publication, Repository
+from olaaf_django.utils import calc_hash
+
+logger = logging.getLogger(__name__)
+
+REPO_NAME = 'benchmark/auth'
+# host of the generated repository, it is allowed by `setup_test_environment`
+HOST = 'testserver'
+FIRST_PUBLICATION_DATE = datetime.date(2000, 1, 1)
+# directory of paths whose hashes are calculated from generated documents
+DOCUMENTS_DIRECTORY = 'documents'
+FILES_PER_DIRECTORY = 100
+BATCH_SIZE = 2000
+# number of randomly chosen hash ids from which requests are built
+SAMPLE_SIZE = 20000
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed',
+         'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna')
+
+AUTHENTICATE = 'authenticate'
+CHECK_HASHES = 'check-hashes'
+SERVERS = ('client', 'wsgi')
+
+
+def generate_dataset(publications=100, paths=1000, versions=5, documents=100, seed=0):
+  """
+  <Purpose>
+    Create a repository with synthetic publications. Each publication has `versions`
+    commits and each of its html paths has a bitstream and a rendered hash per commit, so
+    `2 * publications * paths * versions` hashes are created in total. A hash is valid
+    until the next hash of the same path becomes valid, hashes of the last commit are
+    current
+  <Arguments>
+    publications:
+      Number of publications
+    paths:
+      Number of paths of each publication
+    versions:
+      Number of commits of each publication
+    documents:
+      Number of paths of each publication whose hashes are calculated from generated
+      documents
+    seed:
+      Seed of commit shas and therefore of contents of the generated documents
+  <Returns>
+    Number of created hashes
+  """
+  if Repository.objects.filter(name=REPO_NAME).exists():
+    raise ValueError(f'Repository {REPO_NAME} already exists')
+  repository = Repository.objects.create(name=REPO_NAME)
+  created = 0
+  for publication_index in range(publications):
+    with transaction.atomic():
+      created += _generate_publication(repository, publication_index, paths, versions,
+                                       documents, seed)
+    logger.info('Generated publication %s of %s, %s hashes in total', publication_index + 1,
+                publications, created)
+  # results cached before the dataset was generated, like ones cached before a sync, are stale
+  auth_cache.bump_sync_generation()
+  return created
+
+
+def _generate_publication(repository, publication_index, paths, versions, documents, seed):
+  date = FIRST_PUBLICATION_DATE + datetime.timedelta(days=publication_index)
+  publication = Publication.objects.create(name=date.isoformat(), date=date,
+                                           repository=repository)
+  commits = [Commit(sha=hashlib.sha1(f'{seed}/{publication.name}/{version}'.encode()).hexdigest(),
+                    date=date - datetime.timedelta(days=versions - version),
+                    publication=publication)
+             for version in range(versions)]
+  Commit.objects.bulk_create(commits, batch_size=BATCH_SIZE)
+  # ids are only set by bulk_create on some databases
+  commit_ids = dict(Commit.objects.filter(publication=publication).values_list('sha', 'id'))
+  commits = [(commit.sha, commit_ids[commit.sha], commit.date) for commit in commits]
+
+  Path.objects.bulk_create(
+      (Path(filesystem=f'{_url(index, documents)}.html', url=_url(index, documents),
+            publication=publication) for index in range(paths)),
+      batch_size=BATCH_SIZE)
+  new_paths = Path.objects.filter(publication=publication).values_list('id', 'url')
+  Hash.objects.bulk_create(_hashes(new_paths.iterator(), commits), batch_size=BATCH_SIZE)
+  return 2 * paths * versions
+
+
+def _url(index, documents):
+  if index < documents:
+    return f'{DOCUMENTS_DIRECTORY}/doc-{index}'
+  return f'section-{index // FILES_PER_DIRECTORY}/doc-{index}'
+
+
+def _hashes(paths, commits):
+  for path_id, url in paths:
+    for version, (sha, commit_id, date) in enumerate(commits):
+      end_commit_id, end_date = commits[version + 1][1:] if version + 1 < len(commits) \
+          else (None, None)
+      if url.startswith(f'{DOCUMENTS_DIRECTORY}/'):
+        document = _document(url, sha)
+        bitstream = calc_hash(document.encode(), 'html')
+        rendered = _calculate_html_hash(document, 'text/html')
+      else:
+        bitstream = hashlib.sha256(f'{path_id}/{sha}/B'.encode()).hexdigest()
+        rendered = hashlib.sha256(f'{path_id}/{sha}/R'.encode()).hexdigest()
+      for hash_type, value in ((Hash.BITSTREAM, bitstream), (Hash.RENDERED, rendered)):
+        yield Hash(value=value, hash_type=hash_type, path_id=path_id, start_commit_id=commit_id,
+                   end_commit_id=end_commit_id, valid_from=date, valid_to=end_date)
+
+
+def _document(url, sha, paragraphs=10):
+  """Html document of the given url as of the commit with the given sha"""
+  rng = random.Random(f'{url}/{sha}')
+  body = '\n'.join('<p>{}</p>'.format(' '.join(rng.choice(WORDS) for _ in range(40)))
+                   for _ in range(paragraphs))
+  return (f'<html>\n<head><meta property="og:url" content="https://benchmark.com/{url}" />'
+          f'</head>\n<body data-search-path="{url}">\n'
+          f'<div class="no-authenticate">{url}</div>\n'
+          f'<div class="tuf-authenticate">\n{body}\n</div>\n</body>\n</html>\n')
+
+
+def build_requests(number, check_hashes_ratio=0.5, authentic_ratio=0.8, batch_size=10,
+                   seed=0):
+  """
+  <Purpose>
+    Build a random mix of requests to the authentication endpoints from hashes of the
+    generated dataset
+  <Arguments>
+    number:
+      Number of requests
+    check_hashes_ratio:
+      Fraction of requests which check hashes of files, the remaining ones submit
+      documents to be authenticated
+    authentic_ratio:
+      Fraction of submitted documents and checked hashes which are authentic
+    batch_size:
+      Number of hashes checked by one request
+    seed:
+      Seed of the random generator
+  <Returns>
+    A list of (endpoint, data) tuples
+  """
+  rng = random.Random(seed)
+  hashes, documents = _sample_hashes(rng)
+  if not hashes:
+    raise ValueError(f'Dataset of repository {REPO_NAME} is not generated')
+  if not documents and check_hashes_ratio < 1:
+    raise ValueError('Dataset does not contain any generated documents')
+
+  requests = []
+  for _ in range(number):
+    if rng.random() < check_hashes_ratio:
+      data = [{'name': f'file-{index}',
+               'hash': (rng.choice(hashes) if rng.random() < authentic_ratio
+                        else '%064x' % rng.getrandbits(256))}
+              for index in range(batch_size)]
+      requests.append((CHECK_HASHES, json.dumps(data)))
+    else:
+      publication_name, url, sha, date = rng.choice(documents)
+      content = _document(url, sha)
+      if rng.random() >= authentic_ratio:
+        content = content.replace('</p>', ' modified</p>', 1)
+      # half of the documents are authenticated as of the date of their commit
+      prefix = f'_publication/{publication_name}'
+      if rng.random() < 0.5:
+        prefix += f'/_date/{date.isoformat()}'
+      requests.append((AUTHENTICATE, {'url': f'{prefix}/{url}', 'content': content}))
+  return requests
+
+
+def _sample_hashes(rng):
+  """
+  Return values of randomly chosen hashes of the dataset and (publication name, url, commit
+  sha, commit date) of randomly chosen generated documents
+  """
+  dataset_hashes = Hash.objects.filter(path__publication__repository__name=REPO_NAME)
+  bounds = dataset_hashes.order_by('id').values_list('id', flat=True)
+  first_id, last_id = bounds.first(), bounds.last()
+  if first_id is None:
+    return [], []
+  ids = [rng.randint(first_id, last_id) for _ in range(SAMPLE_SIZE)]
+  sample = (
+      dataset_hashes
+      .filter(id__in=ids)
+      .values_list('value', 'hash_type', 'path__url', 'path__publication__name',
+                   'start_commit__sha', 'valid_from')
+  )
+  hashes = []
+  documents = []
+  for value, hash_type, url, publication_name, sha, date in sample.iterator():
+    hashes.append(value)
+    if hash_type == Hash.RENDERED and url.startswith(f'{DOCUMENTS_DIRECTORY}/'):
+      documents.append((publication_name, url, sha, date))
+  return hashes, documents
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+  def log_message(self, format, *args):
+    pass
+
+
+@contextmanager
+def _wsgi_server():
+  """Serve the project's WSGI application on a random local port"""
+  server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietRequestHandler)
+  server.set_app(get_wsgi_application())
+  thread = threading.Thread(target=server.serve_forever, name='wsgi-server', daemon=True)
+  thread.start()
+  try:
+    yield server.server_address
+  finally:
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _client_sender():
+  local = threading.local()
+
+  def _send(endpoint, data):
+    client = getattr(local, 'client', None)
+    if client is None:
+      client = local.client = Client()
+    if endpoint == CHECK_HASHES:
+      response = client.post(reverse(endpoint), data, content_type='application/json')
+    else:
+      response = client.post(reverse(endpoint), data)
+    return response.status_code
+  return _send
+
+
+def _http_sender(address):
+  host, port = address
+
+  def _send(endpoint, data):
+    if endpoint == CHECK_HASHES:
+      body, content_type = data, 'application/json'
+    else:
+      body, content_type = urlencode(data), 'application/x-www-form-urlencoded'
+    # the server closes connections after each response
+    http_connection = http.client.HTTPConnection(host, port)
+    try:
+      http_connection.request('POST', reverse(endpoint), body=body.encode(),
+                              headers={'Host': HOST, 'Content-Type': content_type})
+      response = http_connection.getresponse()
+      response.read()
+      return response.status
+    finally:
+      http_connection.close()
+  return _send
+
+
+def run_load(requests, concurrency=1, server='client', warmup=10):
+  """
+  <Purpose>
+    Send requests to the authentication endpoints from concurrent threads and measure
+    their latencies
+  <Arguments>
+    requests:
+      A list of (endpoint, data) tuples, as returned by `build_requests`
+    concurrency:
+      Number of threads which send requests
+    server:
+      'client' to send requests through the Django test client, or 'wsgi' to send them
+      over HTTP to a local threaded WSGI server
+    warmup:
+      Number of requests sent before the measurement starts, e.g. to load templates
+  <Returns>
+    A dictionary of results
+  """
+  if server not in SERVERS:
+    raise ValueError(f'Unknown server {server}, expected one of {SERVERS}')
+  with _benchmark_host(), _server_sender(server) as send:
+    for endpoint, data in requests[:warmup]:
+      send(endpoint, data)
+    latencies = {AUTHENTICATE: [], CHECK_HASHES: []}
+    statuses = {}
+    errors = []
+    lock = threading.Lock()
+    pending = iter(requests[warmup:])
+
+    def _worker():
+      try:
+        while True:
+          with lock:
+            request = next(pending, None)
+          if request is None:
+            return
+          endpoint, data = request
+          start_time = time.perf_counter()
+          try:
+            status = send(endpoint, data)
+          except Exception as e:
+            with lock:
+              errors.append(repr(e))
+            continue
+          latency = time.perf_counter() - start_time
+          with lock:
+            latencies[endpoint].append(latency)
+            statuses[status] = statuses.get(status, 0) + 1
+      finally:
+        # database connections are per thread and are not closed automatically
+        connections.close_all()
+
+    threads = [threading.Thread(target=_worker, name=f'load-{index}')
+               for index in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    elapsed_time = time.perf_counter() - start_time
+
+  sent = sum(len(endpoint_latencies) for endpoint_latencies in latencies.values())
+  return {
+      'seconds': round(elapsed_time, 3),
+      'requests': sent,
+      'requests_per_second': round(sent / elapsed_time, 1) if elapsed_time else None,
+      'statuses': {str(status): count for status, count in sorted(statuses.items())},
+      'errors': len(errors),
+      'endpoints': {endpoint: _latency_summary(endpoint_latencies)
+                    for endpoint, endpoint_latencies in latencies.items()
+                    if endpoint_latencies},
+  }
+
+
+@contextmanager
+def _benchmark_host():
+  """Allow the benchmark host and map it to the generated repository"""
+  previous = olaaf_django.HOSTS_REPOS_CACHE.get(HOST)
+  setup_test_environment()
+  olaaf_django.HOSTS_REPOS_CACHE[HOST] = REPO_NAME
+  try:
+    yield
+  finally:
+    teardown_test_environment()
+    if previous is None:
+      olaaf_django.HOSTS_REPOS_CACHE.pop(HOST, None)
+    else:
+      olaaf_django.HOSTS_REPOS_CACHE[HOST] = previous
+
+
+@contextmanager
+def _server_sender(server):
+  if server == 'client':
+    yield _client_sender()
+  else:
+    with _wsgi_server() as address:
+      yield _http_sender(address)
+
+
+def _latency_summary(latencies):
+  latencies = sorted(latencies)
+  summary = {'count': len(latencies)}
+  for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+    summary[f'{name}_ms'] = round(_percentile(latencies, fraction) * 1000, 3)
+  summary['max_ms'] = round(latencies[-1] * 1000, 3)
+  return summary
+
+
+def _percentile(sorted_values, fraction):
+  """Nearest-rank percentile of a sorted, non-empty list"""
+  index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+  return sorted_values[index]
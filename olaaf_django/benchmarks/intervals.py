@@ -0,0 +1,81 @@
+"""
+Compares strategies of closing of hash intervals (see `olaaf_django.intervals`).
+"""
+import datetime
+import logging
+
+from django.db import transaction
+
+from olaaf_django.benchmarks import measure
+from olaaf_django.intervals import CLOSE_STRATEGIES, close_hash_intervals
+from olaaf_django.models import Commit, Hash, Path, Publication, Repository
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+
+def benchmark_close_hash_intervals(sizes, strategies=CLOSE_STRATEGIES, repeat=3):
+  """
+  <Purpose>
+    Create hashes and measure how long it takes to close intervals of the given number
+    of them using each of the strategies. Must be run against a throwaway database
+  <Arguments>
+    sizes:
+      A list of numbers of closed hashes
+    strategies:
+      Names of the compared strategies
+    repeat:
+      Number of measurements of each strategy and size
+  <Returns>
+    A list of results, one dictionary per size and strategy
+  """
+  start_commit, end_commit = _create_commits()
+  results = []
+  for size in sorted(sizes):
+    hash_ids = _create_hashes(start_commit, size)
+    for strategy in strategies:
+      timings = measure(lambda: _close(hash_ids, end_commit, strategy), repeat=repeat,
+                        setup=lambda: Hash.objects.update(end_commit=None, valid_to=None))
+      result = {
+          'size': size,
+          'strategy': strategy,
+          'min_seconds': round(timings['min'], 4),
+          'median_seconds': round(timings['median'], 4),
+          'hashes_per_second': round(size / timings['median']) if timings['median'] else None,
+      }
+      logger.info('Closed %s hashes using %s in %.4f seconds', size, strategy,
+                  timings['median'])
+      results.append(result)
+  return results
+
+
+def _close(hash_ids, end_commit, strategy):
+  with transaction.atomic():
+    close_hash_intervals(hash_ids, end_commit, strategy=strategy)
+
+
+def _create_commits():
+  today = datetime.date.today()
+  repository = Repository.objects.create(name='benchmark')
+  publication = Publication.objects.create(name=today.isoformat(), date=today,
+                                           repository=repository)
+  start_commit = Commit.objects.create(sha='1' * 40, date=today, publication=publication)
+  end_commit = Commit.objects.create(sha='2' * 40, date=today, publication=publication)
+  return start_commit, end_commit
+
+
+def _create_hashes(start_commit, size):
+  """Create paths and hashes so that there are `size` hashes in total and return their ids"""
+  publication = start_commit.publication
+  existing = Hash.objects.count()
+  paths = [Path(filesystem=f'benchmark/{index}.html', url=f'/benchmark/{index}',
+                publication=publication) for index in range(existing, size)]
+  Path.objects.bulk_create(paths, batch_size=BATCH_SIZE)
+  new_paths = Path.objects.filter(filesystem__in=[path.filesystem for path in paths]) \
+      .values_list('id', flat=True)
+  Hash.objects.bulk_create(
+      (Hash(value=f'{path_id:064d}', path_id=path_id, start_commit=start_commit,
+            valid_from=start_commit.date)
+       for path_id in new_paths.iterator()), batch_size=BATCH_SIZE)
+  return list(Hash.objects.order_by('id').values_list('id', flat=True))
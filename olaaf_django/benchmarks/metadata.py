@@ -0,0 +1,132 @@
+"""
+Compares ways of reading metadata (authentication div, og:url and the last search path) of
+html documents. `xpaths` is the one used by `olaaf_django.hashing.read_document_metadata`,
+the other ones read all of the metadata in a single pass over the document. Each of them is
+measured together with parsing of the document, since `iterparse` reads the metadata while
+the document is being parsed.
+"""
+import logging
+from io import BytesIO
+from urllib.parse import urlparse
+
+from lxml import etree
+from lxml import html as et_html
+
+from olaaf_django.benchmarks import measure
+from olaaf_django.hashers import get_hasher
+from olaaf_django.hashing import DocumentMetadata, read_document_metadata
+
+logger = logging.getLogger(__name__)
+
+# precompiled XPaths, one per kind of metadata, some of which stop at the first match
+METADATA_USING_XPATHS = 'xpaths'
+# a single XPath which selects all elements which hold metadata, in document order
+METADATA_USING_UNION_XPATH = 'union_xpath'
+# iteration over all elements of a parsed document
+METADATA_USING_ELEMENT_ITERATION = 'element_iteration'
+# iteration over elements as they are parsed
+METADATA_USING_ITERPARSE = 'iterparse'
+METADATA_STRATEGIES = (METADATA_USING_XPATHS, METADATA_USING_UNION_XPATH,
+                       METADATA_USING_ELEMENT_ITERATION, METADATA_USING_ITERPARSE)
+
+_METADATA_ELEMENTS = etree.XPath(
+    "descendant-or-self::*[@data-search-path or contains(@property, 'og:url') "
+    "or contains(@class, 'tuf-authenticate')]")
+
+
+def benchmark_read_document_metadata(sizes, search_paths, strategies=METADATA_STRATEGIES,
+                                     repeat=20):
+  """
+  <Purpose>
+    Generate html documents and measure how long it takes to parse them and read their
+    metadata using each of the strategies
+  <Arguments>
+    sizes:
+      A list of numbers of elements of the generated documents
+    search_paths:
+      Number of elements of each document which have the data-search-path attribute
+    strategies:
+      Names of the compared strategies
+    repeat:
+      Number of measurements of each strategy and size
+  <Returns>
+    A list of results, one dictionary per size and strategy
+  """
+  parse = get_hasher('html').parse
+  results = []
+  for size in sorted(sizes):
+    content = generate_document(size, search_paths)
+    expected = _to_comparable(read_document_metadata(parse(content)))
+    for strategy in strategies:
+      read = _STRATEGIES[strategy]
+      if _to_comparable(read(content)) != expected:
+        raise ValueError(f'Strategy {strategy} read different metadata')
+      timings = measure(lambda: read(content), repeat=repeat)
+      result = {
+          'size': size,
+          'strategy': strategy,
+          'min_seconds': round(timings['min'], 6),
+          'median_seconds': round(timings['median'], 6),
+      }
+      logger.info('Read metadata of a document with %s elements using %s in %.6f seconds',
+                  size, strategy, timings['median'])
+      results.append(result)
+  return results
+
+
+def generate_document(size, search_paths):
+  """
+  Generate an html document with about `size` elements, whose authentication div holds
+  almost all of them and `search_paths` of them have the data-search-path attribute
+  """
+  paragraphs = max(1, size // 2)
+  step = max(1, paragraphs // max(1, search_paths))
+  body = ''.join(
+      f'<p class="p{index}"{f" data-search-path=p{index}" if index % step == 0 else ""}>'
+      f'text <b>{index}</b></p>' for index in range(paragraphs))
+  return (f'<html><head><title>Benchmark</title>'
+          f'<meta property="og:url" content="https://example.com/benchmark/doc"></head>'
+          f'<body data-search-path="root"><div class="tuf-authenticate">{body}</div></body>'
+          f'</html>').encode()
+
+
+def _read_using_xpaths(content):
+  return read_document_metadata(get_hasher('html').parse(content))
+
+
+def _read_using_union_xpath(content):
+  return _read_elements(_METADATA_ELEMENTS(get_hasher('html').parse(content)))
+
+
+def _read_using_element_iteration(content):
+  return _read_elements(get_hasher('html').parse(content).iter(etree.Element))
+
+
+def _read_using_iterparse(content):
+  return _read_elements(element for _, element in
+                        etree.iterparse(BytesIO(content), events=('start',), html=True))
+
+
+def _read_elements(elements):
+  auth_div = meta_url = search_path = None
+  for element in elements:
+    attributes = element.attrib
+    search_path = attributes.get('data-search-path', search_path)
+    if auth_div is None and 'tuf-authenticate' in attributes.get('class', ''):
+      auth_div = element
+    if meta_url is None and 'og:url' in attributes.get('property', ''):
+      meta_url = urlparse(attributes.get('content')).path
+  return DocumentMetadata(auth_div, meta_url, search_path)
+
+
+def _to_comparable(metadata):
+  auth_div = et_html.tostring(metadata.auth_div) if metadata.auth_div is not None else None
+  return auth_div, metadata.meta_url, metadata.search_path
+
+
+_STRATEGIES = {
+    METADATA_USING_XPATHS: _read_using_xpaths,
+    METADATA_USING_UNION_XPATH: _read_using_union_xpath,
+    METADATA_USING_ELEMENT_ITERATION: _read_using_element_iteration,
+    METADATA_USING_ITERPARSE: _read_using_iterparse,
+}
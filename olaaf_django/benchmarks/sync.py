@@ -0,0 +1,186 @@
+"""
+Measures throughput of synchronization of hashes (see `olaaf_django.sync_hashes`) on
+synthetic publication repositories with a configurable number of files and commits, churn
+rate and mix of html and pdf files.
+"""
+import datetime
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from git import Repo
+
+from olaaf_django.memory import MB, get_peak_rss
+from olaaf_django.profiling import GIT_DIFF, SyncProfile
+from olaaf_django.sync_hashes import sync_hashes
+
+logger = logging.getLogger(__name__)
+
+REPO_NAME = 'benchmark/html'
+PUBLICATION_DATE = datetime.date(2020, 1, 1)
+# files are spread across directories, like sections of a code
+FILES_PER_DIRECTORY = 100
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed',
+         'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna')
+
+
+def generate_library(library_root, files=1000, commits=10, churn=0.05, pdf_ratio=0.1,
+                     paragraphs=20, seed=0):
+  """
+  <Purpose>
+    Create a synthetic publication repository. The first commit adds all files, each of
+    the following ones modifies `churn` of them and adds and deletes a tenth as many
+  <Arguments>
+    library_root:
+      Path of the library root, in which the repository is created
+    files:
+      Number of files added by the first commit
+    commits:
+      Number of commits of the publication branch
+    churn:
+      Fraction of files modified by each commit after the first one
+    pdf_ratio:
+      Fraction of pdf files, the remaining ones are html files
+    paragraphs:
+      Number of paragraphs of each html document
+    seed:
+      Seed of the random generator, so that the same library can be generated again
+  <Returns>
+    Input data of `sync_hashes`, as a dictionary
+  """
+  rng = random.Random(seed)
+  repo_path = library_root / REPO_NAME
+  repo_path.mkdir(parents=True)
+  repo = Repo.init(str(repo_path))
+  with repo.config_writer() as config:
+    config.set_value('user', 'name', 'benchmark')
+    config.set_value('user', 'email', 'benchmark@localhost')
+  branch = f'publication/{PUBLICATION_DATE.isoformat()}'
+  repo.git.checkout('-q', '-b', branch)
+
+  next_index = 0
+  existing = []
+  commits_data = []
+  for commit_index in range(commits):
+    if commit_index == 0:
+      added, modified, deleted = files, [], []
+    else:
+      changed_number = max(1, int(len(existing) * churn))
+      modified = rng.sample(existing, min(changed_number, len(existing)))
+      added = max(1, changed_number // 10)
+      modified_set = set(modified)
+      deleted = rng.sample([path for path in existing if path not in modified_set],
+                           min(added, len(existing) - len(modified)))
+
+    for _ in range(added):
+      file_type = 'pdf' if rng.random() < pdf_ratio else 'html'
+      path = f'section-{next_index // FILES_PER_DIRECTORY}/doc-{next_index}.{file_type}'
+      next_index += 1
+      existing.append(path)
+      _write_file(repo_path / path, rng, paragraphs)
+    for path in modified:
+      _write_file(repo_path / path, rng, paragraphs)
+    for path in deleted:
+      (repo_path / path).unlink()
+      existing.remove(path)
+
+    codified_date = PUBLICATION_DATE - datetime.timedelta(days=commits - commit_index)
+    repo.git.add('--all')
+    repo.git.commit('-q', '--allow-empty', '-m', codified_date.isoformat())
+    commits_data.append({
+        'commit': repo.head.commit.hexsha,
+        'custom': {'build-date': PUBLICATION_DATE.isoformat(),
+                   'codified-date': codified_date.isoformat()},
+    })
+  logger.info('Generated %s commits of %s files', commits, len(existing))
+  return {REPO_NAME: {branch: commits_data}}
+
+
+def _write_file(path, rng, paragraphs):
+  path.parent.mkdir(parents=True, exist_ok=True)
+  text = [' '.join(rng.choice(WORDS) for _ in range(60)) for _ in range(paragraphs)]
+  if path.suffix == '.pdf':
+    # only bitstream hashes of pdf files are calculated, so their content does not matter
+    path.write_bytes(b'%PDF-1.4\n' + '\n'.join(text).encode())
+    return
+  url = path.with_suffix('').name
+  body = '\n'.join(f'<p>{paragraph}</p>' for paragraph in text)
+  path.write_text(
+      f'<html>\n<head><meta property="og:url" content="https://benchmark.com/{url}" />'
+      f'</head>\n<body data-search-path="{url}">\n'
+      f'<div class="no-authenticate">{url}</div>\n'
+      f'<div class="tuf-authenticate">\n{body}\n</div>\n</body>\n</html>\n')
+
+
+@contextmanager
+def _count_statements():
+  counter = {'statements': 0}
+
+  def _count(execute, sql, params, many, context):
+    counter['statements'] += 1
+    return execute(sql, params, many, context)
+
+  with connection.execute_wrapper(_count):
+    yield counter
+
+
+def benchmark_sync(library_root, repos_data, hashing_workers=1, sync_workers=1):
+  """
+  <Purpose>
+    Sync hashes of a generated library and measure throughput. Must be run against a
+    throwaway database. Statements are only counted on the current thread's connection,
+    so statements of concurrently synced publications are not included
+  <Arguments>
+    library_root:
+      Path of the library root
+    repos_data:
+      Input data of `sync_hashes`, as returned by `generate_library`
+    hashing_workers:
+      Number of worker processes which hash files
+    sync_workers:
+      Number of publications synced concurrently
+  <Returns>
+    A dictionary of results
+  """
+  profile = SyncProfile()
+  with _count_statements() as counter:
+    start_time = time.perf_counter()
+    sync_hashes(library_root, json.dumps(repos_data), hashing_workers=hashing_workers,
+                sync_workers=sync_workers, profile=profile)
+    elapsed_time = time.perf_counter() - start_time
+
+  report = profile.to_dict()
+  files = report['stages'].get(GIT_DIFF, {}).get('count', 0)
+  return {
+      'seconds': round(elapsed_time, 3),
+      'files': files,
+      'files_per_second': round(files / elapsed_time, 1) if elapsed_time else None,
+      'statements': counter['statements'],
+      'statements_per_file': round(counter['statements'] / files, 3) if files else None,
+      # peak of the whole process, including generation of the library
+      'peak_rss_mb': round(get_peak_rss() / MB, 1),
+      'stages': report['stages'],
+  }
+
+
+def compare_with_baseline(result, baseline):
+  """
+  <Purpose>
+    Compare results with results of an earlier run of the same benchmark
+  <Arguments>
+    result:
+      Results returned by `benchmark_sync`
+    baseline:
+      Results of an earlier run
+  <Returns>
+    A dictionary which maps names of compared values to their relative changes, e.g. -0.1
+    if the value decreased by 10%
+  """
+  changes = {}
+  for key in ('seconds', 'files_per_second', 'statements', 'peak_rss_mb'):
+    if result.get(key) is not None and baseline.get(key):
+      changes[key] = round((result[key] - baseline[key]) / baseline[key], 3)
+  return changes
@@ -0,0 +1,114 @@
+import logging
+import subprocess
+
+from git import Git
+
+logger = logging.getLogger(__name__)
+
+# default size of chunks in which large objects are read, in bytes
+CHUNK_SIZE = 64 * 1024
+
+
+class GitBlobReader:
+  """
+  Reads content of git objects through a single long-lived `git cat-file --batch` process.
+  Objects are identified by their object ids (e.g. blob shas listed by `git diff --raw`), so
+  there is no need to start a new process for every file that is read.
+
+  The reader is not thread safe. Use one reader per thread or process.
+  """
+
+  def __init__(self, git_dir):
+    self.git_dir = str(git_dir)
+    self._process = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _start(self):
+    logger.debug('Starting git cat-file --batch process for %s', self.git_dir)
+    self._process = subprocess.Popen(
+        [Git.GIT_PYTHON_GIT_EXECUTABLE, '--git-dir', self.git_dir, 'cat-file', '--batch'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+  def read(self, oid):
+    """
+    <Purpose>
+      Read raw content of the object with the given id
+    <Arguments>
+      oid:
+        Full object id (sha) of a git object, usually a blob
+    <Returns>
+      Object's content as bytes
+    """
+    size = self._request(oid)
+    content = self._process.stdout.read(size)
+    # content is followed by a line feed
+    self._process.stdout.read(1)
+    return content
+
+  def iter_chunks(self, oid, chunk_size=CHUNK_SIZE):
+    """
+    <Purpose>
+      Read raw content of the object with the given id in chunks, so that large objects
+      are not held in memory. The object has to be read before the next one is requested.
+      If the generator is closed early, the rest of the object's content is skipped
+    <Arguments>
+      oid:
+        Full object id (sha) of a git object, usually a blob
+      chunk_size:
+        Maximum size of a chunk, in bytes
+    <Returns>
+      A generator of chunks of the object's content
+    """
+    size = self._request(oid)
+    stdout = self._process.stdout
+    remaining = size
+    try:
+      while remaining:
+        chunk = stdout.read(min(chunk_size, remaining))
+        if not chunk:
+          self.close()
+          raise ValueError(f'git cat-file exited while reading object {oid}')
+        remaining -= len(chunk)
+        yield chunk
+    finally:
+      if self._process is not None:
+        while remaining:
+          remaining -= len(stdout.read(min(chunk_size, remaining)))
+        # content is followed by a line feed
+        stdout.read(1)
+
+  def _request(self, oid):
+    """Request the object with the given id and return its size"""
+    if self._process is None or self._process.poll() is not None:
+      self._start()
+
+    stdin, stdout = self._process.stdin, self._process.stdout
+    stdin.write(oid.encode('ascii') + b'\n')
+    stdin.flush()
+
+    # header is in the form of "<oid> <type> <size>" or "<object> missing"
+    header = stdout.readline()
+    if not header:
+      self.close()
+      raise ValueError(f'git cat-file exited while reading object {oid}')
+    header_parts = header.split()
+    if len(header_parts) != 3:
+      raise ValueError(f'Object {oid} does not exist in {self.git_dir}')
+    return int(header_parts[2])
+
+  def close(self):
+    if self._process is None:
+      return
+    try:
+      self._process.stdin.close()
+      self._process.wait()
+    except Exception:
+      self._process.kill()
+    finally:
+      self._process.stdout.close()
+      self._process = None
@@ -0,0 +1,71 @@
+import logging
+import subprocess
+import tempfile
+
+from git import Git, GitCommandError
+
+logger = logging.getLogger(__name__)
+
+# number of bytes read from git's output at once
+READ_SIZE = 64 * 1024
+
+
+def iter_diff_entries(git_dir, prev_commit_sha, current_commit_sha):
+  """
+  <Purpose>
+    List files which were added, modified or deleted between two commits, together with
+    ids of the blobs which hold their content at `current_commit_sha`. Output of
+    `git diff --raw -z` is parsed while git is still producing it, so entries can be
+    processed before the whole diff is listed and the listing is never held in memory.
+    Paths are NUL terminated and are not quoted, so they can contain any character.
+  <Arguments>
+    git_dir:
+      Path of the repository's git directory
+    prev_commit_sha:
+      SHA of the previous commit, or empty tree sha
+    current_commit_sha:
+      SHA of the current commit
+  <Returns>
+    A generator of (action, file path, blob id) tuples. Action is one of A/M/D
+  """
+  command = [Git.GIT_PYTHON_GIT_EXECUTABLE, '--git-dir', str(git_dir), 'diff', '--raw', '-z',
+             '--no-renames', '--no-abbrev', prev_commit_sha, current_commit_sha]
+  # stderr is written to a file, since git would block once it fills a pipe which is only
+  # read after the whole diff is listed, e.g. by warnings
+  with tempfile.TemporaryFile() as stderr:
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+    try:
+      # each entry consists of two fields:
+      # :old_mode new_mode old_blob new_blob M/A/D and the file path
+      info = None
+      for field in _iter_nul_terminated(process.stdout):
+        if info is None:
+          info = field
+          continue
+        _, _, _, blob_oid, action = info.decode('ascii').split()
+        yield action, field.decode('utf-8', 'surrogateescape'), blob_oid
+        info = None
+
+      if process.wait() != 0:
+        stderr.seek(0)
+        raise GitCommandError(command, process.returncode, stderr.read())
+    finally:
+      # the generator might not be consumed until the end, e.g. if processing of
+      # one of the entries failed
+      if process.poll() is None:
+        process.kill()
+        process.wait()
+      process.stdout.close()
+
+
+def _iter_nul_terminated(stream):
+  remainder = b''
+  while True:
+    chunk = stream.read1(READ_SIZE)
+    if not chunk:
+      break
+    fields = (remainder + chunk).split(b'\0')
+    remainder = fields.pop()
+    yield from fields
+  if remainder:
+    yield remainder
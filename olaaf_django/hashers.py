@@ -0,0 +1,91 @@
+"""
+Registry of hashers of the supported file types, keyed by file type (file extension) and by
+content type. Hashers of binary files (e.g. pdfs) calculate hashes of streams of chunks, so
+that files of any size are hashed using constant memory. Hashers of html documents need the
+whole content and a parsed document, from which the authentication div is read.
+
+Hashers must be registered when this module is imported, or when a module imported by the
+hashing worker processes is imported, so that the same hashers are registered in all
+processes. This module must not depend on Django, since it is imported by the worker
+processes.
+"""
+from lxml import html as et_html
+
+from olaaf_django.utils import hasher
+
+
+class FileHasher:
+  """Calculates hashes of files of one type"""
+  # True if a parsed document is needed to calculate the hashes, False if the bitstream
+  # hash can be calculated from a stream of chunks
+  needs_document = False
+
+  def __init__(self, file_type, content_type):
+    self.file_type = file_type
+    self.content_type = content_type
+
+  def new(self):
+    """Return a new incremental hash object"""
+    return hasher()
+
+
+class StreamingHasher(FileHasher):
+  """Calculates bitstream hashes of binary files, chunk by chunk"""
+
+  def hash_chunks(self, chunks):
+    """
+    <Purpose>
+      Calculate hash of content given as chunks
+    <Arguments>
+      chunks:
+        An iterable of bytes, e.g. chunks of an uploaded file
+    <Returns>
+      Hex digest of the content's hash
+    """
+    digest = self.new()
+    for chunk in chunks:
+      digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentHasher(FileHasher):
+  """
+  Calculates bitstream and rendered hashes of documents, which are read whole and parsed
+  using the given function
+  """
+  needs_document = True
+
+  def __init__(self, file_type, content_type, parse):
+    super().__init__(file_type, content_type)
+    self.parse = parse
+
+
+_hashers = {}
+
+
+def register_hasher(file_hasher):
+  """Register a hasher under its file type and content type, replacing previous ones"""
+  _hashers[file_hasher.file_type] = file_hasher
+  _hashers[file_hasher.content_type] = file_hasher
+
+
+def get_hasher(file_type):
+  """
+  <Purpose>
+    Find the hasher of the given file type
+  <Arguments>
+    file_type:
+      File extension without the leading dot, or content type
+  <Returns>
+    The registered hasher, or None if the file type is not supported
+  """
+  return _hashers.get(file_type)
+
+
+def supported_types():
+  """Return file extensions of all supported file types"""
+  return sorted({file_hasher.file_type for file_hasher in _hashers.values()})
+
+
+register_hasher(DocumentHasher('html', 'text/html', et_html.fromstring))
+register_hasher(StreamingHasher('pdf', 'application/pdf'))
@@ -0,0 +1,314 @@
+"""
+Hashing stage of the synchronization of hashes. Reads content of changed files, parses html
+documents and calculates their hashes, either in the current process or in a pool of worker
+processes. This module must not depend on Django models, since it is imported by the
+worker processes.
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from urllib.parse import urlparse
+
+from lxml import etree
+from lxml import html as et_html
+
+from olaaf_django import profiling
+from olaaf_django.git_blobs import GitBlobReader
+from olaaf_django.hashers import get_hasher
+from olaaf_django.utils import calc_hash, get_auth_div_content, hasher, strip_content
+
+logger = logging.getLogger(__name__)
+
+# maximum number of files sent to a worker process at once
+MAX_CHUNK_SIZE = 64
+
+HASH_ALGORITHM = hasher().name
+# Version of the rules used to calculate hashes and read metadata of a file (stripping of
+# content, serialization of the authentication div, reading of url and search path).
+# Must be increased whenever these rules change, so that memoized hashes are not reused
+CANONICALIZATION_VERSION = 1
+
+# Result of hashing of one file. Values are sent from worker processes to the parent,
+# so they should be kept compact. `meta_url` is the url read from the og:url property,
+# None if the document does not have it
+FileHashes = namedtuple('FileHashes', ['path', 'bitstream', 'rendered', 'meta_url',
+                                       'search_path'])
+
+# Elements of an html document read while it is being hashed. `auth_div` is the first element
+# with the tuf-authenticate class, `meta_url` the path of the url of the first element with
+# the og:url property and `search_path` the last data-search-path attribute. Each of them is
+# None if the document does not contain it
+DocumentMetadata = namedtuple('DocumentMetadata', ['auth_div', 'meta_url', 'search_path'])
+
+# Expressions are compiled once instead of being parsed for every document. A positional
+# predicate makes libxml2 stop walking the document at the first matching element. Reading
+# all of the metadata in a single pass (a union XPath, iteration over elements or iterparse)
+# was 1.6-2 times slower including parsing, as measured by the benchmetadata command
+_META_URL_ELEMENT = etree.XPath("descendant::*[contains(@property, 'og:url')][1]")
+_SEARCH_PATHS = etree.XPath("descendant-or-self::*/@data-search-path")
+
+
+class HashingStage:
+  """
+  Calculates hashes of changed files. If the number of workers is greater than 1,
+  files are read and hashed by a pool of worker processes, each of which keeps its own
+  `GitBlobReader` per repository. Otherwise, files are hashed in the current process.
+  """
+
+  def __init__(self, workers=1):
+    self.workers = workers
+    self._executor = None
+    if workers > 1:
+      logger.info('Hashing files using %s worker processes', workers)
+      self._executor = ProcessPoolExecutor(max_workers=workers)
+      # Start the worker processes right away, from the current thread. When processes are
+      # forked, they are all started on first submit, which could otherwise happen from one
+      # of the sync threads
+      self._executor.submit(int).result()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def hash_files(self, blob_reader, files):
+    """
+    <Purpose>
+      Calculate hashes of the given files
+    <Arguments>
+      blob_reader:
+        `GitBlobReader` of the repository which contains the files
+      files:
+        A list of (filesystem path, blob id, file type) tuples
+    <Returns>
+      Iterator of `FileHashes`, in the same order as the input files
+    """
+    if self._executor is None:
+      return (hash_file(blob_reader, *file_info) for file_info in files)
+
+    paths, blob_oids, file_types = zip(*files) if files else ((), (), ())
+    chunk_size = min(MAX_CHUNK_SIZE, max(1, len(files) // (self.workers * 4)))
+    results = self._executor.map(_hash_file_in_worker, repeat(blob_reader.git_dir), paths,
+                                 blob_oids, file_types, chunksize=chunk_size)
+    return _record_worker_stages(results)
+
+  def close(self):
+    if self._executor is not None:
+      self._executor.shutdown()
+      self._executor = None
+
+
+def hash_file(blob_reader, path, blob_oid, file_type):
+  """
+  <Purpose>
+    Read a file and calculate its hashes. If the file is an html file, also read its
+    url and search path. Files which do not need to be parsed are hashed while they are
+    being read, without holding their whole content in memory
+  <Arguments>
+    blob_reader:
+      `GitBlobReader` of the repository which contains the file
+    path:
+      Filesystem path of the file in Unix style, relative to the root of the repository
+    blob_oid:
+      Id of the blob which holds the file's content
+    file_type:
+      File's type
+  <Returns>
+    `FileHashes` of the file
+  """
+  file_hasher = get_hasher(file_type)
+  if not file_hasher.needs_document:
+    return FileHashes(path, hash_blob_stream(file_hasher, blob_reader, blob_oid), None, None,
+                      None)
+
+  file_content, doc = get_file_content_and_document(blob_reader, blob_oid, file_type)
+  metadata = None
+  if doc is not None:
+    with profiling.stage(profiling.METADATA_READ):
+      metadata = read_document_metadata(doc)
+    if metadata.search_path is None and logger.isEnabledFor(logging.DEBUG):
+      doc_title = doc.xpath('//title/text()')
+      logger.debug('Document with title %s does not contain data-search-path!\n', doc_title)
+  bitstream_hash, rendered_hash = calculate_file_hashes(file_content, metadata, file_type)
+
+  if metadata is None:
+    return FileHashes(path, bitstream_hash, rendered_hash, None, None)
+  return FileHashes(path, bitstream_hash, rendered_hash, metadata.meta_url, metadata.search_path)
+
+
+def calculate_file_hashes(file_content, metadata, file_type):
+  """
+  <Purpose>
+    Calculate bitstream and rendered hash of a file
+  <Arguments>
+    file_content:
+      Full content of the file
+    metadata:
+      `DocumentMetadata` of the file (if the file is an html file)
+  <Returns>
+    bitstream hash value, rendered hash value or None if the file does not have
+    an authentication div
+  """
+  # calculate bitstream hash
+  with profiling.stage(profiling.SHA256):
+    bitstream_hash = calc_hash(file_content, file_type)
+
+  rendered_hash = None
+  if metadata is not None:
+    # this is an html file, calculate its rendered hash
+    with profiling.stage(profiling.AUTH_DIV_SERIALIZE):
+      auth_div_content = et_html.tostring(metadata.auth_div, encoding="utf-8") \
+          if metadata.auth_div is not None else None
+    if auth_div_content is not None:
+      with profiling.stage(profiling.SHA256):
+        rendered_hash = calc_hash(auth_div_content, file_type)
+
+  return bitstream_hash, rendered_hash
+
+
+def hash_blob_stream(file_hasher, blob_reader, blob_oid):
+  """
+  <Purpose>
+    Calculate bitstream hash of a blob chunk by chunk, while it is being read
+  <Arguments>
+    file_hasher:
+      `StreamingHasher` of the file's type
+    blob_reader:
+      `GitBlobReader` of the repository which contains the blob
+    blob_oid:
+      Id of the blob which holds the file's content
+  <Returns>
+    Bitstream hash value
+  """
+  digest = file_hasher.new()
+  read_seconds = hash_seconds = 0
+  chunks = blob_reader.iter_chunks(blob_oid)
+  while True:
+    start_time = time.perf_counter()
+    chunk = next(chunks, None)
+    read_time = time.perf_counter()
+    read_seconds += read_time - start_time
+    if chunk is None:
+      break
+    digest.update(chunk)
+    hash_seconds += time.perf_counter() - read_time
+  profiling.record(profiling.BLOB_READ, read_seconds)
+  profiling.record(profiling.SHA256, hash_seconds)
+  return digest.hexdigest()
+
+
+def get_file_content_and_document(blob_reader, blob_oid, file_type):
+  """
+  <Purpose>
+    Read content of a file given id of its blob. If that file is an html file,
+    also return lxml document object corresponding to that file
+  <Arguments>
+    blob_reader:
+      `GitBlobReader` of the repository which contains the blob
+    blob_oid:
+      Id of the blob which holds the file's content at the wanted revision
+    file_type:
+      File's type
+    <Returns>
+      (file content, lxml document)
+  """
+  doc = None
+  with profiling.stage(profiling.BLOB_READ):
+    file_content = blob_reader.read(blob_oid)
+
+  file_hasher = get_hasher(file_type)
+  if file_hasher is not None and file_hasher.needs_document:
+    # strip the content the same way as it used to be stripped when read using git show
+    file_content = strip_content(file_content)
+    # If the file is an html file, get the document object so that it's possible to find
+    # elements such as authentication div, search path and url
+    with profiling.stage(profiling.HTML_PARSE):
+      doc = file_hasher.parse(file_content)
+
+  return file_content, doc
+
+
+def calculate_html_url(path):
+  """
+  <Purpose>
+    Calculate URL of an html file which does not have a org:url property based on its
+    filesystem path.
+  <Arguments>
+    path:
+      filesystem path of an html file
+  <Returns>
+    Calculated URL
+  """
+  if 'index.html' in path:
+    url = path.split('index.html')[0]
+    if url:
+      return url.rsplit('/', 1)[0]
+  return path.rsplit('.', 1)[0]
+
+
+def read_document_metadata(doc):
+  """
+  <Purpose>
+    Find the authentication div, url and search path of an html document
+  <Arguments>
+    doc:
+      lxml document object
+  <Returns>
+    `DocumentMetadata` of the document
+  """
+  meta_url = None
+  meta_url_elements = _META_URL_ELEMENT(doc)
+  if meta_url_elements:
+    meta_url = urlparse(meta_url_elements[0].get('content')).path
+  search_paths = _SEARCH_PATHS(doc)
+  return DocumentMetadata(get_auth_div_content(doc), meta_url,
+                          search_paths[-1] if search_paths else None)
+
+
+def get_url(path, file_type, meta_url=None):
+  """
+  <Purpose>
+    Get URL of the given document. If the document is an html document, use URL
+    read from its og:url property. If there is no such property or if the document
+    if of a different type, calculate its URL based on its filesystem path.
+  <Arguments>
+    path:
+      Filesystem path of the file
+    file_type:
+      File's type
+    meta_url:
+      URL read from the document's og:url property, None if there is no such property
+  <Returns>
+    URL of the file with the given filesystem path
+  """
+  url = '/' + path
+  if file_type != 'html':
+    return url
+  if meta_url is not None:
+    return meta_url
+  return calculate_html_url(url)
+
+
+# blob readers of a worker process, by git directory
+# git cat-file processes exit once the worker process exits and their stdin is closed
+_worker_blob_readers = {}
+
+
+def _hash_file_in_worker(git_dir, path, blob_oid, file_type):
+  blob_reader = _worker_blob_readers.get(git_dir)
+  if blob_reader is None:
+    blob_reader = _worker_blob_readers[git_dir] = GitBlobReader(git_dir)
+  # stages are sent to the parent, which records them into the commit being hashed
+  with profiling.collecting() as stage_times:
+    file_hashes = hash_file(blob_reader, path, blob_oid, file_type)
+  return file_hashes, stage_times.to_tuple()
+
+
+def _record_worker_stages(results):
+  # stages are recorded by the thread which consumes the results
+  for file_hashes, stages in results:
+    profiling.record_all(stages)
+    yield file_hashes
@@ -0,0 +1,136 @@
+"""
+Bookkeeping of validity intervals of hashes. A hash is valid from its start commit until
+its end commit. Hashes of files which exist at the latest synced commit of a publication
+do not have an end commit yet, i.e. their intervals are open.
+"""
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+
+from olaaf_django.models import Hash
+
+logger = logging.getLogger(__name__)
+
+OpenHash = namedtuple('OpenHash', ['id', 'value', 'path_id'])
+
+# strategies of closing of hash intervals
+# UPDATE ... WHERE id IN (...), in batches
+CLOSE_USING_IN = 'in'
+# ids are inserted into a temporary table, which is then used by one UPDATE statement
+CLOSE_USING_TEMP_TABLE = 'temp_table'
+# Django's bulk_update, which generates CASE WHEN id=... statements. Only kept for comparison
+CLOSE_USING_BULK_UPDATE = 'bulk_update'
+CLOSE_STRATEGIES = (CLOSE_USING_IN, CLOSE_USING_TEMP_TABLE, CLOSE_USING_BULK_UPDATE)
+
+MAX_IDS_PER_QUERY = 500
+# if more hashes are closed at once, their ids are inserted into a temporary table, unless set
+# by the CLOSE_INTERVALS_TEMP_TABLE_THRESHOLD setting. Measured by benchintervals on SQLite
+# 3.40, where a temporary table was faster than IN (...) for all sizes from 10 to 20000 hashes
+TEMP_TABLE_THRESHOLD = 10
+TEMP_TABLE_NAME = 'olaaf_closed_hashes'
+
+
+class OpenHashIndex:
+  """
+  In-memory index of open hashes of one publication, by (filesystem path, hash type).
+  It is loaded once, when syncing of the publication starts, and kept up to date as
+  commits are applied, so that hashes of modified and deleted files can be found
+  without querying the database.
+  """
+
+  def __init__(self, publication, open_hashes=None):
+    self.publication = publication
+    self._open_hashes = open_hashes if open_hashes is not None else {}
+
+  @classmethod
+  def load(cls, publication):
+    open_hashes = {}
+    hashes = (
+        Hash.objects
+        .filter(path__publication=publication, end_commit__isnull=True)
+        .values_list('id', 'path__filesystem', 'hash_type', 'value', 'path_id')
+        .iterator()
+    )
+    for hash_id, filesystem, hash_type, value, path_id in hashes:
+      open_hashes[(filesystem, hash_type)] = OpenHash(hash_id, value, path_id)
+    logger.debug('Loaded %s open hashes of publication %s', len(open_hashes), publication.name)
+    return cls(publication, open_hashes)
+
+  def __len__(self):
+    return len(self._open_hashes)
+
+  def get(self, filesystem, hash_type):
+    return self._open_hashes.get((filesystem, hash_type))
+
+  def add(self, filesystem, hash_type, hash_id, value, path_id):
+    self._open_hashes[(filesystem, hash_type)] = OpenHash(hash_id, value, path_id)
+
+  def remove(self, filesystem, hash_type):
+    self._open_hashes.pop((filesystem, hash_type), None)
+
+
+def close_hash_intervals(hash_ids, end_commit, strategy=None):
+  """
+  <Purpose>
+    Set end commit of the hashes with the given ids and the date until which they are
+    valid. All hashes get the same end commit, so there is no need for per-row values.
+  <Arguments>
+    hash_ids:
+      A list of ids of hashes which are no longer valid
+    end_commit:
+      Commit at which the hashes stopped being valid
+    strategy:
+      One of `CLOSE_STRATEGIES`. If not specified, `CLOSE_USING_TEMP_TABLE` is used if
+      there are more than `CLOSE_INTERVALS_TEMP_TABLE_THRESHOLD` (by default
+      `TEMP_TABLE_THRESHOLD`) hashes, `CLOSE_USING_IN` otherwise
+  <Returns>
+    Number of updated hashes
+  """
+  if not hash_ids:
+    return 0
+  if strategy is None:
+    threshold = getattr(settings, 'CLOSE_INTERVALS_TEMP_TABLE_THRESHOLD', TEMP_TABLE_THRESHOLD)
+    strategy = CLOSE_USING_TEMP_TABLE if len(hash_ids) > threshold else CLOSE_USING_IN
+
+  if strategy == CLOSE_USING_IN:
+    updated = 0
+    for index in range(0, len(hash_ids), MAX_IDS_PER_QUERY):
+      updated += Hash.objects.filter(id__in=hash_ids[index:index + MAX_IDS_PER_QUERY]) \
+          .update(end_commit=end_commit, valid_to=end_commit.date)
+    return updated
+  if strategy == CLOSE_USING_TEMP_TABLE:
+    return _close_hash_intervals_using_temp_table(hash_ids, end_commit)
+  if strategy == CLOSE_USING_BULK_UPDATE:
+    Hash.objects.bulk_update([Hash(id=hash_id, end_commit=end_commit, valid_to=end_commit.date)
+                              for hash_id in hash_ids],
+                             ['end_commit', 'valid_to'], batch_size=2000)
+    return len(hash_ids)
+  raise ValueError(f'Unknown strategy {strategy}')
+
+
+def _close_hash_intervals_using_temp_table(hash_ids, end_commit):
+  # temporary tables are only visible to the current connection and creation of the table is
+  # rolled back together with the rest of the transaction in case of an error
+  hash_table = connection.ops.quote_name(Hash._meta.db_table)
+  temp_table = connection.ops.quote_name(TEMP_TABLE_NAME)
+  with connection.cursor() as cursor:
+    cursor.execute(f'CREATE TEMPORARY TABLE {temp_table} (id integer PRIMARY KEY)')
+    try:
+      for index in range(0, len(hash_ids), MAX_IDS_PER_QUERY):
+        cursor.executemany(f'INSERT INTO {temp_table} (id) VALUES (%s)',
+                           [(hash_id,) for hash_id in hash_ids[index:index + MAX_IDS_PER_QUERY]])
+      cursor.execute(f'UPDATE {hash_table} SET end_commit_id = %s, valid_to = %s '
+                     f'WHERE id IN (SELECT id FROM {temp_table})',
+                     [end_commit.id, end_commit.date])
+      updated = cursor.rowcount
+    except Exception:
+      # PostgreSQL rejects further statements of a transaction once one of them failed, so
+      # the table is only dropped here in autocommit mode. Otherwise, it is dropped once the
+      # transaction is rolled back
+      if not connection.in_atomic_block:
+        cursor.execute(f'DROP TABLE {temp_table}')
+      raise
+    cursor.execute(f'DROP TABLE {temp_table}')
+    return updated
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from olaaf_django.benchmarks.authentication import SERVERS, build_requests, run_load
+
+
+class Command(BaseCommand):
+  help = """Replay mixed traffic against the authentication endpoints and report throughput
+and latency percentiles. The dataset must first be generated using genauthdata"""
+
+  def add_arguments(self, parser):
+    parser.add_argument("--requests", type=int, default=1000, help="Number of measured requests")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of threads which send requests")
+    parser.add_argument("--check-hashes-ratio", type=float, default=0.5,
+                        help="Fraction of requests which check hashes of files, the remaining "
+                        "ones submit documents to be authenticated")
+    parser.add_argument("--authentic-ratio", type=float, default=0.8,
+                        help="Fraction of submitted documents and checked hashes which are "
+                        "authentic")
+    parser.add_argument("--batch-size", type=int, default=10,
+                        help="Number of hashes checked by one request")
+    parser.add_argument("--server", choices=SERVERS, default="client",
+                        help="Send requests through the Django test client or over HTTP to a "
+                        "local threaded WSGI server")
+    parser.add_argument("--warmup", type=int, default=10,
+                        help="Number of requests sent before the measurement starts")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("--output", type=str, help="Path of a json file where results are saved")
+
+  def handle(self, *args, **kwargs):
+    if kwargs["requests"] <= 0 or kwargs["concurrency"] <= 0 or kwargs["batch_size"] <= 0:
+      raise CommandError("Numbers of requests, threads and checked hashes must be positive")
+    if not 0 <= kwargs["check_hashes_ratio"] <= 1 or not 0 <= kwargs["authentic_ratio"] <= 1:
+      raise CommandError("Ratios must be between 0 and 1")
+
+    parameters = {name: kwargs[name] for name in ("requests", "concurrency",
+                                                  "check_hashes_ratio", "authentic_ratio",
+                                                  "batch_size", "server", "seed")}
+    try:
+      requests = build_requests(kwargs["requests"] + kwargs["warmup"],
+                                kwargs["check_hashes_ratio"], kwargs["authentic_ratio"],
+                                kwargs["batch_size"], kwargs["seed"])
+    except ValueError as e:
+      raise CommandError(str(e))
+    result = run_load(requests, kwargs["concurrency"], kwargs["server"], kwargs["warmup"])
+
+    self.stdout.write("{vendor:<10} {requests:>8} requests {seconds:>9.3f}s "
+                      "{requests_per_second:>10} requests/s {errors:>6} errors"
+                      .format(vendor=connection.vendor, **result))
+    for endpoint, summary in result["endpoints"].items():
+      self.stdout.write("{endpoint:<14} {count:>8} p50 {p50_ms:>9.3f}ms p95 {p95_ms:>9.3f}ms "
+                        "p99 {p99_ms:>9.3f}ms max {max_ms:>9.3f}ms"
+                        .format(endpoint=endpoint, **summary))
+    if kwargs["output"]:
+      with open(kwargs["output"], "w") as f:
+        json.dump({"vendor": connection.vendor, "parameters": parameters, "results": result},
+                  f, indent=2)
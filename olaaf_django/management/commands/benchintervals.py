@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from olaaf_django.benchmarks import benchmark_database
+from olaaf_django.benchmarks.intervals import benchmark_close_hash_intervals
+from olaaf_django.intervals import CLOSE_STRATEGIES
+
+
+class Command(BaseCommand):
+  help = """Compare strategies of closing of hash intervals (setting of end commit of
+superseded hashes) on a throwaway test database of the configured database engine"""
+
+  def add_arguments(self, parser):
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="Numbers of hashes which are closed at once")
+    parser.add_argument("--strategies", nargs="+", choices=CLOSE_STRATEGIES,
+                        default=list(CLOSE_STRATEGIES), help="Compared strategies")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of measurements of each strategy and size")
+    parser.add_argument("--output", type=str, help="Path of a json file where results are saved")
+
+  def handle(self, *args, **kwargs):
+    if any(size <= 0 for size in kwargs["sizes"]):
+      raise CommandError("Sizes must be positive numbers")
+    with benchmark_database(verbosity=kwargs["verbosity"]) as connection:
+      results = benchmark_close_hash_intervals(kwargs["sizes"], kwargs["strategies"],
+                                               kwargs["repeat"])
+      vendor = connection.vendor
+
+    for result in results:
+      self.stdout.write("{vendor:<10} {size:>8} {strategy:<12} {median_seconds:>9.4f}s "
+                        "{hashes_per_second:>10} hashes/s".format(vendor=vendor, **result))
+    if kwargs["output"]:
+      with open(kwargs["output"], "w") as f:
+        json.dump({"vendor": vendor, "results": results}, f, indent=2)
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from olaaf_django.benchmarks.metadata import (METADATA_STRATEGIES,
+                                              benchmark_read_document_metadata)
+
+
+class Command(BaseCommand):
+  help = """Compare ways of reading the authentication div, url and search path of generated
+html documents, including parsing of the documents"""
+
+  def add_arguments(self, parser):
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 15000],
+                        help="Numbers of elements of the generated documents")
+    parser.add_argument("--search-paths", type=int, default=10,
+                        help="Number of elements of each document with a search path")
+    parser.add_argument("--strategies", nargs="+", choices=METADATA_STRATEGIES,
+                        default=list(METADATA_STRATEGIES), help="Compared strategies")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Number of measurements of each strategy and size")
+    parser.add_argument("--output", type=str, help="Path of a json file where results are saved")
+
+  def handle(self, *args, **kwargs):
+    if any(size <= 0 for size in kwargs["sizes"]):
+      raise CommandError("Sizes must be positive numbers")
+    results = benchmark_read_document_metadata(kwargs["sizes"], kwargs["search_paths"],
+                                               kwargs["strategies"], kwargs["repeat"])
+
+    for result in results:
+      self.stdout.write("{size:>8} {strategy:<18} {median_seconds:>10.6f}s".format(**result))
+    if kwargs["output"]:
+      with open(kwargs["output"], "w") as f:
+        json.dump({"results": results}, f, indent=2)
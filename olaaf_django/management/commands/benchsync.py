@@ -0,0 +1,88 @@
+import json
+import pathlib
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from olaaf_django.benchmarks import benchmark_database
+from olaaf_django.benchmarks.sync import benchmark_sync, compare_with_baseline, generate_library
+
+
+class Command(BaseCommand):
+  help = """Measure throughput of syncing of hashes of a synthetic publication repository
+on a throwaway test database of the configured database engine"""
+
+  def add_arguments(self, parser):
+    parser.add_argument("--files", type=int, default=1000,
+                        help="Number of files added by the first commit")
+    parser.add_argument("--commits", type=int, default=10,
+                        help="Number of commits of the publication")
+    parser.add_argument("--churn", type=float, default=0.05,
+                        help="Fraction of files modified by each commit after the first one")
+    parser.add_argument("--pdf-ratio", type=float, default=0.1,
+                        help="Fraction of pdf files, the remaining ones are html files")
+    parser.add_argument("--paragraphs", type=int, default=20,
+                        help="Number of paragraphs of each html document")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("--hashing-workers", type=int, default=1,
+                        help="Number of worker processes which read and hash changed files")
+    parser.add_argument("--library-root", type=str,
+                        help="Directory in which the library is generated. A temporary "
+                        "directory is used and removed afterwards by default")
+    parser.add_argument("--output", type=str, help="Path of a json file where results are saved")
+    parser.add_argument("--baseline", type=str,
+                        help="Path of a json file with results of an earlier run to compare to")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Fail if files per second decreased by more than this fraction "
+                        "compared to the baseline")
+
+  def handle(self, *args, **kwargs):
+    if kwargs["files"] <= 0 or kwargs["commits"] <= 0:
+      raise CommandError("Numbers of files and commits must be positive")
+    if not 0 <= kwargs["churn"] <= 1 or not 0 <= kwargs["pdf_ratio"] <= 1:
+      raise CommandError("Churn and pdf ratio must be between 0 and 1")
+
+    parameters = {name: kwargs[name] for name in ("files", "commits", "churn", "pdf_ratio",
+                                                  "paragraphs", "seed", "hashing_workers")}
+    if kwargs["library_root"]:
+      library_root = pathlib.Path(kwargs["library_root"])
+      if library_root.exists() and any(library_root.iterdir()):
+        raise CommandError(f"Library root {library_root} is not empty")
+      temp_dir = None
+    else:
+      temp_dir = tempfile.mkdtemp(prefix="olaaf-benchmark-")
+      library_root = pathlib.Path(temp_dir)
+
+    try:
+      repos_data = generate_library(library_root, kwargs["files"], kwargs["commits"],
+                                    kwargs["churn"], kwargs["pdf_ratio"], kwargs["paragraphs"],
+                                    kwargs["seed"])
+      with benchmark_database(verbosity=kwargs["verbosity"]) as connection:
+        result = benchmark_sync(library_root, repos_data,
+                                hashing_workers=kwargs["hashing_workers"])
+        vendor = connection.vendor
+    finally:
+      if temp_dir is not None:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    self.stdout.write("{vendor:<10} {files:>8} files {seconds:>9.3f}s {files_per_second:>10} "
+                      "files/s {statements:>8} statements {peak_rss_mb:>8} MB peak RSS"
+                      .format(vendor=vendor, **result))
+    results = {"vendor": vendor, "parameters": parameters, "results": result}
+    if kwargs["output"]:
+      with open(kwargs["output"], "w") as f:
+        json.dump(results, f, indent=2)
+
+    if kwargs["baseline"]:
+      with open(kwargs["baseline"]) as f:
+        baseline = json.load(f)
+      if baseline.get("parameters") != parameters or baseline.get("vendor") != vendor:
+        self.stderr.write("Baseline was measured with different parameters or database")
+      changes = compare_with_baseline(result, baseline["results"])
+      for key, change in changes.items():
+        self.stdout.write(f"{key:<18} {change:+.1%}")
+      max_regression = kwargs["max_regression"]
+      if max_regression is not None and changes.get("files_per_second", 0) < -max_regression:
+        raise CommandError("Files per second decreased by {:.1%} compared to the baseline"
+                           .format(-changes["files_per_second"]))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from olaaf_django.benchmarks.authentication import generate_dataset
+
+
+class Command(BaseCommand):
+  help = """Generate synthetic publications with millions of hashes into the configured
+database, against which the authentication endpoints can be load tested using benchauth.
+A dedicated database should be configured"""
+
+  def add_arguments(self, parser):
+    parser.add_argument("--publications", type=int, default=100, help="Number of publications")
+    parser.add_argument("--paths", type=int, default=1000,
+                        help="Number of paths of each publication")
+    parser.add_argument("--versions", type=int, default=5,
+                        help="Number of commits of each publication. Each path has a bitstream "
+                        "and a rendered hash per commit")
+    parser.add_argument("--documents", type=int, default=100,
+                        help="Number of paths of each publication whose hashes are calculated "
+                        "from generated documents, which can be submitted for authentication")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated documents")
+
+  def handle(self, *args, **kwargs):
+    if min(kwargs["publications"], kwargs["paths"], kwargs["versions"]) <= 0:
+      raise CommandError("Numbers of publications, paths and versions must be positive")
+    if not 0 <= kwargs["documents"] <= kwargs["paths"]:
+      raise CommandError("Number of documents must be between 0 and the number of paths")
+
+    start_time = time.perf_counter()
+    try:
+      created = generate_dataset(kwargs["publications"], kwargs["paths"], kwargs["versions"],
+                                 kwargs["documents"], kwargs["seed"])
+    except ValueError as e:
+      raise CommandError(str(e))
+    elapsed_time = time.perf_counter() - start_time
+    self.stdout.write(f"Created {created} hashes in {elapsed_time:.1f}s "
+                      f"({created / elapsed_time:.0f} hashes/s)")
@@ -1,5 +1,12 @@
-from django.core.management.base import BaseCommand
+import cProfile
+import tracemalloc
 
+from django.core.management.base import BaseCommand, CommandError
+
+from olaaf_django.memory import MB
+from olaaf_django.metrics import registry
+from olaaf_django.profiling import SyncProfile
+from olaaf_django.scheduler import SyncError
 from olaaf_django.sync_hashes import sync_hashes
 
 
@@ -12,8 +19,70 @@ and calculate and insert/update hashes of added, modified and deleted files"""
     parser.add_argument("repos_data", type=str, help="json containing commits "
                         "sorted by branches and repositories which should be "
                         "inserted into the database")
+    parser.add_argument("--hashing-workers", type=int, default=1,
+                        help="Number of worker processes which read and hash changed files. "
+                        "Files are hashed in the current process by default")
+    parser.add_argument("--sync-workers", type=int, default=1,
+                        help="Maximum number of publications which are synced concurrently. "
+                        "Commits of one publication are always synced in order")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Seed new publications with paths and hashes of the closest "
+                        "already synced publication of the same repository and only hash "
+                        "files which changed since then")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="Maximum estimated size, in MB, of new paths and hashes which "
+                        "are collected before they are inserted into the database. "
+                        "Applies to each publication which is being synced. Defaults to 100")
+    parser.add_argument("--time-budget", type=int, default=None,
+                        help="Number of seconds after which syncing is stopped once the "
+                        "current batch of hashes is inserted. Interrupted commits are "
+                        "resumed by the next run")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Trace memory allocations using tracemalloc, so that sizes of "
+                        "batches are measured instead of just estimated. Slows down syncing")
+    parser.add_argument("--profile", type=str, default=None, metavar="REPORT_PATH",
+                        help="Write a JSON report of time spent in each stage of syncing "
+                        "(git diff, blob reads, html parsing, hashing, database writes), "
+                        "per publication and per commit, to the given path")
+    parser.add_argument("--profile-dump", type=str, default=None, metavar="DUMP_PATH",
+                        help="Profile the command using cProfile and write its stats to the "
+                        "given path. Only the main thread is profiled, so concurrently "
+                        "synced publications and background hashing are not included")
+    parser.add_argument("--metrics-file", type=str, default=None,
+                        help="Write metrics of the sync stages in the Prometheus text format "
+                        "to the given path once syncing finishes, e.g. for the textfile "
+                        "collector of the node exporter")
 
   def handle(self, *args, **kwargs):
     library_root = kwargs["library_root"]
     repos_data = kwargs["repos_data"]
-    sync_hashes(library_root, repos_data)
+    memory_budget = kwargs["memory_budget"]
+    if memory_budget is not None:
+      if memory_budget <= 0:
+        raise CommandError("Memory budget must be a positive number of MB")
+      memory_budget *= MB
+    time_budget = kwargs["time_budget"]
+    if time_budget is not None and time_budget <= 0:
+      raise CommandError("Time budget must be a positive number of seconds")
+    profile = SyncProfile() if kwargs["profile"] else None
+    profiler = cProfile.Profile() if kwargs["profile_dump"] else None
+    if kwargs["trace_memory"]:
+      tracemalloc.start()
+    if profiler is not None:
+      profiler.enable()
+    try:
+      sync_hashes(library_root, repos_data, hashing_workers=kwargs["hashing_workers"],
+                  sync_workers=kwargs["sync_workers"], incremental=kwargs["incremental"],
+                  memory_budget=memory_budget, time_budget=time_budget, profile=profile)
+    except SyncError as e:
+      raise CommandError(str(e))
+    finally:
+      if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(kwargs["profile_dump"])
+      if profile is not None:
+        profile.write(kwargs["profile"])
+      if kwargs["metrics_file"]:
+        registry.write(kwargs["metrics_file"])
+      if kwargs["trace_memory"]:
+        tracemalloc.stop()
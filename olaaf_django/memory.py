@@ -0,0 +1,93 @@
+"""
+Tracking of memory used by batches of paths and hashes which are collected while a commit
+is being synced and which are waiting to be inserted into the database.
+"""
+import logging
+import sys
+import tracemalloc
+
+try:
+  import resource
+except ImportError:  # not available on Windows
+  resource = None
+
+logger = logging.getLogger(__name__)
+
+# default maximum size of a batch, in bytes
+DEFAULT_MEMORY_BUDGET = 100 * 1024 * 1024
+# maximum number of files in a batch, regardless of its size
+MAX_BATCH_FILES = 5000
+# approximate number of bytes used by bookkeeping of one file of a batch, besides its
+# strings (pending hashes, path dictionary, hash memo and entries of lists and dictionaries
+# which hold them). Measured using tracemalloc
+FILE_OVERHEAD = 1536
+# number of added files after which traced memory is sampled, if tracemalloc is tracing
+TRACEMALLOC_SAMPLE_INTERVAL = 100
+
+MB = 1024 * 1024
+
+
+class BatchMemoryTracker:
+  """
+  Keeps track of the number of files in a batch and of its memory footprint, so that the
+  batch can be flushed to the database before it exceeds the memory budget. The footprint
+  is estimated based on sizes of the batch's strings. If tracemalloc is tracing (see
+  `synchashes --trace-memory`), growth of traced memory since the batch was started is also
+  sampled and the greater of the two values is used. Traced memory is shared by all threads,
+  so when publications are synced concurrently, batches are flushed sooner than necessary.
+  """
+
+  def __init__(self, memory_budget=None, max_files=MAX_BATCH_FILES):
+    self.memory_budget = memory_budget or DEFAULT_MEMORY_BUDGET
+    self.max_files = max_files
+    self.reset()
+
+  def reset(self):
+    self.files = 0
+    self.estimated_size = 0
+    self.traced_size = 0
+    self._traced_start = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() \
+        else None
+
+  def add(self, *values):
+    """
+    Add a file to the batch. Values are the file's strings kept in the batch (path, url,
+    hash values etc.). None values are ignored.
+    """
+    self.files += 1
+    self.estimated_size += FILE_OVERHEAD + sum(sys.getsizeof(value) for value in values
+                                               if value is not None)
+    if self._traced_start is not None and self.files % TRACEMALLOC_SAMPLE_INTERVAL == 0:
+      self.traced_size = tracemalloc.get_traced_memory()[0] - self._traced_start
+
+  @property
+  def size(self):
+    return max(self.estimated_size, self.traced_size)
+
+  def is_full(self):
+    return self.files >= self.max_files or self.size >= self.memory_budget
+
+  def flushed(self, commit):
+    """Log size of the flushed batch and peak memory usage and start a new batch"""
+    if tracemalloc.is_tracing():
+      current, peak = tracemalloc.get_traced_memory()
+      traced = ', traced memory: {:.1f} MB, peak traced memory: {:.1f} MB'.format(
+          current / MB, peak / MB)
+      # peak is measured per flush where supported (python 3.9+)
+      if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+      traced = ''
+    logger.info('Flushed %s files of commit %s, estimated batch size: %.1f MB%s, '
+                'peak RSS: %.1f MB', self.files, commit, self.size / MB, traced,
+                get_peak_rss() / MB)
+    self.reset()
+
+
+def get_peak_rss():
+  """Return peak resident set size of the current process in bytes, 0 if it is unknown"""
+  if resource is None:
+    return 0
+  peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on Linux, bytes on macOS
+  return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
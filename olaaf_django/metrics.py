@@ -0,0 +1,188 @@
+"""
+Process-wide registry of counters and latency histograms, which can be exported in the
+Prometheus text format. Metrics are updated by concurrent requests and sync threads, so
+all updates are guarded by locks. This module must not depend on Django, since it is
+imported by the hashing worker processes.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds of histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape_label_value(value):
+  return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+  pairs = list(zip(label_names, label_values)) + list(extra)
+  if not pairs:
+    return ''
+  return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+  type_name = None
+
+  def __init__(self, name, documentation, label_names=()):
+    self.name = name
+    self.documentation = documentation
+    self.label_names = tuple(label_names)
+    self._lock = threading.Lock()
+    self._values = {}
+
+  def _key(self, labels):
+    if set(labels) != set(self.label_names):
+      raise ValueError(f'Metric {self.name} expects labels {self.label_names}, '
+                       f'got {tuple(labels)}')
+    return tuple(str(labels[name]) for name in self.label_names)
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+    with self._lock:
+      values = sorted(self._values.items())
+    for label_values, value in values:
+      lines.extend(self._render_value(label_values, value))
+    return lines
+
+
+class Counter(_Metric):
+  """A monotonically increasing value, e.g. a number of requests"""
+  type_name = 'counter'
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def get(self, **labels):
+    with self._lock:
+      return self._values.get(self._key(labels), 0)
+
+  def _render_value(self, label_values, value):
+    yield f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}'
+
+
+class _HistogramValue:
+  __slots__ = ('bucket_counts', 'sum', 'count')
+
+  def __init__(self, buckets_number):
+    self.bucket_counts = [0] * buckets_number
+    self.sum = 0.0
+    self.count = 0
+
+
+class Histogram(_Metric):
+  """
+  Distribution of observed values (usually durations in seconds) in cumulative buckets,
+  from which quantiles such as p99 latency can be estimated
+  """
+  type_name = 'histogram'
+
+  def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+    super().__init__(name, documentation, label_names)
+    self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+  def observe(self, value, **labels):
+    key = self._key(labels)
+    bucket_index = bisect_left(self.buckets, value)
+    with self._lock:
+      histogram_value = self._values.get(key)
+      if histogram_value is None:
+        histogram_value = self._values[key] = _HistogramValue(len(self.buckets))
+      histogram_value.bucket_counts[bucket_index] += 1
+      histogram_value.sum += value
+      histogram_value.count += 1
+
+  @contextmanager
+  def time(self, **labels):
+    """Observe duration of the wrapped block, including blocks which raise an exception"""
+    start_time = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start_time, **labels)
+
+  def get_count(self, **labels):
+    with self._lock:
+      histogram_value = self._values.get(self._key(labels))
+      return histogram_value.count if histogram_value is not None else 0
+
+  def _render_value(self, label_values, value):
+    cumulative_count = 0
+    for upper_bound, bucket_count in zip(self.buckets, value.bucket_counts):
+      cumulative_count += bucket_count
+      labels = _format_labels(self.label_names, label_values,
+                              [('le', _format_value(upper_bound))])
+      yield f'{self.name}_bucket{labels} {cumulative_count}'
+    labels = _format_labels(self.label_names, label_values)
+    yield f'{self.name}_sum{labels} {_format_value(value.sum)}'
+    yield f'{self.name}_count{labels} {value.count}'
+
+
+class MetricsRegistry:
+  """Metrics of the current process, by name"""
+
+  def __init__(self):
+    self._metrics = {}
+    self._lock = threading.Lock()
+
+  def counter(self, name, documentation, label_names=()):
+    return self._get_or_create(Counter, name, documentation, label_names)
+
+  def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+    return self._get_or_create(Histogram, name, documentation, label_names, buckets=buckets)
+
+  def _get_or_create(self, metric_class, name, documentation, label_names, **kwargs):
+    with self._lock:
+      metric = self._metrics.get(name)
+      if metric is None:
+        metric = self._metrics[name] = metric_class(name, documentation, label_names, **kwargs)
+      elif type(metric) is not metric_class or metric.label_names != tuple(label_names):
+        raise ValueError(f'Metric {name} is already registered with a different type or labels')
+      return metric
+
+  def render(self):
+    """Return all metrics in the Prometheus text exposition format"""
+    with self._lock:
+      metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+    lines = []
+    for metric in metrics:
+      lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+  def write(self, path):
+    """Write all metrics to a file, e.g. for the node exporter's textfile collector"""
+    with open(path, 'w') as metrics_file:
+      metrics_file.write(self.render())
+
+
+registry = MetricsRegistry()
+
+# metrics shared by multiple modules
+REQUESTS = registry.counter('olaaf_requests_total', 'Number of handled API requests',
+                            ('view', 'status'))
+REQUEST_DURATION = registry.histogram('olaaf_request_duration_seconds',
+                                      'Duration of API requests', ('view',))
+REQUEST_DB_DURATION = registry.histogram('olaaf_request_db_duration_seconds',
+                                         'Time spent in database queries per API request',
+                                         ('view',))
+FUNCTION_DURATION = registry.histogram('olaaf_function_duration_seconds',
+                                       'Duration of timed functions', ('function',))
+SYNC_STAGE_DURATION = registry.histogram('olaaf_sync_stage_duration_seconds',
+                                         'Duration of stages of syncing of hashes', ('stage',))
+SYNC_STAGE_ITEMS = registry.counter('olaaf_sync_stage_items_total',
+                                    'Number of items processed by stages of syncing of hashes',
+                                    ('stage',))
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-17 16:14
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olaaf_django', '0011_auto_20201022_1907'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashMemo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blob', models.CharField(max_length=40)),
+                ('file_type', models.CharField(max_length=10)),
+                ('algorithm', models.CharField(max_length=20)),
+                ('canonicalization_version', models.PositiveSmallIntegerField()),
+                ('bitstream', models.CharField(max_length=64, validators=[django.core.validators.MinLengthValidator(64)])),
+                ('rendered', models.CharField(max_length=64, null=True, validators=[django.core.validators.MinLengthValidator(64)])),
+                ('meta_url', models.CharField(max_length=260, null=True)),
+                ('search_path', models.CharField(max_length=200, null=True)),
+            ],
+            options={
+                'verbose_name': 'Hash memo',
+                'verbose_name_plural': 'Hash memos',
+                'unique_together': {('blob', 'file_type', 'algorithm', 'canonicalization_version')},
+            },
+        ),
+    ]
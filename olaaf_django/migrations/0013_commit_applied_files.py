@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olaaf_django', '0012_hashmemo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commit',
+            name='applied_files',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olaaf_django', '0013_commit_applied_files'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hash',
+            index=models.Index(fields=['value'], name='olaaf_djang_value_45a606_idx'),
+        ),
+    ]
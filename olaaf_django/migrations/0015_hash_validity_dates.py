@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:36
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_validity_dates(apps, schema_editor):
+    Commit = apps.get_model('olaaf_django', 'Commit')
+    Hash = apps.get_model('olaaf_django', 'Hash')
+    Hash.objects.update(
+        valid_from=Subquery(Commit.objects.filter(id=OuterRef('start_commit_id')).values('date')),
+        valid_to=Subquery(Commit.objects.filter(id=OuterRef('end_commit_id')).values('date')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olaaf_django', '0014_hash_value_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='hash',
+            name='olaaf_djang_path_id_181492_idx',
+        ),
+        migrations.AddField(
+            model_name='hash',
+            name='valid_from',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='hash',
+            name='valid_to',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(set_validity_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='hash',
+            index=models.Index(fields=['path', 'value', 'hash_type', 'valid_from', 'valid_to'], name='olaaf_djang_path_id_bb1c03_idx'),
+        ),
+    ]
@@ -53,6 +53,9 @@ class Commit(models.Model):
   date = models.DateField()
   revoked = models.BooleanField(default=False)
   publication = models.ForeignKey(Publication, on_delete=models.CASCADE)
+  # number of changed files whose hashes were inserted if syncing of the commit was
+  # interrupted, None once hashes of all of its changed files are inserted
+  applied_files = models.PositiveIntegerField(null=True, blank=True)
 
   class Meta:
     unique_together = [('publication', 'sha')]
@@ -99,6 +102,10 @@ class Hash(models.Model):
   end_commit = models.ForeignKey(Commit, on_delete=models.SET_NULL,
                                  null=True, related_name='hash_end_commit')
   hash_type = models.CharField(max_length=1, choices=TYPE_CHOICES, default=BITSTREAM)
+  # dates of the start and end commit, so that validity of a hash at a date can be checked
+  # without joining commits. Updated together with the commits
+  valid_from = models.DateField(null=True)
+  valid_to = models.DateField(null=True)
 
   class Meta:
     verbose_name = "Hash"
@@ -106,7 +113,9 @@ class Hash(models.Model):
 
     unique_together = ('path', 'value', 'hash_type', 'start_commit')
     indexes = [
-        models.Index(fields=['path', 'value', 'hash_type'])
+        models.Index(fields=['path', 'value', 'hash_type', 'valid_from', 'valid_to']),
+        # hashes of files are checked by value only
+        models.Index(fields=['value']),
     ]
 
   def __str__(self):
@@ -114,3 +123,29 @@ class Hash(models.Model):
                                                                               self.start_commit,
                                                                               self.end_commit,
                                                                               self.hash_type)
+
+
+class HashMemo(models.Model):
+  """
+  Hashes of a git blob, together with the url and search path read from its content.
+  Blobs are immutable, so these values can be reused whenever the same blob is synced again.
+  """
+  blob = models.CharField(max_length=40)
+  file_type = models.CharField(max_length=10)
+  algorithm = models.CharField(max_length=20)
+  canonicalization_version = models.PositiveSmallIntegerField()
+  bitstream = models.CharField(max_length=64, validators=[MinLengthValidator(64)])
+  rendered = models.CharField(max_length=64, validators=[MinLengthValidator(64)], null=True)
+  # url read from the og:url property. None if the url is calculated based on the file's path
+  meta_url = models.CharField(max_length=260, null=True)
+  search_path = models.CharField(max_length=200, null=True)
+
+  class Meta:
+    verbose_name = "Hash memo"
+    verbose_name_plural = "Hash memos"
+
+    unique_together = ('blob', 'file_type', 'algorithm', 'canonicalization_version')
+
+  def __str__(self):
+    return 'blob={}, file_type={}, algorithm={}, canonicalization_version={}'.format(
+        self.blob, self.file_type, self.algorithm, self.canonicalization_version)
@@ -0,0 +1,103 @@
+"""
+Overlapping of reading and hashing of changed files with writing to the database. Git
+content is immutable, so files changed by the next commit can be listed and hashed while
+hashes of the current commit are still being inserted.
+"""
+import logging
+import queue
+import threading
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# how long a blocked producer waits before it checks if the consumer stopped
+PUT_TIMEOUT = 0.1
+
+
+class _Done:
+  pass
+
+
+class _Failed:
+  def __init__(self, error):
+    self.error = error
+
+
+class BackgroundIterator:
+  """
+  Iterates over an iterable in a background thread and keeps up to `max_items` of its items
+  in a bounded queue, so that the producer can run ahead of the consumer without holding all
+  items in memory. Items are returned in order and an exception raised by the producer is
+  re-raised by the consumer. If the consumer stops early (e.g. because it failed), the
+  producer is stopped once it tries to add the next item. Database connections opened by
+  the producer are closed when it finishes.
+  """
+
+  def __init__(self, iterable, max_items, name='producer'):
+    self._iterable = iterable
+    self._queue = queue.Queue(maxsize=max_items)
+    self._stopped = threading.Event()
+    self._finished = False
+    self._thread = threading.Thread(target=self._produce, name=name, daemon=True)
+    self._thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    if self._finished:
+      raise StopIteration
+    item = self._queue.get()
+    if isinstance(item, _Done):
+      self._finished = True
+      raise StopIteration
+    if isinstance(item, _Failed):
+      self._finished = True
+      raise item.error
+    return item
+
+  def close(self):
+    """Stop the producer and wait until its thread finishes"""
+    self._stopped.set()
+    while self._thread.is_alive():
+      # unblock the producer if the queue is full
+      try:
+        while True:
+          self._queue.get_nowait()
+      except queue.Empty:
+        pass
+      self._thread.join(PUT_TIMEOUT)
+    self._finished = True
+
+  def _produce(self):
+    iterator = iter(self._iterable)
+    try:
+      for item in iterator:
+        if not self._put(item):
+          return
+      self._put(_Done())
+    except Exception as e:
+      self._put(_Failed(e))
+    finally:
+      # generators are closed in the thread which runs them, e.g. to stop git processes
+      close = getattr(iterator, 'close', None)
+      if close is not None:
+        close()
+      # database connections are per thread and are not closed automatically
+      connections.close_all()
+
+  def _put(self, item):
+    while not self._stopped.is_set():
+      try:
+        self._queue.put(item, timeout=PUT_TIMEOUT)
+        return True
+      except queue.Full:
+        continue
+    return False
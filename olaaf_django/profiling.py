@@ -0,0 +1,221 @@
+"""
+Per-stage profiling of the synchronization of hashes. Time spent in each stage (listing of
+changed files, reading of blobs, parsing of html documents, hashing, database writes etc.)
+and the number of processed items are recorded per commit and per publication and can be
+written to a JSON report. Stages are recorded by the thread which executes them, into the
+commit which that thread is currently processing, so that commits which are hashed ahead
+of being inserted are reported correctly. Stages executed by hashing worker processes are
+collected by the worker and recorded by the thread which receives the worker's results.
+Durations of stages are also always observed by the process-wide metrics. This module must
+not depend on Django, since it is imported by the hashing worker processes.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from olaaf_django import metrics
+
+# names of the recorded stages
+GIT_DIFF = 'git_diff'
+MEMO_LOOKUP = 'memo_lookup'
+BLOB_READ = 'blob_read'
+HTML_PARSE = 'html_parse'
+METADATA_READ = 'metadata_read'
+AUTH_DIV_SERIALIZE = 'auth_div_serialize'
+SHA256 = 'sha256'
+SEED = 'seed'
+MEMO_WRITES = 'memo_writes'
+PATH_WRITES = 'path_writes'
+HASH_INSERTS = 'hash_inserts'
+INTERVAL_CLOSES = 'interval_closes'
+HASH_DELETES = 'hash_deletes'
+
+_local = threading.local()
+
+
+class StageTimes:
+  """Elapsed time and number of processed items of each stage"""
+
+  def __init__(self):
+    self.seconds = defaultdict(float)
+    self.counts = defaultdict(int)
+
+  def add(self, stage, seconds, count=1):
+    self.seconds[stage] += seconds
+    self.counts[stage] += count
+
+  def update(self, other):
+    for stage, seconds in other.seconds.items():
+      self.add(stage, seconds, other.counts[stage])
+
+  def to_dict(self):
+    return {stage: {'seconds': round(self.seconds[stage], 6), 'count': self.counts[stage]}
+            for stage in sorted(self.seconds)}
+
+  def to_tuple(self):
+    """Compact (stage, seconds, count) tuples, e.g. to be sent from a worker process"""
+    return tuple((stage, seconds, self.counts[stage]) for stage, seconds in self.seconds.items())
+
+
+class PublicationProfile:
+  """Stage times of the commits of one publication"""
+
+  def __init__(self, name):
+    self.name = name
+    self.elapsed_time = None
+    self.commits = {}
+    # stages of one commit can be recorded by the hashing thread and by the thread which
+    # inserts hashes at the same time
+    self._lock = threading.Lock()
+
+  def record(self, commit, stage, seconds, count=1):
+    with self._lock:
+      self.commits.setdefault(commit, StageTimes()).add(stage, seconds, count)
+
+  def to_dict(self):
+    with self._lock:
+      totals = StageTimes()
+      for times in self.commits.values():
+        totals.update(times)
+      return {
+          'elapsed_seconds': self.elapsed_time,
+          'stages': totals.to_dict(),
+          'commits': {commit: times.to_dict() for commit, times in self.commits.items()},
+      }
+
+
+class SyncProfile:
+  """Stage times of all publications which are synced by one run of `sync_hashes`"""
+
+  def __init__(self):
+    self.elapsed_time = None
+    self._publications = {}
+    self._lock = threading.Lock()
+
+  def publication(self, name):
+    with self._lock:
+      return self._publications.setdefault(name, PublicationProfile(name))
+
+  def to_dict(self):
+    with self._lock:
+      publications = list(self._publications.values())
+    publications_dicts = {publication.name: publication.to_dict()
+                          for publication in publications}
+    totals = StageTimes()
+    for publication_dict in publications_dicts.values():
+      for stage, stage_dict in publication_dict['stages'].items():
+        totals.add(stage, stage_dict['seconds'], stage_dict['count'])
+    return {
+        'elapsed_seconds': self.elapsed_time,
+        'stages': totals.to_dict(),
+        'publications': publications_dicts,
+    }
+
+  def write(self, path):
+    with open(path, 'w') as report:
+      json.dump(self.to_dict(), report, indent=2)
+
+
+@contextmanager
+def recording(publication_profile, commit):
+  """
+  Record stages executed by the current thread into the given commit of the given
+  publication profile. Does nothing if the profile is None. Blocks are not nested and
+  recording stops once the block exits, which might happen after the thread entered
+  another block, e.g. if it is a part of a generator
+  """
+  if publication_profile is None:
+    yield
+    return
+  _local.current = partial(publication_profile.record, commit)
+  try:
+    yield
+  finally:
+    _local.current = None
+
+
+@contextmanager
+def collecting():
+  """
+  Collect stages executed by the current thread into a `StageTimes`, which is yielded, e.g.
+  in a hashing worker process. Its stages can be recorded into the commit processed by
+  another thread or process using `record_all`
+  """
+  stage_times = StageTimes()
+  previous = getattr(_local, 'current', None)
+  _local.current = stage_times.add
+  try:
+    yield stage_times
+  finally:
+    _local.current = previous
+
+
+@contextmanager
+def stage(name, count=1):
+  """
+  Measure time spent in the wrapped block. It is always observed by the stage metrics and
+  also recorded into the current commit if the current thread is recording
+  """
+  current = getattr(_local, 'current', None)
+  start_time = time.perf_counter()
+  try:
+    yield
+  finally:
+    _record(current, name, time.perf_counter() - start_time, count)
+
+
+def profiled_iter(name, iterable):
+  """
+  Measure time spent in producing items of the given iterable, e.g. waiting for output of
+  a git process. Each item is counted. Time and count are recorded once the iterable is
+  exhausted or closed.
+  """
+  current = getattr(_local, 'current', None)
+  iterator = iter(iterable)
+  seconds = 0
+  count = 0
+  try:
+    while True:
+      start_time = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        seconds += time.perf_counter() - start_time
+        return
+      seconds += time.perf_counter() - start_time
+      count += 1
+      yield item
+  finally:
+    # e.g. stop a git process if not all items were consumed
+    close = getattr(iterator, 'close', None)
+    if close is not None:
+      close()
+    _record(current, name, seconds, count)
+
+
+def record(name, seconds, count=1):
+  """
+  Record time measured by the caller, e.g. of stages which are interleaved, into the current
+  commit if the current thread is recording
+  """
+  _record(getattr(_local, 'current', None), name, seconds, count)
+
+
+def record_all(stages):
+  """
+  Record stages collected by `collecting`, given as returned by `StageTimes.to_tuple`, as if
+  they were executed by the current thread
+  """
+  current = getattr(_local, 'current', None)
+  for name, seconds, count in stages:
+    _record(current, name, seconds, count)
+
+
+def _record(current, name, seconds, count):
+  metrics.SYNC_STAGE_DURATION.observe(seconds, stage=name)
+  metrics.SYNC_STAGE_ITEMS.inc(count, stage=name)
+  if current is not None:
+    current(name, seconds, count)
@@ -0,0 +1,150 @@
+"""
+Per-process cache of the publications of each repository, so that publications and
+authenticable urls are not looked up by every authentication request. For each repository,
+its non-revoked publications and the name of the latest one are loaded once, and urls of
+paths of a publication are loaded the first time a document of that publication is
+authenticated. Urls are stored as a sorted array of their 64-bit digests, which takes
+8 bytes per url.
+
+Cached publications are reloaded once the sync generation (see `olaaf_django.auth_cache`)
+changes, i.e. after hashes were synced. The cache is disabled together with the cache of
+authentication results, since syncs can not be detected without it.
+"""
+import hashlib
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.db import DatabaseError
+
+import olaaf_django
+
+from . import auth_cache
+from .models import Path, Publication
+
+logger = logging.getLogger(__name__)
+
+_repositories = {}
+_lock = threading.Lock()
+
+
+def _url_digest(url):
+  # urls are normalized like in queries, e.g. their endings are removed
+  url = Path._meta.get_field('url').get_prep_value(url)
+  return int.from_bytes(hashlib.blake2b(url.encode('utf-8', 'surrogateescape'),
+                                        digest_size=8).digest(), 'big', signed=True)
+
+
+class AuthenticableUrls:
+  """
+  Urls of paths of one publication, loaded on first use. Two urls whose 64-bit digests
+  collide are both considered authenticable, which is only an issue if one of them has
+  no hashes at all
+  """
+
+  def __init__(self, publication_id):
+    self.publication_id = publication_id
+    self._digests = None
+    self._lock = threading.Lock()
+
+  def _load(self):
+    with self._lock:
+      if self._digests is None:
+        urls = (Path.objects.filter(publication_id=self.publication_id)
+                .values_list('url', flat=True).iterator())
+        self._digests = array('q', sorted({_url_digest(url) for url in urls}))
+    return self._digests
+
+  def __contains__(self, url):
+    digests = self._digests if self._digests is not None else self._load()
+    digest = _url_digest(url)
+    index = bisect_left(digests, digest)
+    return index < len(digests) and digests[index] == digest
+
+  def __len__(self):
+    digests = self._digests if self._digests is not None else self._load()
+    return len(digests)
+
+
+class RepositoryPublications:
+  """Non-revoked publications of one repository, as of the given sync generation"""
+
+  def __init__(self, repo_name, generation):
+    self.repo_name = repo_name
+    self.generation = generation
+    publications = list(Publication.for_partner(repo_name).non_revoked().order_by('-name'))
+    self.latest = publications[0].name if publications else None
+    self.publications = {}
+    for publication in publications:
+      # same attributes as publications returned by `by_name_or_latest`
+      publication.latest = self.latest
+      publication.authenticable_urls = AuthenticableUrls(publication.id)
+      self.publications[publication.name] = publication
+
+  def by_name_or_latest(self, name=None):
+    """
+    <Purpose>
+      Find a non-revoked publication, like `PublicationManager.by_name_or_latest` with
+      `strict` set to True
+    <Arguments>
+      name:
+        Name of the publication, the latest one is returned if not specified
+    <Returns>
+      The cached publication
+      Raises Publication.DoesNotExist if there is no such publication
+    """
+    publication = self.publications.get(name or self.latest)
+    if publication is None:
+      raise Publication.DoesNotExist
+    return publication
+
+
+def get_repository_publications(repo_name):
+  """
+  <Purpose>
+    Return cached publications of the given repository, loading them if they are not
+    cached yet or if hashes were synced since they were loaded
+  <Arguments>
+    repo_name:
+      Name of the repository
+  <Returns>
+    `RepositoryPublications`, or None if caching is disabled
+  """
+  generation = auth_cache.get_sync_generation()
+  if generation is None:
+    return None
+  repository_publications = _repositories.get(repo_name)
+  if repository_publications is None or repository_publications.generation != generation:
+    with _lock:
+      repository_publications = _repositories.get(repo_name)
+      if repository_publications is None or repository_publications.generation != generation:
+        repository_publications = RepositoryPublications(repo_name, generation)
+        _repositories[repo_name] = repository_publications
+  return repository_publications
+
+
+def warm_up(repo_names=None):
+  """
+  Load publications of the given repositories (by default of all repositories listed in
+  `HOSTS_REPOS_CACHE`) and urls of their latest publications, e.g. once the server starts
+  """
+  if repo_names is None:
+    repo_names = set(olaaf_django.HOSTS_REPOS_CACHE.values())
+  for repo_name in repo_names:
+    try:
+      repository_publications = get_repository_publications(repo_name)
+      if repository_publications is None:
+        return
+      if repository_publications.latest is not None:
+        latest = repository_publications.by_name_or_latest()
+        logger.info('Loaded %s urls of publication %s of repository %s',
+                    len(latest.authenticable_urls), latest.name, repo_name)
+    except DatabaseError as e:
+      logger.warning('Could not load publications of repository %s: %s', repo_name, e)
+
+
+def clear():
+  """Remove all cached publications"""
+  with _lock:
+    _repositories.clear()
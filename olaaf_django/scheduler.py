@@ -0,0 +1,128 @@
+"""
+Runs independent units of synchronization (e.g. publications of partner repositories)
+concurrently, using a bounded number of threads.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# SQLite allows only one writer at a time and fails right away, instead of waiting, when
+# a transaction which has already read from the database tries to write to it
+_sqlite_write_lock = threading.RLock()
+
+
+class SyncUnit:
+  """
+  An independent unit of work. Units must not share database rows with each other, since
+  they might be executed concurrently, each in a separate transaction. A unit which reads
+  rows written by another unit (e.g. a publication seeded from its predecessor) has to be
+  executed after it, which is set by its `after` attribute.
+  """
+
+  def __init__(self, name, func, *args, **kwargs):
+    self.name = name
+    self.func = func
+    self.args = args
+    self.kwargs = kwargs
+    self.after = None
+
+  def __str__(self):
+    return self.name
+
+
+class SyncUnitResult:
+  def __init__(self, unit, succeeded, error=None, elapsed_time=None):
+    self.unit = unit
+    self.succeeded = succeeded
+    self.error = error
+    self.elapsed_time = elapsed_time
+
+  def __str__(self):
+    status = 'succeeded' if self.succeeded else f'failed: {self.error}'
+    return '{} {} in {:.1f} seconds'.format(self.unit, status, self.elapsed_time or 0)
+
+
+class SyncError(Exception):
+  """Raised after all units were executed if one or more of them failed."""
+
+  def __init__(self, results):
+    self.results = results
+    failed = [str(result.unit) for result in results if not result.succeeded]
+    super().__init__('Synchronization of {} unit(s) failed: {}'.format(
+        len(failed), ', '.join(failed)))
+
+
+def run_sync_units(units, workers=1):
+  """
+  <Purpose>
+    Run the given units. If the number of workers is greater than 1, units are executed
+    concurrently in a pool of threads, each of which uses its own database connection.
+    A unit is not started before the unit set as its `after` unit finishes, whether or not
+    it succeeds. A failure of one unit does not stop execution of the other ones.
+  <Arguments>
+    units:
+      A list of `SyncUnit` objects. Units have to be listed after units they are executed
+      after
+    workers:
+      Maximum number of units executed at the same time
+  <Returns>
+    A list of `SyncUnitResult`, in the same order as the units
+  """
+  if workers <= 1 or len(units) <= 1:
+    results = [_run_unit(unit) for unit in units]
+  else:
+    logger.info('Running %s sync units using %s threads', len(units), workers)
+    # units are started in order, so a unit which waits for another one does not block it
+    finished = {unit: threading.Event() for unit in units}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync') as executor:
+      results = list(executor.map(partial(_run_unit_in_thread, finished=finished), units))
+
+  _log_summary(results)
+  return results
+
+
+def serialized_writes(using=DEFAULT_DB_ALIAS):
+  """
+  Return a context manager which should wrap transactions that write to the database. If the
+  database is SQLite, concurrent transactions are serialized. Otherwise, this is a no-op.
+  """
+  if connections[using].vendor == 'sqlite':
+    return _sqlite_write_lock
+  return nullcontext()
+
+
+def _run_unit(unit):
+  start_time = time.time()
+  try:
+    unit.func(*unit.args, **unit.kwargs)
+  except Exception as e:
+    logger.exception('Sync unit %s failed', unit)
+    return SyncUnitResult(unit, False, error=e, elapsed_time=time.time() - start_time)
+  return SyncUnitResult(unit, True, elapsed_time=time.time() - start_time)
+
+
+def _run_unit_in_thread(unit, finished):
+  try:
+    if unit.after in finished:
+      finished[unit.after].wait()
+    return _run_unit(unit)
+  finally:
+    # database connections are per thread and are not closed automatically
+    connections.close_all()
+    finished[unit].set()
+
+
+def _log_summary(results):
+  if not results:
+    return
+  failed = [result for result in results if not result.succeeded]
+  logger.info('\nSynchronized %s unit(s), %s succeeded, %s failed:\n%s', len(results),
+              len(results) - len(failed), len(failed),
+              '\n'.join(f'  {result}' for result in results))
@@ -3,6 +3,11 @@
  */
 const fileList = document.getElementById("file-list");
 
+/*
+  Number of files whose hashes are checked by one request.
+ */
+const CHECK_HASHES_BATCH_SIZE = 100;
+
 /*
   Appends <li> that holds file details
  */
@@ -25,16 +30,21 @@ const checkAuthenticity = async (files) => {
     }
   }
 
-  try {
-    const authResponse = await sendCheckHashesRequest(filesHashes);
-    Object.keys(authResponse).forEach((fileName) => {
-      const status = authResponse[fileName];
-      const fileItem = document.getElementById(status.name);
-      fileItem.innerHTML += ` | Authentic: ${status.authentic} | Current: ${status.current}`;
-    });
-  } catch (e) {
-    // could not authenticate file(s)
-    console.log(e.message);
+  // the server limits the number of files checked by one request
+  for (let i = 0; i < filesHashes.length; i += CHECK_HASHES_BATCH_SIZE) {
+    try {
+      const authResponse = await sendCheckHashesRequest(
+        filesHashes.slice(i, i + CHECK_HASHES_BATCH_SIZE)
+      );
+      Object.keys(authResponse).forEach((fileName) => {
+        const status = authResponse[fileName];
+        const fileItem = document.getElementById(status.name);
+        fileItem.innerHTML += ` | Authentic: ${status.authentic} | Current: ${status.current}`;
+      });
+    } catch (e) {
+      // could not authenticate file(s)
+      console.log(e.message);
+    }
   }
 };
 
@@ -2,23 +2,29 @@ import json
 import logging
 import pathlib
 import re
-import sys
-import tempfile
-import uuid
+import time
+from contextlib import closing
 from datetime import datetime
-from urllib.parse import urlparse
+from itertools import islice
 
-from django.db import transaction
-from django.db.models import Q
-from git import Repo
-from lxml import html as et_html
+from django.db import connection, transaction
+from git import GitCommandError, Repo
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 
-from olaaf_django.models import Commit, Hash, Path, Publication, Repository
-from olaaf_django.utils import (calc_hash, get_auth_div_content,
-                                get_html_document, timed_run)
-from taf.git import GitRepository
+from olaaf_django import auth_cache, profiling
+from olaaf_django.git_blobs import GitBlobReader
+from olaaf_django.git_diff import iter_diff_entries
+from olaaf_django.hashers import get_hasher
+from olaaf_django.hashing import (CANONICALIZATION_VERSION, HASH_ALGORITHM, FileHashes,
+                                  HashingStage, get_url)
+from olaaf_django.intervals import OpenHashIndex, close_hash_intervals
+from olaaf_django.memory import BatchMemoryTracker
+from olaaf_django.pipeline import BackgroundIterator
+from olaaf_django.models import Commit, Hash, HashMemo, Path, Publication, Repository
+from olaaf_django.scheduler import (SyncError, SyncUnit, run_sync_units,
+                                    serialized_writes)
+from olaaf_django.utils import timed_run
 
 logger = logging.getLogger(__name__)
 
@@ -27,28 +33,115 @@ chrome_options.add_argument("--headless")
 chrome_options.add_argument('--no-sandbox')
 
 EMPTY_TREE_SHA = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
-# currently supported file types
-SUPPORTED_TYPES = ['html', 'pdf']
 MAX_QUERIES = 500
-MAX_HASHES_LIST_SIZE_IN_BYTES = 100 * 1024  # 100mb
+# maximum number of hashed files which are waiting to be inserted into the database
+MAX_PIPELINED_FILES = 2 * MAX_QUERIES
+# number of hashes inserted by one bulk insert
+MAX_HASHES_PER_INSERT = 2000
+
+
+class PendingHash:
+  """
+  A new hash which is waiting to be inserted into the database. Thousands of them are kept
+  in a batch, so model instances are only created when the batch is inserted. Hash type
+  is a part of the key under which the pending hash is stored.
+  """
+  __slots__ = ('value', 'path_id', 'id')
+
+  def __init__(self, value, path_id=None):
+    self.value = value
+    self.path_id = path_id
+    self.id = None
+
+
+class Deadline:
+  """Point in time, `time_budget` seconds from now as measured by `clock`"""
+
+  def __init__(self, time_budget, clock=time.monotonic):
+    self.clock = clock
+    self.time = clock() + time_budget
+
+  def passed(self):
+    return self.clock() >= self.time
 
 
 @timed_run()
-def sync_hashes(library_root, repos_data):
+def sync_hashes(library_root, repos_data, hashing_workers=1, sync_workers=1, incremental=False,
+                memory_budget=None, time_budget=None, profile=None, clock=time.monotonic):
   """
   Given a path of an html repository, gets the publication branches and
   traverse through all its commits which have not yet been inserted into the
   database and insert them. For each commit, calculate hashes of all
   new/modified files and calculates hashes of added files. Update previously
   calculated hashes of modified and deleted files and set their valid until
-  date.
+  date. If `hashing_workers` is greater than 1, files are read and hashed by
+  that many worker processes. If `sync_workers` is greater than 1, up to that
+  many publications are synced concurrently. Commits of one publication are
+  always inserted in order. If `incremental` is True, a new publication is seeded
+  with paths and current hashes of the closest already synced publication of the same
+  repository, so that only files changed since that publication have to be hashed.
+  New paths and hashes are collected in batches which are inserted into the database once
+  they hold `MAX_BATCH_FILES` files or their estimated size reaches `memory_budget` bytes
+  (100 MB by default). Each publication which is being synced has its own batch.
+  The number of changed files whose hashes were inserted is stored together with each
+  batch, so if syncing of a commit fails after some of its batches were inserted, or
+  if it is stopped because `time_budget` seconds passed, it is resumed by the next run.
+  Elapsed time is measured by `clock`, which returns seconds, e.g. `time.monotonic`.
+  If `profile` is a `SyncProfile`, time spent in each stage of syncing is recorded into it.
+  Returns a list of `SyncUnitResult`, one per publication.
+  Raises `SyncError` after all publications were processed if syncing one or more
+  of them failed.
   """
+  start_time = time.monotonic()
+  deadline = Deadline(time_budget, clock) if time_budget is not None else None
   library_root = pathlib.Path(library_root)
   repos_data = _load_json_input(repos_data)
   if not repos_data:
     logger.info('Empty input data. No hashes to sync')
-    return
+    return []
 
+  with HashingStage(hashing_workers) as hashing_stage:
+    units = _get_sync_units(library_root, repos_data, hashing_stage, incremental,
+                            memory_budget, deadline, profile)
+    results = run_sync_units(units, workers=sync_workers)
+  if profile is not None:
+    profile.elapsed_time = time.monotonic() - start_time
+
+  if not all(result.succeeded for result in results):
+    raise SyncError(results)
+  return results
+
+
+def _get_sync_units(library_root, repos_data, hashing_stage, incremental, memory_budget=None,
+                    deadline=None, profile=None):
+  """
+  <Purpose>
+    Create a sync unit for each publication branch which should be synced. Publications
+    do not share any rows, so their units can be executed concurrently. In incremental
+    mode, a publication's unit is executed after the unit of the preceding publication of
+    the same repository, so that a new publication is only seeded from a predecessor which
+    is fully synced
+  <Arguments>
+    library_root:
+      Path of the library root
+    repos_data:
+      Dictionary which maps repository names to commits data of their branches
+    hashing_stage:
+      `HashingStage` which calculates hashes of added and modified files
+    incremental:
+      Whether new publications should be seeded from their predecessors
+    memory_budget:
+      Maximum estimated size of a batch of new paths and hashes in bytes, or None
+      to use the default budget
+    deadline:
+      `Deadline` after which syncing is stopped once the current batch is inserted, or
+      None if there is no time limit
+    profile:
+      `SyncProfile` into which time spent in each stage is recorded, or None
+  <Returns>
+    A list of `SyncUnit` objects
+  """
+  units = []
   for repo_name, repo_data in repos_data.items():
     repo_path = library_root / repo_name
     if not repo_path.exists():
@@ -56,12 +149,9 @@ def sync_hashes(library_root, repos_data):
                      repo_name, repo_path)
       continue
 
-    repo = Repo(str(repo_path))
-
-    logger.info('\n\n\nSyncing hashes of repository: %s', repo_name)
     repository, _ = Repository.objects.get_or_create(name=repo_name)
 
-    # Call sync hashes for all publications
+    repository_units = []
     for branch, commits_data in repo_data.items():
       if not commits_data:
         logger.info('Skipping branch %s. Commits data is empty', branch)
@@ -74,26 +164,68 @@ def sync_hashes(library_root, repos_data):
       else:
         publication_name = branch
 
-      try:
-        publication = Publication.objects.get(repository=repository,
-                                              name=publication_name)
-      except Exception:
-        date = commits_data[0]["custom"]["build-date"]
-        core_version = commits_data[0]["custom"].get("core-version")
-        try:
-          publication = Publication.objects.create(repository=repository,
-                                                    name=publication_name,
-                                                    date=date,
-                                                    core_version=core_version)
-        except Exception as e:
-          logger.error('Could not create publication %s due to error:\n%s',
-                        publication_name, str(e))
-          raise
-
-      _sync_hashes_for_publication(repo, publication, commits_data)
+      unit_name = f'{repo_name}:{branch}'
+      publication_profile = profile.publication(unit_name) if profile is not None else None
+      repository_units.append((publication_name, SyncUnit(
+          unit_name, _sync_publication_branch, repo_path, repository, publication_name,
+          commits_data, hashing_stage, incremental, memory_budget, deadline,
+          publication_profile)))
+
+    if incremental:
+      # a new publication is seeded from its synced predecessor, so publications of the
+      # same repository are synced one after another, in order of their names
+      repository_units.sort(key=lambda name_and_unit: name_and_unit[0])
+      for (_, previous_unit), (_, unit) in zip(repository_units, repository_units[1:]):
+        unit.after = previous_unit
+    units.extend(unit for _, unit in repository_units)
+  return units
+
+
+def _sync_publication_branch(repo_path, repository, publication_name, commits_data,
+                             hashing_stage, incremental, memory_budget=None, deadline=None,
+                             publication_profile=None):
+  start_time = time.monotonic()
+  logger.info('\n\n\nSyncing hashes of repository: %s, publication: %s', repository.name,
+              publication_name)
+  # cached authentication results are only invalidated if rows were written
+  changed = False
+  try:
+    publication = Publication.objects.get(repository=repository,
+                                          name=publication_name)
+  except Exception:
+    date = commits_data[0]["custom"]["build-date"]
+    core_version = commits_data[0]["custom"].get("core-version")
+    try:
+      with serialized_writes():
+        publication = Publication.objects.create(repository=repository,
+                                                 name=publication_name,
+                                                 date=date,
+                                                 core_version=core_version)
+      changed = True
+    except Exception as e:
+      logger.error('Could not create publication %s due to error:\n%s',
+                   publication_name, str(e))
+      raise
 
-      # Mark publications on the same date as revoked
-      _revoke_same_date_publications(publication)
+  repo = Repo(str(repo_path))
+  try:
+    with GitBlobReader(repo.git_dir) as blob_reader:
+      completed = _sync_hashes_for_publication(repo, publication, commits_data, blob_reader,
+                                               hashing_stage, incremental, memory_budget,
+                                               deadline, publication_profile)
+
+    # Mark publications on the same date as revoked, once the publication is fully synced
+    if completed:
+      changed = _revoke_same_date_publications(publication) or changed
+    else:
+      logger.info('Publication %s is not fully synced. Publications on the same date are not '
+                  'revoked', publication.name)
+  finally:
+    # inserted commits invalidate cached results themselves, as soon as they are inserted
+    if changed:
+      auth_cache.bump_sync_generation()
+  if publication_profile is not None:
+    publication_profile.elapsed_time = time.monotonic() - start_time
 
 
 def _load_json_input(repos_data):
@@ -113,36 +245,244 @@ def _load_json_input(repos_data):
 
 
 def _revoke_same_date_publications(publication):
+  """
+  Mark publications on the same date as the given fully synced publication and with lower
+  names as revoked, so that a publication is never revoked in favor of one which is only
+  partly synced. Returns True if any publication was revoked
+  """
   def _get_same_date_publication():
     for pub in (
         Publication.objects
-        .filter(repository=publication.repository, date=publication.date, revoked=False)
-        .order_by('-name')[1:]
+        .filter(repository=publication.repository, date=publication.date, revoked=False,
+                name__lt=publication.name)
     ):
       logger.info('Marking publication %s as revoked', pub.name)
       pub.revoked = True
       yield pub
 
-  Publication.objects.bulk_update(_get_same_date_publication(), ['revoked'], batch_size=10)
+  revoked_publications = list(_get_same_date_publication())
+  with serialized_writes():
+    Publication.objects.bulk_update(revoked_publications, ['revoked'], batch_size=10)
+  return bool(revoked_publications)
 
 
 @timed_run()
-def _sync_hashes_for_publication(repo, publication, commits_data):
+def _sync_hashes_for_publication(repo, publication, commits_data, blob_reader, hashing_stage,
+                                 incremental=False, memory_budget=None, deadline=None,
+                                 publication_profile=None):
   # check if commits are already in the database
   # if they are, see if there are commits which have not been inserted yet
-  # if not, insert the hashes from the beginning
+  # if not, insert the hashes from the beginning, or, in incremental mode, starting with
+  # the last commit of the closest already synced publication
+  # returns True if all commits were inserted, or False if the time budget was exhausted
   logger.info('\nPublication: %s\n', publication.name)
 
+  seed_commit = None
   prev_commit = Commit.objects.filter(publication=publication, revoked=False).last()
-  if prev_commit is None:
+  # syncing of the last commit might have been interrupted after some of its hashes
+  # were inserted, in which case it is resumed before new commits are inserted
+  resumed_commit = None
+  if prev_commit is not None and prev_commit.applied_files is not None:
+    resumed_commit = prev_commit
+    prev_commit = Commit.objects.filter(publication=publication, revoked=False,
+                                        id__lt=resumed_commit.id).last()
+    if prev_commit is None:
+      prev_commit = Commit(sha=EMPTY_TREE_SHA)
+  elif prev_commit is None:
     prev_commit = Commit(sha=EMPTY_TREE_SHA)
+    if incremental:
+      seed_commit = _find_seed_commit(repo, publication)
+
+  # open hashes are loaded once and then updated as commits are inserted
+  open_hashes = OpenHashIndex.load(publication)
+  batch_tracker = BatchMemoryTracker(memory_budget)
+
+  planned_commits = _plan_commits(publication, commits_data,
+                                  (seed_commit or prev_commit).sha, resumed_commit)
+  # files changed by the next commits are listed and hashed while hashes of the current
+  # one are being inserted
+  hashed_files = _hash_files_of_commits(repo, planned_commits, blob_reader, hashing_stage,
+                                        publication_profile)
+  if _hash_in_background():
+    hashed_files = BackgroundIterator(hashed_files, MAX_PIPELINED_FILES,
+                                      name=f'hashing-{publication.name}')
+
+  with closing(hashed_files):
+    for commit, date, _, applied_files in planned_commits:
+      if date is None:
+        logger.error("Could not insert commit %s. Date not specified", commit)
+        raise ValueError(f"Could not insert commit {commit}. Date not specified")
+      if _deadline_passed(deadline):
+        logger.info('Time budget exhausted. Remaining commits of publication %s will be '
+                    'synced by the next run', publication.name)
+        return False
+
+      with profiling.recording(publication_profile, commit):
+        logger.debug('Current commit: %s', commit)
+        # hashed files of the current commit, up to the marker which separates them from
+        # files of the next commit
+        commit_files = iter(lambda: next(hashed_files), None)
+
+        if seed_commit is not None:
+          current_commit, open_hashes = _insert_seeded_commit(
+              publication, seed_commit, commit, date, commit_files, batch_tracker)
+          seed_commit = None
+          completed = True
+        else:
+          if resumed_commit is not None and commit == resumed_commit.sha:
+            current_commit = resumed_commit
+            logger.info('Resuming commit %s. Hashes of %s changed files were already '
+                        'inserted', commit, applied_files)
+          else:
+            # the commit is marked as complete only once hashes of all of its changed files
+            # are inserted, so it is resumed if syncing is killed before its first batch is
+            # inserted
+            with serialized_writes():
+              current_commit, created = Commit.objects.get_or_create(
+                  publication=publication, sha=commit, date=date,
+                  defaults={'applied_files': 0})
+            if created:
+              logger.debug('Inserting commit sha=%s, date=%s into publication %s', commit,
+                           date, publication.name)
+            else:
+              logger.info('Commit %s already inserted', commit)
+              for _ in commit_files:
+                pass
+              continue
+
+          applied_before = current_commit.applied_files
+          try:
+            completed = _insert_diff_hashes(publication, current_commit, commit_files,
+                                            open_hashes, batch_tracker,
+                                            applied_files=applied_files, deadline=deadline)
+          except Exception as e:
+            logger.error('And error occurred while inserting hashes of commit %s: %s',
+                         current_commit, str(e))
+            if current_commit.applied_files:
+              # Keeps the commit and hashes which were already inserted
+              logger.info('Syncing of commit %s will be resumed after %s changed files',
+                          current_commit, current_commit.applied_files)
+              raise
+            # Deletes commit and its hashes, but keeps paths. Hashes closed by the commit
+            # become valid again
+            logger.debug('Deleting commit %s', current_commit)
+            try:
+              with serialized_writes(), transaction.atomic():
+                Hash.objects.filter(end_commit=current_commit) \
+                    .update(end_commit=None, valid_to=None)
+                current_commit.delete()
+              logger.debug('Successfully deleted commit %s', current_commit)
+            except Exception as e:
+              logger.error('And error occurred while deleting commit %s', current_commit)
+              raise
+            raise
+          finally:
+            # hashes of a failed or interrupted commit are inserted in batches, which are
+            # visible before the commit is complete
+            if current_commit.applied_files not in (None, applied_before):
+              auth_cache.bump_sync_generation()
+
+        if not completed:
+          logger.info('Time budget exhausted. Syncing of commit %s will be resumed after %s '
+                      'changed files', current_commit, current_commit.applied_files)
+          return False
+
+        logger.info('Successfully inserted hashes of commit %s', current_commit)
+        auth_cache.bump_sync_generation()
+  return True
+
+
+def _insert_seeded_commit(publication, seed_commit, commit, date, hashed_files, batch_tracker):
+  """
+  <Purpose>
+    Insert the first commit of a publication which is seeded from another publication.
+    Seeding is not resumable, so the commit is created, the publication is seeded and hashes
+    of files changed since `seed_commit` are inserted in a single transaction, which is
+    rolled back if syncing fails or is killed. Other publications can not write to an
+    SQLite database until the transaction is committed
+  <Arguments>
+    publication:
+      Publication which is being seeded
+    seed_commit:
+      Last commit of the publication whose paths and hashes are copied
+    commit:
+      SHA of the first commit of the seeded publication
+    date:
+      Date of the first commit
+    hashed_files:
+      An iterable of files which were changed between `seed_commit` and `commit`, together
+      with their hashes, as returned by `_hash_changed_files`
+    batch_tracker:
+      `BatchMemoryTracker` which decides when collected paths and hashes are inserted
+  <Returns>
+    A tuple of the inserted commit and `OpenHashIndex` of the seeded publication
+  """
+  try:
+    with serialized_writes(), transaction.atomic():
+      current_commit = Commit.objects.create(publication=publication, sha=commit, date=date,
+                                             applied_files=0)
+      logger.debug('Inserting commit sha=%s, date=%s into publication %s', commit, date,
+                   publication.name)
+      with profiling.stage(profiling.SEED):
+        _seed_publication(publication, seed_commit, current_commit)
+      open_hashes = OpenHashIndex.load(publication)
+      _insert_diff_hashes(publication, current_commit, hashed_files, open_hashes,
+                          batch_tracker, seeded=True)
+  except Exception as e:
+    logger.error('An error occurred while seeding publication %s at commit %s, seeding was '
+                 'rolled back: %s', publication.name, commit, str(e))
+    raise
+  return current_commit, open_hashes
+
+
+def _hash_in_background():
+  """
+  Return True if files should be hashed in a background thread. The producer reads memoized
+  hashes using its own connection, which would be blocked by the writer's transaction in
+  case of SQLite, so there files are hashed in the current thread, right before their
+  hashes are inserted
+  """
+  return connection.vendor != 'sqlite'
+
+
+def _deadline_passed(deadline):
+  return deadline is not None and deadline.passed()
 
+
+def _plan_commits(publication, commits_data, prev_commit_sha, resumed_commit=None):
+  """
+  <Purpose>
+    Find commits which have not been inserted yet and the commits they should be compared
+    to, so that their changed files can be listed and hashed ahead of inserting them
+  <Arguments>
+    publication:
+      Publication whose commits are being synced
+    commits_data:
+      A list of commits data of the publication's branch
+    prev_commit_sha:
+      SHA of the last inserted commit of the publication, of the commit of another
+      publication from which it is seeded, or emtpy tree sha
+    resumed_commit:
+      Already inserted commit whose syncing was interrupted, if any. It is planned first,
+      regardless of the commits data
+  <Returns>
+    A list of (commit sha, date, previous commit sha, number of already applied changed
+    files) tuples. If date of a commit is not specified, it is the last planned commit and
+    its date is None
+  """
+  inserted_commits = set(Commit.objects.filter(publication=publication)
+                         .values_list('sha', flat=True))
+  planned_commits = []
+  if resumed_commit is not None:
+    planned_commits.append((resumed_commit.sha, resumed_commit.date, prev_commit_sha,
+                            resumed_commit.applied_files))
+    prev_commit_sha = resumed_commit.sha
   for commit_data in commits_data:
     commit = commit_data["commit"]
     # if this is not a new publication, the first branch commit passed to synchashes is expected
     # to be the last successfully inserted commit
-    if prev_commit is None:
-      prev_commit = commit
+    if commit in inserted_commits:
+      logger.info('Commit %s already inserted', commit)
       continue
     commit_info = commit_data.get("custom")
     if "codified-date" in commit_info:
@@ -150,38 +490,146 @@ def _sync_hashes_for_publication(repo, publication, commits_data):
     elif "build-date" in commit_info:
       date = commit_info["build-date"]
     else:
-      logger.error("Could not insert commit %s. Date not specified", commit)
-      raise ValueError(f"Could not insert commit {commit}. Date not specified")
+      planned_commits.append((commit, None, prev_commit_sha, 0))
+      break
+    planned_commits.append((commit, date, prev_commit_sha, 0))
+    prev_commit_sha = commit
+  return planned_commits
 
-    logger.debug('Current commit: %s', commit)
 
-    current_commit, created = Commit.objects.get_or_create(
-        publication=publication, sha=commit, date=date)
-    if created:
-      logger.debug('Inserting commit sha=%s, date=%s into publication %s', commit, date,
-                   publication.name)
-      current_commit.save()
-    else:
-      logger.info('Commit %s already inserted', commit)
+def _hash_files_of_commits(repo, planned_commits, blob_reader, hashing_stage,
+                           publication_profile=None):
+  """
+  <Purpose>
+    List and hash files changed by each of the planned commits, using git diff
+  <Arguments>
+    repo:
+      Git repository whose commits are being synced
+    planned_commits:
+      A list of (commit sha, date, previous commit sha, number of already applied changed
+      files) tuples. Already applied files are skipped
+    blob_reader:
+      `GitBlobReader` of the repository, used to read content of added and modified files
+    hashing_stage:
+      `HashingStage` which calculates hashes of added and modified files
+    publication_profile:
+      `PublicationProfile` into which time spent in listing and hashing of files of each
+      commit is recorded, or None
+  <Returns>
+    A generator of hashed files, as returned by `_hash_changed_files`. Files of each commit
+    are followed by None
+  """
+  for commit, date, prev_commit_sha, applied_files in planned_commits:
+    if date is None:
+      return
+    logger.debug('Hashing files changed between commits %s and %s', prev_commit_sha, commit)
+    with profiling.recording(publication_profile, commit):
+      # git diff lists files in the same order every time
+      diff_entries = profiling.profiled_iter(
+          profiling.GIT_DIFF, iter_diff_entries(repo.git_dir, prev_commit_sha, commit))
+      changed_files = islice(_filter_changed_files(diff_entries), applied_files, None)
+      yield from _hash_changed_files(changed_files, blob_reader, hashing_stage)
+      yield None
+
+
+def _find_seed_commit(repo, publication):
+  """
+  <Purpose>
+    Find the last commit of the closest already synced publication of the same repository,
+    which precedes the given publication. Publications whose last commit was only partly
+    synced are skipped, since their open hashes are incomplete
+  <Arguments>
+    repo:
+      Git repository
+    publication:
+      New publication
+  <Returns>
+    The found commit, or None if there is no such commit or it does not exist in the
+    git repository
+  """
+  seed_commit = None
+  preceding_publications = (
+      Publication.objects
+      .filter(repository=publication.repository, name__lt=publication.name)
+      .order_by('-name')
+  )
+  for preceding_publication in preceding_publications.iterator():
+    last_commit = (
+        Commit.objects
+        .filter(publication=preceding_publication, revoked=False)
+        .order_by('-id')
+        .first()
+    )
+    if last_commit is None:
       continue
+    if last_commit.applied_files is not None:
+      logger.info('Not seeding publication %s from publication %s, syncing of its commit %s '
+                  'was interrupted', publication.name, preceding_publication.name,
+                  last_commit.sha)
+      continue
+    # the publication is already loaded
+    last_commit.publication = preceding_publication
+    seed_commit = last_commit
+    break
 
-    try:
-      _insert_diff_hashes(publication, repo, prev_commit, current_commit)
-    except Exception as e:
-      # Deletes commit and its hashes, but keeps paths
-      logger.error('And error occurred while inserting hashes of commit %s: %s',
-                   current_commit, str(e))
-      logger.debug('Deleting commit %s', current_commit)
-      try:
-        current_commit.delete()
-        logger.debug('Successfully deleted commit %s', current_commit)
-      except Exception as e:
-        logger.error('And error occurred while deleting commit %s', current_commit)
-        raise
-      raise
+  if seed_commit is None:
+    logger.info('There is no synced publication which precedes publication %s',
+                publication.name)
+    return None
 
-    logger.info('Successfully inserted hashes of commit %s', current_commit)
-    prev_commit = current_commit
+  try:
+    repo.git.cat_file('-e', f'{seed_commit.sha}^{{commit}}')
+  except GitCommandError:
+    logger.warning('Commit %s of publication %s does not exist in the repository',
+                   seed_commit.sha, seed_commit.publication.name)
+    return None
+
+  logger.info('Seeding publication %s from publication %s, commit %s', publication.name,
+              seed_commit.publication.name, seed_commit.sha)
+  return seed_commit
+
+
+def _seed_publication(publication, seed_commit, current_commit):
+  """
+  <Purpose>
+    Copy paths and current hashes of files which exist at `seed_commit` (which belongs to
+    another publication) to the given publication. Copied hashes are valid since
+    `current_commit`, which is the first commit of the publication. Hashes and paths of
+    files which changed between these two commits are then replaced by applying the
+    diff between them. Copying is done using set-based SQL, without loading rows.
+  <Arguments>
+    publication:
+      Publication which is being seeded
+    seed_commit:
+      Last commit of the publication whose paths and hashes are copied
+    current_commit:
+      The first commit of the seeded publication
+  """
+  path_table = connection.ops.quote_name(Path._meta.db_table)
+  hash_table = connection.ops.quote_name(Hash._meta.db_table)
+  with serialized_writes(), transaction.atomic(), connection.cursor() as cursor:
+    # paths which already exist (if seeding was previously interrupted) are not copied again
+    cursor.execute(
+        f'INSERT INTO {path_table} (filesystem, url, search_path, citation, publication_id) '
+        f'SELECT p.filesystem, p.url, p.search_path, p.citation, %s FROM {path_table} p '
+        f'WHERE p.publication_id = %s '
+        f'AND EXISTS (SELECT 1 FROM {hash_table} h '
+        f'WHERE h.path_id = p.id AND h.end_commit_id IS NULL) '
+        f'AND NOT EXISTS (SELECT 1 FROM {path_table} np '
+        f'WHERE np.publication_id = %s AND np.filesystem = p.filesystem)',
+        [publication.id, seed_commit.publication_id, publication.id])
+    logger.debug('Copied %s paths', cursor.rowcount)
+
+    cursor.execute(
+        f'INSERT INTO {hash_table} '
+        f'(value, hash_type, path_id, start_commit_id, end_commit_id, valid_from, valid_to) '
+        f'SELECT h.value, h.hash_type, np.id, %s, NULL, %s, NULL FROM {hash_table} h '
+        f'INNER JOIN {path_table} op ON op.id = h.path_id '
+        f'INNER JOIN {path_table} np ON np.filesystem = op.filesystem '
+        f'AND np.publication_id = %s '
+        f'WHERE op.publication_id = %s AND h.end_commit_id IS NULL',
+        [current_commit.id, current_commit.date, publication.id, seed_commit.publication_id])
+    logger.debug('Copied %s hashes', cursor.rowcount)
 
 
 def _find_all_publication_branches(repo):
@@ -242,133 +690,150 @@ def _check_if_valid_publication_branch_name(branch_name):
   return True
 
 
-def _insert_diff_hashes(publication, repo, prev_commit, current_commit):
+def _insert_diff_hashes(publication, current_commit, hashed_files, open_hashes, batch_tracker,
+                        seeded=False, applied_files=0, deadline=None):
   """
   <Purpose>
     Inserts and updates hashes for each document that was added, modified
-    or deleted in the specified commit `current_commit`. Uses git diff
-    to find the difference between previous commit `prev_commit` and `current_commit`.
+    or deleted in the specified commit `current_commit`.
   <Arguments>
     publication:
       Publication to which the inserted hashes belong
-    repo:
-      Git repository whose commits and hashes and being inserted into the database
-    prev_commit:
-      Previous commit, which was already inserted into the database, or emtpy tree sha
-      if there is no previous commit
     current_commit:
       The current commit
+    hashed_files:
+      An iterable of files which were changed between the previous commit and
+      `current_commit`, together with their hashes, as returned by `_hash_changed_files`
+    open_hashes:
+      `OpenHashIndex` of the publication. Used to find hashes of modified and deleted
+      files and updated as hashes are inserted and updated
+    batch_tracker:
+      `BatchMemoryTracker` which decides when collected paths and hashes are inserted
+      into the database
+    seeded:
+      Whether the publication was seeded from another publication whose last commit is
+      `prev_commit`. In that case, hashes of modified and deleted files which were
+      copied from that publication are replaced instead of being marked as valid until
+      `current_commit`
+    applied_files:
+      Number of changed files whose hashes were inserted before syncing of `current_commit`
+      was interrupted. These files are not included in `hashed_files`
+    deadline:
+      `Deadline` after which the current batch is inserted and syncing is stopped, or
+      None. Ignored if the publication was seeded at `current_commit`
+  <Returns>
+    True if hashes of all changed files were inserted, False if syncing was stopped
+    because the deadline passed. The number of changed files whose hashes were inserted
+    is stored in `current_commit.applied_files` until all of them are inserted
   """
-  logger.debug('Inserting diff hashes. Previous commit {} current commit {}'
-               .format(prev_commit, current_commit))
+  logger.debug('Inserting diff hashes. Current commit {}'.format(current_commit))
 
   # keep track of paths of new files
   # these path have to be inserted into the database
   added_files_paths = []
-  # query hashes which were updated or deleted
-  # in case of some databases (e.g. sqlite which is used for testing) iterator raises an
-  # exception if there are over 1000 results
-  # so, we need to separate one big query into multiple smaller one
-  hashes_queries = []
-  current_query = None
-  current_query_length = 0
-  doc = None
+  # keep track of paths of modified and deleted files
+  # their latest hashes have to be updated
+  changed_files_paths = []
+  # paths of modified files are used to find or create paths of their new hashes if they
+  # have no open hashes. If the publication was seeded, copied paths of modified files have
+  # to be updated and copied paths of deleted files have to be removed
+  modified_files_paths = []
+  deleted_files_paths = []
   # a dictionary which maps path, type tuples to hashes
-  hashes_by_paths_and_types = {}
   # keep track of new hashes which should be inserted into the database
+  hashes_by_paths_and_types = {}
 
-  diff = repo.git.diff('--name-status', '--no-renames', prev_commit.sha, current_commit.sha)
-  diff_names = diff.split('\n')
-
-  for changed_file in diff_names:
-    # git diff contains list of entries in the form of
-    # M/A/D file_path
-    if not changed_file:
-      continue
-    action, file_path = changed_file.split(maxsplit=1)
-    file_path = pathlib.Path(file_path)
-    file_type = file_path.suffix.strip('.')
-    if file_type not in SUPPORTED_TYPES:
-      continue
-
-    path_parts = file_path.parts[:-1]
-    if any((path_part[0] in ('_', '.') for path_part in path_parts)):
-      continue
-
-    posix_path = file_path.as_posix()
-
-    # Unless the file was deleted, we need to read its content in order to calculate
-    # its hash(es) and, if the file is an html file which was added, to read its url
-    if action != 'D':
-      file_content, doc = _get_file_content_and_document(repo, current_commit.sha,
-                                                         posix_path, file_type)
+  # Changed files are processed as a stream: files listed by git diff are filtered, read and
+  # hashed in batches, while git is still listing the remaining ones. New hashes are
+  # inserted into the database whenever enough of them are collected
+  # keep track of hashes which should be memoized
+  new_hash_memos = []
+  batch_tracker.reset()
+
+  # seeding of a publication is not resumable, so its first commit is always inserted as a
+  # whole, in the transaction which seeds the publication
+  if seeded:
+    deadline = None
+  for action, posix_path, blob_oid, file_type, file_hashes, memoized in hashed_files:
+    if file_hashes is not None and not memoized:
+      new_hash_memos.append(_to_hash_memo(blob_oid, file_type, file_hashes))
 
     if action == 'A':
-      # If a new file was added, create a new path object. Calculating url here might be unnecessary
-      # (in cases when the path already exists), but it's probably better to do that than to have
-      # to store doc object to be used later. It is probably far more likely that the path
-      # will have to be created than not
-      url = _get_url(posix_path, file_type, doc)
-      try:
-        search_path = doc.xpath('.//@data-search-path')[-1] if doc is not None else None
-      except IndexError:
-        doc_title = doc.xpath('//title/text()')
-        logger.debug('Document with title %s does not contain data-search-path!\n', doc_title)
-
-        search_path = None
-
-      added_files_paths.append({'filesystem': posix_path, 'url': url, 'publication': publication,
-                                'search_path': search_path})
+      # If a new file was added, create a new path object. Its url and search path were read
+      # by the hashing stage
+      url = get_url(posix_path, file_type, file_hashes.meta_url)
+      added_files_paths.append({'filesystem': posix_path, 'url': url,
+                                'publication': publication,
+                                'search_path': file_hashes.search_path})
     else:
       # If the file was modified or deleted, it is necessary to update its latest hash
-      hash_query = Q(path__publication=publication,
-                     path__filesystem=posix_path,
-                     end_commit__isnull=True)
-      if not current_query_length:
-        current_query = hash_query
-        current_query_length = 1
-      else:
-        current_query = current_query | hash_query
-
-      if current_query_length == MAX_QUERIES:
-        hashes_queries.append(current_query)
-        current_query = None
-        current_query_length = 0
-      else:
-        current_query_length += 1
+      changed_files_paths.append(posix_path)
+      if action == 'M':
+        url = get_url(posix_path, file_type, file_hashes.meta_url)
+        modified_files_paths.append({'filesystem': posix_path, 'url': url,
+                                     'search_path': file_hashes.search_path})
+      elif seeded:
+        deleted_files_paths.append(posix_path)
 
     if action != 'D':
-      bitstream_hash, rendered_hash = _calculate_file_hashes(file_content, doc, file_type)
-      hashes_by_paths_and_types[(posix_path, Hash.BITSTREAM)] = bitstream_hash
-      if rendered_hash is not None:
-        hashes_by_paths_and_types[(posix_path, Hash.RENDERED)] = rendered_hash
-
-    # limit size of hashes_by_paths_and_types
-    if sys.getsizeof(hashes_by_paths_and_types) >= MAX_HASHES_LIST_SIZE_IN_BYTES:
-      # insert into db
-      if current_query is not None:
-        hashes_queries.append(current_query)
-      _add_and_update_paths_and_hashes(current_commit, hashes_queries,
-                                       hashes_by_paths_and_types,
-                                       added_files_paths)
+      hashes_by_paths_and_types[(posix_path, Hash.BITSTREAM)] = PendingHash(
+          file_hashes.bitstream)
+      if file_hashes.rendered is not None:
+        hashes_by_paths_and_types[(posix_path, Hash.RENDERED)] = PendingHash(
+            file_hashes.rendered)
+      batch_tracker.add(posix_path, blob_oid, file_hashes.bitstream, file_hashes.rendered,
+                        file_hashes.meta_url, file_hashes.search_path)
+    else:
+      batch_tracker.add(posix_path)
+
+    applied_files += 1
+    # limit memory used by the batch
+    stopped = _deadline_passed(deadline)
+    if batch_tracker.is_full() or stopped:
+      # insert into db, together with the number of changed files whose hashes were inserted
+      with serialized_writes():
+        with profiling.stage(profiling.MEMO_WRITES, len(new_hash_memos)):
+          _memoize_files_hashes(new_hash_memos)
+        _add_and_update_paths_and_hashes(current_commit, open_hashes, changed_files_paths,
+                                         hashes_by_paths_and_types,
+                                         added_files_paths, seeded,
+                                         modified_files_paths, deleted_files_paths,
+                                         applied_files=applied_files)
+      current_commit.applied_files = applied_files
       # reset variables
-      current_query = None
-      current_query_length = 0
-      hashes_queries.clear()
+      changed_files_paths.clear()
       hashes_by_paths_and_types.clear()
       added_files_paths.clear()
+      modified_files_paths.clear()
+      deleted_files_paths.clear()
+      new_hash_memos.clear()
+      batch_tracker.flushed(current_commit)
+      if stopped:
+        return False
 
   # insert into db
-  if len(hashes_by_paths_and_types) > 0:
-    if current_query is not None:
-      hashes_queries.append(current_query)
-    _add_and_update_paths_and_hashes(current_commit, hashes_queries, hashes_by_paths_and_types,
-                                     added_files_paths)
+  # hashes of deleted files have to be updated even if there are no new hashes
+  if hashes_by_paths_and_types or changed_files_paths:
+    with serialized_writes():
+      with profiling.stage(profiling.MEMO_WRITES, len(new_hash_memos)):
+        _memoize_files_hashes(new_hash_memos)
+      _add_and_update_paths_and_hashes(current_commit, open_hashes, changed_files_paths,
+                                       hashes_by_paths_and_types, added_files_paths, seeded,
+                                       modified_files_paths, deleted_files_paths)
+    current_commit.applied_files = None
+    batch_tracker.flushed(current_commit)
+  elif current_commit.applied_files is not None:
+    with serialized_writes():
+      Commit.objects.filter(id=current_commit.id).update(applied_files=None)
+    current_commit.applied_files = None
+  return True
 
 
 @transaction.atomic
-def _add_and_update_paths_and_hashes(current_commit, hashes_queries, hashes_by_paths_and_types,
-                                     added_files_paths):
+def _add_and_update_paths_and_hashes(current_commit, open_hashes, changed_files_paths,
+                                     hashes_by_paths_and_types, added_files_paths, seeded=False,
+                                     modified_files_paths=None, deleted_files_paths=None,
+                                     applied_files=None):
   """
   <Purpose>
     Inserts the current commit and all new paths and hashes into the database. Modifies
@@ -378,204 +843,372 @@ def _add_and_update_paths_and_hashes(current_commit, hashes_queries, hashes_by_p
       Current repo commit. Added hashes will have that commit as their start commit. In case
       of modification and removal of files, this commit will be set as the end commit of the
       appropriate hashes.
-    hashes_queries:
-      Django's Q object which combines query statements each of which retrieves one hash
-      from the database.
+    open_hashes:
+      `OpenHashIndex` of the publication, used to find the latest hashes of modified and
+      deleted files. Updated once the hashes are inserted and updated.
+    changed_files_paths:
+      A list of filesystem paths of modified and deleted files.
     hashes_by_paths_and_types:
       A dictionary which contains all new hashes which should be inserted into the database.
       These hashes are created either when a new file is added at a revision. Keys are
-      tuples (filesystem_path, hash_type). Values are hash objects.
+      tuples (filesystem_path, hash_type). Values are `PendingHash` objects.
     added_files_paths:
       A list of dictionaries, where each dictionary contains information of one path object
       which is to be inserted into the database.
+    seeded:
+      Whether hashes of modified and deleted files were copied from another publication
+      at the current commit. If True, these hashes are deleted instead of being updated.
+    modified_files_paths:
+      A list of dictionaries with filesystem path, url and search path of each modified
+      file. Used to find or create paths of new hashes of modified files which have no
+      open hash of the same type and, if `seeded` is True, to update copied paths.
+    deleted_files_paths:
+      A list of filesystem paths of deleted files whose paths were copied from another
+      publication. Only used if `seeded` is True.
+    applied_files:
+      Number of changed files of the current commit whose hashes are inserted once this
+      batch is inserted, or None if hashes of all of them are inserted. Stored so that
+      syncing of the commit can be resumed.
   """
 
-  logger.debug('Inserting or updating hashes. hashes_queries number: %s, added_files_paths '
-               'number: %s', len(hashes_queries), len(added_files_paths))
-  logger.debug('hashes_by_paths_and_types size: %s KB',
-               sys.getsizeof(hashes_by_paths_and_types) / 1024)
-
-  if len(hashes_queries):
-    # find all hashes which were modified or deleted
-
-    def _get_hashes_pending_update():
-      for hashes_query in hashes_queries:
-        hashes_to_update = Hash.objects.filter(hashes_query).iterator()
-        for h in hashes_to_update:
-          path_and_hash = (h.path.filesystem, h.hash_type)
-          new_hash = hashes_by_paths_and_types.get(path_and_hash)
-          if new_hash is not None:
-            # hash was modified
-            if new_hash.value == h.value:
-              # do not update the existing hash and insert a new one if it remained unchanged
-              # this can only happen in case of rendered hashes
-              del hashes_by_paths_and_types[path_and_hash]
-            else:
-              new_hash.path = h.path
-              new_hash.start_commit = current_commit
-              h.end_commit = current_commit
-              yield h
-          else:
-            # file deleted
-            h.end_commit = current_commit
-            yield h
-
-    Hash.objects.bulk_update(_get_hashes_pending_update(), ['end_commit'], batch_size=2000)
+  logger.debug('Inserting or updating hashes. changed_files_paths number: %s, '
+               'added_files_paths number: %s', len(changed_files_paths),
+               len(added_files_paths))
+  logger.debug('hashes_by_paths_and_types number: %s', len(hashes_by_paths_and_types))
+
+  # find all hashes which were modified or deleted
+  # if the publication was seeded at the current commit, hashes of modified and deleted
+  # files were copied from another publication and are not valid at the current commit
+  hashes_to_close = []
+  hashes_to_delete = []
+  closed_hashes_keys = []
+  for filesystem in changed_files_paths:
+    for hash_type in (Hash.BITSTREAM, Hash.RENDERED):
+      open_hash = open_hashes.get(filesystem, hash_type)
+      if open_hash is None:
+        continue
+      new_hash = hashes_by_paths_and_types.get((filesystem, hash_type))
+      if new_hash is not None:
+        # hash was modified
+        if new_hash.value == open_hash.value:
+          # do not update the existing hash and insert a new one if it remained unchanged
+          # this can only happen in case of rendered hashes
+          del hashes_by_paths_and_types[(filesystem, hash_type)]
+          continue
+        new_hash.path_id = open_hash.path_id
+      # otherwise, the file was deleted
+      closed_hashes_keys.append((filesystem, hash_type))
+      if seeded:
+        hashes_to_delete.append(open_hash.id)
+      else:
+        hashes_to_close.append(open_hash.id)
+
+  with profiling.stage(profiling.INTERVAL_CLOSES, len(hashes_to_close)):
+    close_hash_intervals(hashes_to_close, current_commit)
+
+  with profiling.stage(profiling.HASH_DELETES, len(hashes_to_delete)):
+    for index in range(0, len(hashes_to_delete), MAX_QUERIES):
+      Hash.objects.filter(id__in=hashes_to_delete[index:index + MAX_QUERIES]).delete()
+
+  modified_files_paths = modified_files_paths or []
+  if seeded:
+    deleted_files_paths = deleted_files_paths or []
+    with profiling.stage(profiling.PATH_WRITES,
+                         len(modified_files_paths) + len(deleted_files_paths)):
+      for path in modified_files_paths:
+        Path.objects.filter(publication=current_commit.publication,
+                            filesystem=path['filesystem']) \
+            .update(url=path['url'], search_path=path['search_path'])
+      for index in range(0, len(deleted_files_paths), MAX_QUERIES):
+        Path.objects.filter(publication=current_commit.publication,
+                            filesystem__in=deleted_files_paths[index:index + MAX_QUERIES]) \
+            .delete()
 
   if added_files_paths:
-    for path in added_files_paths:
-      # when inside a transaction, this should also be executed in batches
-      # see https://stackoverflow.com/questions/3395236/aggregating-saves-in-django
-      db_path, _ = Path.objects.get_or_create(**path)
+    with profiling.stage(profiling.PATH_WRITES, len(added_files_paths)):
+      db_paths = _get_or_create_paths(current_commit.publication, added_files_paths)
+    for db_path in db_paths:
       for hash_type in (Hash.RENDERED, Hash.BITSTREAM):
         h = hashes_by_paths_and_types.get((db_path.filesystem, hash_type))
         if h is not None:
-          h.path = db_path
-          h.start_commit = current_commit
+          h.path_id = db_path.id
+
+  _set_missing_paths(current_commit.publication, open_hashes, hashes_by_paths_and_types,
+                     modified_files_paths)
 
   # insert all new hashes (corresponding to both new and modified files) into the database
-  Hash.objects.bulk_create(hashes_by_paths_and_types.values())
+  with profiling.stage(profiling.HASH_INSERTS, len(hashes_by_paths_and_types)):
+    _insert_pending_hashes(current_commit, hashes_by_paths_and_types)
 
+  if applied_files != current_commit.applied_files:
+    Commit.objects.filter(id=current_commit.id).update(applied_files=applied_files)
 
-def _calculate_file_hashes(file_content, doc, file_type):
+  # update the index of open hashes
+  for filesystem, hash_type in closed_hashes_keys:
+    open_hashes.remove(filesystem, hash_type)
+  _add_open_hashes(open_hashes, current_commit, hashes_by_paths_and_types)
+
+
+def _set_missing_paths(publication, open_hashes, hashes_by_paths_and_types,
+                       modified_files_paths):
   """
   <Purpose>
-    Calculate bitstream and rendered hash of a file
+    Set paths of new hashes of modified files which had no open hash of the same type,
+    e.g. if hashes copied from another publication lack that type. Paths are taken from
+    open hashes of the other type, or found or created using paths of the modified files
   <Arguments>
-    file_content:
-      Full content of the file
-    doc:
-      lxml document corresponding to the file (if the file is an html file)
-  <Returns>
-    bitstream hash, rendered hash
+    publication:
+      Publication to which the hashes belong
+    open_hashes:
+      `OpenHashIndex` of the publication
+    hashes_by_paths_and_types:
+      A dictionary which maps (filesystem path, hash type) tuples to `PendingHash` objects
+    modified_files_paths:
+      A list of dictionaries with filesystem path, url and search path of each modified file
   """
-  # calculate bitstream hash
-  hash_value = calc_hash(file_content, file_type)
-  bitstream_hash = Hash(value=hash_value, hash_type=Hash.BITSTREAM)
-
-  rendered_hash = None
-  if doc is not None:
-    # this is an html file, calculate its rendered hash
-    auth_div = get_auth_div_content(doc)
-    if auth_div is not None:
-      rendered_hash_value = calc_hash(et_html.tostring(auth_div, encoding="utf-8"), file_type)
-      rendered_hash = Hash(value=rendered_hash_value, hash_type=Hash.RENDERED)
+  missing_paths = {}
+  for (filesystem, hash_type), new_hash in hashes_by_paths_and_types.items():
+    if new_hash.path_id is not None:
+      continue
+    other_type = Hash.RENDERED if hash_type == Hash.BITSTREAM else Hash.BITSTREAM
+    other_hash = open_hashes.get(filesystem, other_type)
+    if other_hash is not None:
+      new_hash.path_id = other_hash.path_id
+    else:
+      missing_paths.setdefault(filesystem, []).append(new_hash)
+  if not missing_paths:
+    return
 
-  return bitstream_hash, rendered_hash
+  logger.debug('Finding paths of %s modified files without open hashes', len(missing_paths))
+  files_paths = [dict(path, publication=publication) for path in modified_files_paths
+                 if path['filesystem'] in missing_paths]
+  with profiling.stage(profiling.PATH_WRITES, len(files_paths)):
+    db_paths = _get_or_create_paths(publication, files_paths)
+  for db_path in db_paths:
+    for new_hash in missing_paths[db_path.filesystem]:
+      new_hash.path_id = db_path.id
 
 
-def _calculate_html_url(path):
+def _insert_pending_hashes(current_commit, hashes_by_paths_and_types):
+  """
+  <Purpose>
+    Insert pending hashes into the database using bulk inserts and set their ids, if
+    the database returns them. Model instances only exist while their batch is inserted
+  <Arguments>
+    current_commit:
+      The current commit, start commit of the inserted hashes
+    hashes_by_paths_and_types:
+      A dictionary which maps (filesystem path, hash type) tuples to `PendingHash` objects
+  """
+  keys = list(hashes_by_paths_and_types)
+  for index in range(0, len(keys), MAX_HASHES_PER_INSERT):
+    batch_keys = keys[index:index + MAX_HASHES_PER_INSERT]
+    new_hashes = Hash.objects.bulk_create([
+        Hash(value=hashes_by_paths_and_types[key].value, hash_type=key[1],
+             path_id=hashes_by_paths_and_types[key].path_id, start_commit=current_commit,
+             valid_from=current_commit.date)
+        for key in batch_keys
+    ])
+    for key, new_hash in zip(batch_keys, new_hashes):
+      hashes_by_paths_and_types[key].id = new_hash.pk
+
+
+def _add_open_hashes(open_hashes, current_commit, hashes_by_paths_and_types):
   """
   <Purpose>
-    Calculate URL of an html file which does not have a org:url property based on its
-    filesystem path.
+    Add hashes inserted at the current commit to the index of open hashes
   <Arguments>
-    path:
-      filesystem path of an html file
+    open_hashes:
+      `OpenHashIndex` of the publication
+    current_commit:
+      The current commit, start commit of the inserted hashes
+    hashes_by_paths_and_types:
+      A dictionary which maps (filesystem path, hash type) tuples to the inserted
+      `PendingHash` objects
+  """
+  hashes_ids = {}
+  new_hashes = list(hashes_by_paths_and_types.values())
+  if new_hashes and new_hashes[0].id is None:
+    # primary keys are not returned by all databases, e.g. sqlite
+    paths_ids = list({h.path_id for h in new_hashes})
+    for index in range(0, len(paths_ids), MAX_QUERIES):
+      hashes_ids.update(
+          ((path_id, hash_type), hash_id) for hash_id, path_id, hash_type in
+          Hash.objects
+          .filter(start_commit=current_commit, path_id__in=paths_ids[index:index + MAX_QUERIES])
+          .values_list('id', 'path_id', 'hash_type')
+      )
+
+  for (filesystem, hash_type), h in hashes_by_paths_and_types.items():
+    hash_id = h.id if h.id is not None else hashes_ids.get((h.path_id, hash_type))
+    open_hashes.add(filesystem, hash_type, hash_id, h.value, h.path_id)
+
+
+def _get_or_create_paths(publication, files_paths):
+  """
+  <Purpose>
+    Find or create paths of the given files in batches. Existing paths are found by one
+    query per batch and the remaining ones are inserted using bulk create.
+  <Arguments>
+    publication:
+      Publication to which the paths belong
+    files_paths:
+      A list of dictionaries, where each dictionary contains information of one path object
   <Returns>
-    Calculated URL
+    A list of path objects which were found or created
   """
-  if 'index.html' in path:
-    url = path.split('index.html')[0]
-    if url:
-      return url.rsplit('/', 1)[0]
-  return path.rsplit('.', 1)[0]
-
-
-def _get_file_content_and_document(repo, commit_sha, file_path, file_type):
+  db_paths = []
+  for index in range(0, len(files_paths), MAX_QUERIES):
+    batch = files_paths[index:index + MAX_QUERIES]
+    filesystem_paths = [path['filesystem'] for path in batch]
+    existing_paths = set()
+    for db_path in Path.objects.filter(publication=publication,
+                                       filesystem__in=filesystem_paths):
+      existing_paths.add(db_path.filesystem)
+      db_paths.append(db_path)
+
+    new_paths = Path.objects.bulk_create([Path(**path) for path in batch
+                                          if path['filesystem'] not in existing_paths])
+    if new_paths and new_paths[0].pk is None:
+      # primary keys are not returned by all databases, e.g. sqlite
+      new_paths = Path.objects.filter(
+          publication=publication,
+          filesystem__in=[path.filesystem for path in new_paths])
+    db_paths.extend(new_paths)
+
+  logger.debug('Found or created %s paths', len(db_paths))
+  return db_paths
+
+
+def _get_memoized_files_hashes(changed_files):
   """
   <Purpose>
-    Read content of a file at a given revision. If that file is an html file,
-    also return lxml document object corresponding to that file
+    Find memoized hashes of blobs of added and modified files
   <Arguments>
-    repo:
-      Git repository
-    commit_sha:
-      Commit SHA indicating at which revision to load content of the specified file
-    file_path:
-      Path of the file which is to be read in Unix style. Relative to the root of the
-      git repository
-    <Returns>
-      (file content, lxml document)
-  """
-  doc = None
-
-  if file_type == 'html':
-    file_content = repo.git.show('{}:{}'.format(commit_sha, file_path))
-    file_content = file_content.strip().encode('utf-8', 'surrogateescape')
-    # If the file is an html file, get the document object so that it's possible to find
-    # elements such as authentication div, search path and url
-    doc = _get_document(file_content)
-  else:
-    file_content = GitRepository(path=repo.git_dir).get_file(commit_sha, file_path, raw=True)
-
-  return file_content, doc
-
-from lxml import html as et_html
-def _get_document(file_content):
+    changed_files:
+      A list of (action, filesystem path, blob id, file type) tuples
+  <Returns>
+    A dictionary which maps (blob id, file type) tuples to `FileHashes` without path
+  """
+  blobs = {(blob_oid, file_type) for action, _, blob_oid, file_type in changed_files
+           if action != 'D'}
+  blob_oids = list({blob_oid for blob_oid, _ in blobs})
+
+  memoized_files_hashes = {}
+  for index in range(0, len(blob_oids), MAX_QUERIES):
+    hash_memos = (
+        HashMemo.objects
+        .filter(blob__in=blob_oids[index:index + MAX_QUERIES], algorithm=HASH_ALGORITHM,
+                canonicalization_version=CANONICALIZATION_VERSION)
+        .values_list('blob', 'file_type', 'bitstream', 'rendered', 'meta_url', 'search_path')
+    )
+    for blob_oid, file_type, bitstream, rendered, meta_url, search_path in hash_memos:
+      if (blob_oid, file_type) in blobs:
+        memoized_files_hashes[(blob_oid, file_type)] = FileHashes(
+            None, bitstream, rendered, meta_url, search_path)
+
+  logger.debug('Found memoized hashes of %s out of %s blobs', len(memoized_files_hashes),
+               len(blobs))
+  return memoized_files_hashes
+
+
+def _to_hash_memo(blob_oid, file_type, file_hashes):
+  return HashMemo(blob=blob_oid, file_type=file_type, algorithm=HASH_ALGORITHM,
+                  canonicalization_version=CANONICALIZATION_VERSION,
+                  bitstream=file_hashes.bitstream, rendered=file_hashes.rendered,
+                  meta_url=file_hashes.meta_url, search_path=file_hashes.search_path)
+
+
+def _memoize_files_hashes(hash_memos):
+  # the same blob might have been memoized in the meantime, e.g. if it is contained
+  # by multiple files or by a publication which is being synced concurrently
+  HashMemo.objects.bulk_create(hash_memos, batch_size=MAX_QUERIES, ignore_conflicts=True)
+
+
+def _filter_changed_files(diff_entries):
   """
   <Purpose>
-    Creates an lxml document object given content of an html file.
-    Since browsers might modify html files in order to properly show them,
-    we use chrome web driver to open an html document, get the page source,
-    and create an lxml document given that page source.
+    Filter out entries of the diff which do not correspond to authenticable files, i.e. files
+    of unsupported types and files inside of directories whose names start with _ or .
   <Arguments>
-    file_content:
-      Content of an html file
+    diff_entries:
+      An iterable of (action, file path, blob id) tuples
   <Returns>
-    lxml document object
-
-  !!!
-  removing the call to chrome_driver b/c it is sometimes crashing;
-  this renders transient authentication through plugin unusable b/c not
-  standardizing
-  
-  TODO: move html hash to request time rather than batching it at update time
-  this will also solve issues that arise when results from chromedriver change
-  over time.
-  !!!
-  """
-  return et_html.fromstring(file_content)
-
-  # temp_dir = pathlib.Path(tempfile.gettempdir())
-  # # the file must have .html extension
-  # # if that is not the case, the browser will not open it correctly
-  # file_path = (temp_dir / (str(uuid.uuid4()) + '.html')).resolve()
-  # try:
-  #   with open(str(file_path), 'wb') as f:
-  #     f.write(file_content)
-  #   chrome_driver.get(f'file://{file_path}')
-  #   page_source = chrome_driver.page_source
-  #   return get_html_document(page_source)
-  # finally:
-  #   file_path.unlink()
-
-
-def _get_url(path, file_type, doc):
+    A generator of (action, filesystem path in Unix style, blob id, file type) tuples
+  """
+  for action, file_path, blob_oid in diff_entries:
+    file_path = pathlib.PurePosixPath(file_path)
+    file_type = file_path.suffix.strip('.')
+    if get_hasher(file_type) is None:
+      continue
+
+    path_parts = file_path.parts[:-1]
+    if any((path_part[0] in ('_', '.') for path_part in path_parts)):
+      continue
+
+    yield action, file_path.as_posix(), blob_oid, file_type
+
+
+def _hash_changed_files(changed_files, blob_reader, hashing_stage):
   """
   <Purpose>
-    Get URL of the given document. If the document is an html document, try to
-    read its og:url property. If there is no such property or if the document
-    if of a different type, calculate its URL based on its filesystem path.
+    Read and hash changed files in batches. Unless a file was deleted, its content has to be
+    read in order to calculate its hash(es) and, if the file is an html file, to read its
+    url and search path. That is not necessary if the file's blob was already synced before
+    (e.g. as a part of another publication), in which case its memoized hashes are reused.
+    Hashing of the next batch is started before hashes of the current one are returned, so
+    that the hashing stage is kept busy while they are being processed.
   <Arguments>
-    path:
-      Filesystem path of the file
-    file_type:
-      File's type
-    doc:
-      lxml document object. None if the file_type is not html
+    changed_files:
+      An iterable of (action, filesystem path, blob id, file type) tuples
+    blob_reader:
+      `GitBlobReader` of the repository, used to read content of added and modified files
+    hashing_stage:
+      `HashingStage` which calculates hashes of added and modified files
   <Returns>
-    URL of the file with the given filesystem path
-  """
-  url = '/' + path
-  if file_type != 'html':
-    return url
-
-  # try to get url based on content of the url property
-  meta_url = doc.xpath(".//*[contains(@property, 'og:url')]")
-  if meta_url is not None and len(meta_url):
-    url = meta_url[0].get('content')
-    url = urlparse(url).path
-  else:
-    url = _calculate_html_url(url)
-  return url
+    A generator of (action, filesystem path, blob id, file type, file hashes, memoized)
+    tuples, in the same order as the changed files. File hashes are None if the file was
+    deleted. Memoized is True if the hashes were memoized before
+  """
+  pending_batch = None
+  for batch in _batched(changed_files, MAX_QUERIES):
+    started_batch = _start_hashing(batch, blob_reader, hashing_stage)
+    if pending_batch is not None:
+      yield from _finish_hashing(*pending_batch)
+    pending_batch = started_batch
+  if pending_batch is not None:
+    yield from _finish_hashing(*pending_batch)
+
+
+def _start_hashing(changed_files, blob_reader, hashing_stage):
+  with profiling.stage(profiling.MEMO_LOOKUP, len(changed_files)):
+    memoized_files_hashes = _get_memoized_files_hashes(changed_files)
+  # files are hashed by the hashing stage (possibly in parallel) and their hashes are
+  # returned in the same order in which the files were listed
+  files_hashes = hashing_stage.hash_files(
+      blob_reader,
+      [(posix_path, blob_oid, file_type)
+       for action, posix_path, blob_oid, file_type in changed_files
+       if action != 'D' and (blob_oid, file_type) not in memoized_files_hashes])
+  return changed_files, memoized_files_hashes, files_hashes
+
+
+def _finish_hashing(changed_files, memoized_files_hashes, files_hashes):
+  for action, posix_path, blob_oid, file_type in changed_files:
+    if action == 'D':
+      yield action, posix_path, blob_oid, file_type, None, False
+      continue
+    file_hashes = memoized_files_hashes.get((blob_oid, file_type))
+    if file_hashes is None:
+      yield action, posix_path, blob_oid, file_type, next(files_hashes), False
+    else:
+      yield action, posix_path, blob_oid, file_type, file_hashes._replace(path=posix_path), True
+
+
+def _batched(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    batch = list(islice(iterator, size))
+    if not batch:
+      return
+    yield batch
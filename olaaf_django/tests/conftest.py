@@ -6,9 +6,12 @@ from pathlib import Path
 from collections import defaultdict
 
 import pytest
+from django.core.cache import caches
 from lxml import html
 from taf.git import GitRepository
 
+from olaaf_django import publication_cache
+
 
 THIS_FOLDER = Path(__file__).parent
 
@@ -125,6 +128,17 @@ def html_repository_and_input():
     (HTML_REPOSITORY_PATH / ".gitkeep").touch()
 
 
+@pytest.fixture
+def local_cache(settings):
+  """Cache authentication results and publications in an empty local-memory cache"""
+  settings.AUTHENTICATION_CACHE = 'default'
+  caches['default'].clear()
+  publication_cache.clear()
+  yield caches['default']
+  caches['default'].clear()
+  publication_cache.clear()
+
+
 @pytest.fixture
 def publications():
   return PUBLICATION_BRANCHES
@@ -0,0 +1,66 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from git import Repo
+
+from olaaf_django import HOSTS_REPOS_CACHE, auth_cache
+from olaaf_django.sync_hashes import sync_hashes
+from olaaf_django.tests.test_authentication import _get_file_content
+
+URL = '_publication/2020-01-01/_date/2019-02-02/file1.html'
+
+
+def test_authentication_results_are_cached(html_repository_and_input, local_cache,
+                                           django_assert_num_queries, db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  HOSTS_REPOS_CACHE['testserver'] = 'test/html-repo'
+  data = {'url': URL, 'content': _get_file_content(Repo(html_repository.path), URL)}
+  client = Client()
+
+  response = client.post(reverse('authenticate'), data=data)
+  assert response.content.strip().startswith(b'Authentic')
+
+  with django_assert_num_queries(0):
+    cached_response = client.post(reverse('authenticate'), data=data)
+  assert cached_response.content == response.content
+
+  auth_cache.bump_sync_generation()
+  with CaptureQueriesContext(connection) as queries:
+    client.post(reverse('authenticate'), data=data)
+  assert len(queries) > 0
+
+
+def test_sync_bumps_generation(html_repository_and_input, local_cache, db):
+  html_repository, html_repo_input = html_repository_and_input
+  generation = auth_cache.get_sync_generation()
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  assert auth_cache.get_sync_generation() > generation
+
+  # nothing is written if all hashes are already synced
+  generation = auth_cache.get_sync_generation()
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  assert auth_cache.get_sync_generation() == generation
+
+
+def test_generation_is_not_reused_once_evicted(local_cache):
+  generation = auth_cache.bump_sync_generation()
+  local_cache.delete(auth_cache.GENERATION_KEY)
+  assert auth_cache.get_sync_generation() > generation
+
+
+def test_response_key(local_cache):
+  upload = SimpleUploadedFile('doc.pdf', b'%PDF-1.4 content')
+  key = auth_cache.response_key('test/repo', 'doc.pdf', upload)
+  # the uploaded file is rewound, so that it can be hashed
+  assert upload.read() == b'%PDF-1.4 content'
+  assert key == auth_cache.response_key('test/repo', 'doc.pdf', '%PDF-1.4 content')
+  assert key != auth_cache.response_key('other/repo', 'doc.pdf', '%PDF-1.4 content')
+
+
+def test_cache_disabled_by_default():
+  assert auth_cache.response_key('test/repo', 'doc.pdf', 'content') is None
+  assert auth_cache.get_response(None) is None
+  assert auth_cache.bump_sync_generation() is None
@@ -10,8 +10,9 @@ from git import Repo
 from lxml import html
 
 from olaaf_django import HOSTS_REPOS_CACHE
-from olaaf_django.models import Commit, Publication
-from olaaf_django.sync_hashes import _get_document, sync_hashes
+from olaaf_django.hashers import get_hasher
+from olaaf_django.models import Commit, Hash, Publication
+from olaaf_django.sync_hashes import sync_hashes
 from olaaf_django.tests.conftest import _change_file_content
 
 
@@ -37,7 +38,7 @@ def _get_file_content(repo, url, change_auth_div=False):
   if change_auth_div:
     content = _change_file_content(content)
   # replace links inside html doc
-  document = _get_document(content.strip().encode('utf-8', 'surrogateescape'))
+  document = get_hasher('html').parse(content.strip().encode('utf-8', 'surrogateescape'))
   try:
     link = document.get_element_by_id("test-url")
     link.attrib['href'] = f"/{'/'.join(parts[:4])}{link.attrib['href']}"
@@ -87,3 +88,65 @@ def test_html_authentication(html_repository_and_input, publications, repo_files
         assert msg.startswith('Not authentic')
       else:
         assert msg.startswith('Authentic')
+
+
+def _check_hash_separately(file_hash):
+  hash_obj = Hash.objects.filter(value=file_hash).order_by('-path__publication_id', '-id')[0]
+  end_date = hash_obj.end_commit.date if hash_obj.end_commit else None
+  if hash_obj.path.filesystem.endswith('html'):
+    start_date = hash_obj.start_commit.date.strftime('%Y-%m-%d')
+    url = f'/_publication/{hash_obj.path.publication.name}/_date/{start_date}/{hash_obj.path.url}'
+  else:
+    url = None if end_date else f'/{hash_obj.path.url}'
+  return url, end_date is None
+
+
+def test_check_hashes(html_repository_and_input, django_assert_num_queries, db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+
+  values = sorted(set(Hash.objects.values_list('value', flat=True)))
+  data = [{'name': f'file-{index}', 'hash': value} for index, value in enumerate(values)]
+  data += [{'name': 'unknown', 'hash': '0' * 64}, {'name': 'invalid', 'hash': ['0']}]
+
+  client = Client()
+  with django_assert_num_queries(1):
+    response = client.post(reverse('check-hashes'), data, content_type='application/json')
+  results = response.json()
+
+  assert [result['name'] for result in results] == [file_info['name'] for file_info in data]
+  for value, result in zip(values, results):
+    url, current = _check_hash_separately(value)
+    assert result['authentic']
+    assert result['url'] == url
+    assert result['current'] == current
+    assert result['msg']
+  for result in results[-2:]:
+    assert not result['authentic'] and result['url'] is None and result['msg'] is None
+
+
+def test_check_hashes_max_files(settings, db):
+  settings.CHECK_HASHES_MAX_FILES = 2
+  client = Client()
+  data = [{'name': f'file-{index}', 'hash': '0' * 64} for index in range(3)]
+  response = client.post(reverse('check-hashes'), data, content_type='application/json')
+  assert response.status_code == 400
+
+  response = client.post(reverse('check-hashes'), data[:2], content_type='application/json')
+  assert response.status_code == 200
+  assert len(response.json()) == 2
+
+
+def test_check_hashes_of_host_repository(html_repository_and_input, monkeypatch, db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  data = [{'name': 'file', 'hash': Hash.objects.values_list('value', flat=True).first()}]
+  client = Client()
+
+  monkeypatch.setitem(HOSTS_REPOS_CACHE, 'testserver', 'test/html-repo')
+  response = client.post(reverse('check-hashes'), data, content_type='application/json')
+  assert response.json()[0]['authentic']
+
+  monkeypatch.setitem(HOSTS_REPOS_CACHE, 'testserver', 'test/other-repo')
+  response = client.post(reverse('check-hashes'), data, content_type='application/json')
+  assert not response.json()[0]['authentic']
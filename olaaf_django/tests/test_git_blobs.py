@@ -0,0 +1,39 @@
+import pytest
+from git import Repo
+
+from olaaf_django.git_blobs import GitBlobReader
+
+
+def test_blob_reader(html_repository_and_input, repo_files):
+  html_repository, _ = html_repository_and_input
+  repo = Repo(html_repository.path)
+
+  with GitBlobReader(repo.git_dir) as blob_reader:
+    for branch in ('publication/2020-01-01', 'publication/2020-05-05-01'):
+      for file_name in repo_files:
+        blob = repo.commit(branch).tree / file_name
+        assert blob_reader.read(blob.hexsha) == blob.data_stream.read()
+
+    with pytest.raises(ValueError):
+      blob_reader.read('0' * 40)
+    # the reader can still be used after a missing object was requested
+    blob = repo.commit('publication/2020-01-01').tree / repo_files[0]
+    assert blob_reader.read(blob.hexsha) == blob.data_stream.read()
+
+
+def test_blob_reader_chunks(html_repository_and_input, repo_files):
+  html_repository, _ = html_repository_and_input
+  repo = Repo(html_repository.path)
+  blobs = [repo.commit('publication/2020-01-01').tree / file_name for file_name in repo_files]
+
+  with GitBlobReader(repo.git_dir) as blob_reader:
+    for blob in blobs:
+      chunks = list(blob_reader.iter_chunks(blob.hexsha, chunk_size=100))
+      assert all(len(chunk) <= 100 for chunk in chunks)
+      assert b''.join(chunks) == blob.data_stream.read()
+
+    # the rest of a partially read object is skipped
+    chunks = blob_reader.iter_chunks(blobs[0].hexsha, chunk_size=10)
+    next(chunks)
+    chunks.close()
+    assert blob_reader.read(blobs[1].hexsha) == blobs[1].data_stream.read()
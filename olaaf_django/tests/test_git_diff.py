@@ -0,0 +1,83 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+from git import Git, GitCommandError, Repo
+
+from olaaf_django.git_diff import iter_diff_entries
+from olaaf_django.sync_hashes import EMPTY_TREE_SHA, _filter_changed_files
+
+FILE_NAMES = ['file.html', 'with space.html', 'tab\there.html', 'quote"d.html', 'čćž.html',
+              'new\nline.pdf', '_hidden/file.html', 'dir/file.txt']
+
+
+def _git(repo_path, *args):
+  subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@test.com', *args],
+                 cwd=repo_path, check=True, capture_output=True)
+
+
+def test_iter_diff_entries(tmp_path):
+  _git(tmp_path, 'init')
+  for file_name in FILE_NAMES:
+    file_path = tmp_path / file_name
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(f'<html><body>{file_name}</body></html>')
+  _git(tmp_path, 'add', '-A')
+  _git(tmp_path, 'commit', '-m', 'Add files')
+  (tmp_path / 'with space.html').write_text('<html><body>modified</body></html>')
+  (tmp_path / 'čćž.html').unlink()
+  _git(tmp_path, 'commit', '-am', 'Modify and delete files')
+
+  repo = Repo(tmp_path)
+  first_commit, second_commit = repo.commit('HEAD~1'), repo.commit('HEAD')
+
+  entries = list(iter_diff_entries(repo.git_dir, EMPTY_TREE_SHA, first_commit.hexsha))
+  assert sorted(entries) == sorted(('A', file_name, (first_commit.tree / file_name).hexsha)
+                                   for file_name in FILE_NAMES)
+
+  entries = list(iter_diff_entries(repo.git_dir, first_commit.hexsha, second_commit.hexsha))
+  assert sorted(entries) == [
+      ('D', 'čćž.html', '0' * 40),
+      ('M', 'with space.html', (second_commit.tree / 'with space.html').hexsha),
+  ]
+
+  changed_files = _filter_changed_files(
+      iter_diff_entries(repo.git_dir, EMPTY_TREE_SHA, first_commit.hexsha))
+  assert sorted(file_path for _, file_path, _, _ in changed_files) == sorted(FILE_NAMES[:6])
+
+
+FAILING_GIT = f"""#!{sys.executable}
+import sys
+sys.stderr.write('warning: ' + 'x' * 1024 * 1024 + '\\n')
+sys.stderr.flush()
+sys.stdout.buffer.write(b':000000 100644 {'0' * 40} {'1' * 40} A\\0file.html\\0')
+sys.exit(128)
+"""
+
+
+def test_iter_diff_entries_git_error(tmp_path, monkeypatch):
+  git_executable = tmp_path / 'git'
+  git_executable.write_text(FAILING_GIT)
+  git_executable.chmod(0o755)
+  monkeypatch.setattr(Git, 'GIT_PYTHON_GIT_EXECUTABLE', str(git_executable))
+  entries = []
+  errors = []
+
+  def _list_entries():
+    try:
+      entries.extend(iter_diff_entries(tmp_path, EMPTY_TREE_SHA, '1' * 40))
+    except GitCommandError as e:
+      errors.append(e)
+
+  # git writes more to stderr than a pipe can hold before it lists the diff
+  thread = threading.Thread(target=_list_entries, daemon=True)
+  thread.start()
+  thread.join(timeout=30)
+  if thread.is_alive():
+    pytest.fail('Listing of the diff did not finish')
+
+  assert entries == [('A', 'file.html', '1' * 40)]
+  error, = errors
+  assert error.status == 128
+  assert 'warning: xxx' in error.stderr
@@ -0,0 +1,33 @@
+import hashlib
+
+from olaaf_django.hashers import (DocumentHasher, StreamingHasher, get_hasher, register_hasher,
+                                  supported_types)
+from olaaf_django.utils import calc_hash
+
+
+def test_hashers_by_file_and_content_type():
+  assert supported_types() == ['html', 'pdf']
+  assert get_hasher('html') is get_hasher('text/html')
+  assert get_hasher('html').needs_document
+  assert get_hasher('pdf') is get_hasher('application/pdf')
+  assert not get_hasher('pdf').needs_document
+  assert get_hasher('txt') is None
+  assert get_hasher('text/plain') is None
+
+
+def test_streaming_hasher():
+  content = b'%PDF-1.4\n' + bytes(range(256)) * 1000
+  chunks = [content[i:i + 4096] for i in range(0, len(content), 4096)]
+  file_hasher = get_hasher('pdf')
+  assert file_hasher.hash_chunks(chunks) == calc_hash(content, 'pdf')
+  assert file_hasher.hash_chunks([]) == hashlib.sha256().hexdigest()
+
+
+def test_register_hasher(monkeypatch):
+  from olaaf_django import hashers
+  monkeypatch.setattr(hashers, '_hashers', dict(hashers._hashers))
+  register_hasher(StreamingHasher('png', 'image/png'))
+  register_hasher(DocumentHasher('xml', 'text/xml', lambda content: content))
+  assert supported_types() == ['html', 'pdf', 'png', 'xml']
+  assert not get_hasher('image/png').needs_document
+  assert get_hasher('xml').parse('doc') == 'doc'
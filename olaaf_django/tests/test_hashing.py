@@ -0,0 +1,37 @@
+from urllib.parse import urlparse
+
+import pytest
+from lxml import html as et_html
+
+from olaaf_django.hashers import get_hasher
+from olaaf_django.hashing import read_document_metadata
+from olaaf_django.tests.conftest import DATA
+
+
+def _read_metadata_separately(doc):
+  auth_divs = doc.xpath(".//*[contains(@class, 'tuf-authenticate')]")
+  search_paths = doc.xpath('.//@data-search-path')
+  meta_url = doc.xpath(".//*[contains(@property, 'og:url')]")
+  return (auth_divs[0] if auth_divs else None,
+          urlparse(meta_url[0].get('content')).path if meta_url else None,
+          search_paths[-1] if search_paths else None)
+
+
+@pytest.mark.parametrize('content', [
+    *(path.read_bytes() for path in sorted(DATA.rglob('*.html'))),
+    b'<html><body data-search-path="root"><div data-search-path="first"></div>'
+    b'<div class="x tuf-authenticate">a</div><div class="tuf-authenticate">b</div>'
+    b'<p data-search-path="last"></p></body></html>',
+    b'<div class="tuf-authenticate" data-search-path="root"><meta property="og:url" '
+    b'content="https://example.com/a/b?c=d"><meta property="og:url" content="/other"></div>',
+    b'<html><head><title>No metadata</title></head><body><p>text</p></body></html>',
+])
+def test_read_document_metadata(content):
+  doc = get_hasher('html').parse(content)
+  auth_div, meta_url, search_path = read_document_metadata(doc)
+  expected_auth_div, expected_meta_url, expected_search_path = _read_metadata_separately(doc)
+  assert auth_div is expected_auth_div
+  assert meta_url == expected_meta_url
+  assert search_path == expected_search_path
+  if auth_div is not None:
+    assert et_html.tostring(auth_div) == et_html.tostring(expected_auth_div)
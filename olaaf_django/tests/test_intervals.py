@@ -0,0 +1,64 @@
+import datetime
+from contextlib import nullcontext
+
+import pytest
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from olaaf_django.intervals import (CLOSE_STRATEGIES, CLOSE_USING_TEMP_TABLE, TEMP_TABLE_NAME,
+                                    close_hash_intervals)
+from olaaf_django.models import Commit, Hash, Path, Publication, Repository
+
+
+def _create_hashes(number):
+  """Create open hashes of the given number of files. Returns their ids and a new commit"""
+  date = datetime.date(2020, 1, 1)
+  repository = Repository.objects.create(name='test/repo')
+  publication = Publication.objects.create(name='2020-01-01', date=date, repository=repository)
+  start_commit = Commit.objects.create(sha='1' * 40, date=date, publication=publication)
+  end_commit = Commit.objects.create(sha='2' * 40, date=datetime.date(2020, 2, 1),
+                                     publication=publication)
+  hash_ids = []
+  for index in range(number):
+    path = Path.objects.create(filesystem=f'{index}.html', url=f'/{index}',
+                               publication=publication)
+    hash_ids.append(Hash.objects.create(value=f'{index:064d}', path=path,
+                                        start_commit=start_commit).id)
+  return hash_ids, end_commit
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('strategy', CLOSE_STRATEGIES + (None,))
+def test_close_hash_intervals(strategy):
+  hash_ids, end_commit = _create_hashes(10)
+
+  assert close_hash_intervals(hash_ids[:6], end_commit, strategy=strategy) == 6
+  assert close_hash_intervals([], end_commit, strategy=strategy) == 0
+
+  closed = set(Hash.objects.filter(end_commit=end_commit).values_list('id', flat=True))
+  assert closed == set(hash_ids[:6])
+  assert set(Hash.objects.filter(valid_to=end_commit.date).values_list('id', flat=True)) == closed
+  assert Hash.objects.filter(end_commit__isnull=True).count() == 4
+
+
+@pytest.mark.parametrize('threshold, uses_temp_table', [(5, True), (6, False)])
+def test_close_hash_intervals_temp_table_threshold(threshold, uses_temp_table, settings, db):
+  settings.CLOSE_INTERVALS_TEMP_TABLE_THRESHOLD = threshold
+  hash_ids, end_commit = _create_hashes(6)
+  with CaptureQueriesContext(connection) as queries:
+    assert close_hash_intervals(hash_ids, end_commit) == 6
+  assert any(TEMP_TABLE_NAME in query['sql'] for query in queries) == uses_temp_table
+
+
+@pytest.mark.parametrize('atomic', [True, False])
+def test_close_hash_intervals_temp_table_error(atomic, transactional_db):
+  hash_ids, end_commit = _create_hashes(6)
+  # the id which can not be inserted into the temporary table fails the statement, whose
+  # error is raised instead of an error of dropping of the table
+  with pytest.raises(DatabaseError):
+    with transaction.atomic() if atomic else nullcontext():
+      close_hash_intervals([hash_ids[0], 'not an id'], end_commit,
+                           strategy=CLOSE_USING_TEMP_TABLE)
+
+  # the temporary table does not outlive the failed call
+  assert close_hash_intervals(hash_ids, end_commit, strategy=CLOSE_USING_TEMP_TABLE) == 6
@@ -0,0 +1,42 @@
+import tracemalloc
+
+from olaaf_django.memory import FILE_OVERHEAD, BatchMemoryTracker
+
+
+def test_batch_memory_tracker():
+  tracker = BatchMemoryTracker(memory_budget=10 * FILE_OVERHEAD, max_files=100)
+  for _ in range(8):
+    tracker.add('a.html', None)
+  assert tracker.files == 8
+  assert FILE_OVERHEAD * 8 < tracker.size < FILE_OVERHEAD * 10
+  assert not tracker.is_full()
+
+  tracker.add('b.html', 'x' * 2 * FILE_OVERHEAD)
+  assert tracker.is_full()
+
+  tracker.flushed('commit')
+  assert tracker.files == 0
+  assert tracker.size == 0
+
+
+def test_batch_memory_tracker_max_files():
+  tracker = BatchMemoryTracker(max_files=3)
+  for _ in range(3):
+    assert not tracker.is_full()
+    tracker.add('a.html')
+  assert tracker.is_full()
+
+
+def test_batch_memory_tracker_traced_memory():
+  tracemalloc.start()
+  try:
+    tracker = BatchMemoryTracker(memory_budget=1024 * 1024, max_files=1000)
+    kept = []
+    for _ in range(100):
+      # allocations which are not reported to the tracker
+      kept.append(bytearray(100 * 1024))
+      tracker.add('a.html')
+    assert tracker.traced_size >= 100 * 100 * 1024
+    assert tracker.is_full()
+  finally:
+    tracemalloc.stop()
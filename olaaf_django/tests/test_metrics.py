@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+
+from olaaf_django.metrics import MetricsRegistry
+
+
+def test_metrics_registry():
+  registry = MetricsRegistry()
+  requests = registry.counter('test_requests_total', 'Number of requests', ('view',))
+  duration = registry.histogram('test_duration_seconds', 'Duration', buckets=(0.1, 1))
+
+  def _observe():
+    for _ in range(1000):
+      requests.inc(view='a"b')
+      duration.observe(0.5)
+
+  threads = [threading.Thread(target=_observe) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  duration.observe(0.05)
+  duration.observe(5)
+
+  assert requests.get(view='a"b') == 4000
+  assert registry.counter('test_requests_total', 'Number of requests', ('view',)) is requests
+  with pytest.raises(ValueError):
+    registry.histogram('test_requests_total', 'Number of requests', ('view',))
+  with pytest.raises(ValueError):
+    requests.inc(status=200)
+
+  lines = registry.render().splitlines()
+  assert '# TYPE test_requests_total counter' in lines
+  assert 'test_requests_total{view="a\\"b"} 4000' in lines
+  assert 'test_duration_seconds_bucket{le="0.1"} 1' in lines
+  assert 'test_duration_seconds_bucket{le="1"} 4001' in lines
+  assert 'test_duration_seconds_bucket{le="+Inf"} 4002' in lines
+  assert 'test_duration_seconds_count 4002' in lines
+
+
+def test_metrics_view(db):
+  client = Client()
+  client.post(reverse('check-hashes'), '[]', content_type='application/json')
+
+  response = client.get(reverse('metrics'))
+  assert response.status_code == 200
+  assert response['Content-Type'].startswith('text/plain')
+  content = response.content.decode()
+  assert 'olaaf_requests_total{view="check_hashes",status="200"}' in content
+  assert 'olaaf_request_db_duration_seconds_count{view="check_hashes"}' in content
@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+from olaaf_django.pipeline import BackgroundIterator
+
+
+def test_background_iterator():
+  with BackgroundIterator(range(100), max_items=3) as items:
+    assert list(items) == list(range(100))
+    assert next(items, None) is None
+
+
+def test_background_iterator_error():
+  def _produce():
+    yield 1
+    raise ValueError('failed')
+
+  with BackgroundIterator(_produce(), max_items=3) as items:
+    assert next(items) == 1
+    with pytest.raises(ValueError, match='failed'):
+      next(items)
+
+
+def test_background_iterator_close():
+  closed = threading.Event()
+
+  def _produce():
+    try:
+      for index in range(1000):
+        yield index
+    finally:
+      closed.set()
+
+  items = BackgroundIterator(_produce(), max_items=2)
+  assert next(items) == 0
+  items.close()
+  assert closed.is_set()
+  assert next(items, None) is None
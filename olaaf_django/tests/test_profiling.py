@@ -0,0 +1,50 @@
+import json
+
+from olaaf_django import profiling
+
+
+def test_sync_profile(tmp_path):
+  profile = profiling.SyncProfile()
+  publication_profile = profile.publication('test/repo:publication/2020-01-01')
+
+  with profiling.stage(profiling.SHA256):
+    # not recorded, the thread is not recording
+    pass
+  with profiling.recording(publication_profile, 'commit1'):
+    with profiling.stage(profiling.SHA256):
+      pass
+    with profiling.stage(profiling.HASH_INSERTS, 10):
+      pass
+    assert list(profiling.profiled_iter(profiling.GIT_DIFF, range(3))) == [0, 1, 2]
+  with profiling.recording(publication_profile, 'commit2'):
+    with profiling.stage(profiling.SHA256):
+      pass
+  with profiling.stage(profiling.SHA256):
+    pass
+
+  report_path = tmp_path / 'report.json'
+  profile.write(report_path)
+  report = json.loads(report_path.read_text())
+  assert report['stages'][profiling.SHA256]['count'] == 2
+  assert report['stages'][profiling.HASH_INSERTS]['count'] == 10
+  assert report['stages'][profiling.GIT_DIFF]['count'] == 3
+  commits = report['publications']['test/repo:publication/2020-01-01']['commits']
+  assert set(commits) == {'commit1', 'commit2'}
+  assert set(commits['commit2']) == {profiling.SHA256}
+
+
+def test_collected_stages_are_recorded():
+  publication_profile = profiling.SyncProfile().publication('test/repo:publication/2020-01-01')
+
+  # e.g. in a worker process
+  with profiling.collecting() as stage_times:
+    with profiling.stage(profiling.BLOB_READ):
+      pass
+    profiling.record(profiling.SHA256, 0.5, 2)
+  stages = stage_times.to_tuple()
+
+  with profiling.recording(publication_profile, 'commit1'):
+    profiling.record_all(stages)
+  commit_stages = publication_profile.to_dict()['commits']['commit1']
+  assert commit_stages[profiling.BLOB_READ]['count'] == 1
+  assert commit_stages[profiling.SHA256] == {'seconds': 0.5, 'count': 2}
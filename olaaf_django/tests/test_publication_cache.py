@@ -0,0 +1,75 @@
+import pytest
+from django.test import Client
+from django.urls import reverse
+from git import Repo
+
+from olaaf_django import HOSTS_REPOS_CACHE, auth_cache, publication_cache
+from olaaf_django.models import Publication
+from olaaf_django.sync_hashes import sync_hashes
+from olaaf_django.tests.conftest import _change_file_content
+from olaaf_django.tests.test_authentication import _get_file_content
+
+REPO_NAME = 'test/html-repo'
+
+
+@pytest.fixture
+def synced_repository(html_repository_and_input, local_cache, db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  return html_repository
+
+
+def test_repository_publications(synced_repository):
+  repository_publications = publication_cache.get_repository_publications(REPO_NAME)
+  expected_names = set(Publication.objects.filter(revoked=False).values_list('name', flat=True))
+  assert set(repository_publications.publications) == expected_names
+  assert repository_publications.latest == max(expected_names)
+
+  latest = repository_publications.by_name_or_latest()
+  assert latest.name == latest.latest == repository_publications.latest
+  assert repository_publications.by_name_or_latest('2020-01-01').latest == latest.name
+  # revoked publications are not cached
+  with pytest.raises(Publication.DoesNotExist):
+    repository_publications.by_name_or_latest('2020-05-05')
+
+  urls = repository_publications.by_name_or_latest('2020-01-01').authenticable_urls
+  assert 'file1' in urls
+  # urls are normalized like in queries
+  assert 'File1.html' in urls
+  assert 'missing' not in urls
+
+
+def test_repository_publications_reloaded_after_sync(synced_repository):
+  repository_publications = publication_cache.get_repository_publications(REPO_NAME)
+  assert publication_cache.get_repository_publications(REPO_NAME) is repository_publications
+
+  Publication.objects.filter(name=repository_publications.latest).update(revoked=True)
+  auth_cache.bump_sync_generation()
+  reloaded = publication_cache.get_repository_publications(REPO_NAME)
+  assert reloaded is not repository_publications
+  assert repository_publications.latest not in reloaded.publications
+
+
+def test_authenticate_uses_cached_publications(synced_repository, django_assert_num_queries):
+  publication_cache.warm_up([REPO_NAME])
+  # urls of publications other than the latest one are loaded on first use
+  repository_publications = publication_cache.get_repository_publications(REPO_NAME)
+  assert len(repository_publications.by_name_or_latest('2020-01-01').authenticable_urls) > 0
+  HOSTS_REPOS_CACHE['testserver'] = REPO_NAME
+  url = '_publication/2020-01-01/_date/2019-02-02/file1.html'
+  content = _get_file_content(Repo(synced_repository.path), url)
+
+  # only hashes are looked up
+  with django_assert_num_queries(1):
+    response = Client().post(reverse('authenticate'),
+                             data={'url': url, 'content': _change_file_content(content)})
+  assert response.content.strip().startswith(b'Not authentic')
+
+  with django_assert_num_queries(0):
+    response = Client().post(reverse('authenticate'),
+                             data={'url': '_publication/2020-01-01/missing', 'content': content})
+  assert response.content.strip().startswith(b'Cannot authenticate')
+
+
+def test_cache_disabled_by_default():
+  assert publication_cache.get_repository_publications(REPO_NAME) is None
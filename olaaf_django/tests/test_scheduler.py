@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from olaaf_django.scheduler import SyncError, SyncUnit, run_sync_units
+
+
+def _append(results, value):
+  results.append((value, threading.current_thread().name))
+
+
+def _fail(message):
+  raise ValueError(message)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_run_sync_units(workers):
+  executed = []
+  units = [SyncUnit(f'unit-{i}', _append, executed, i) for i in range(5)]
+  units.insert(2, SyncUnit('failing-unit', _fail, 'failed'))
+
+  results = run_sync_units(units, workers=workers)
+
+  assert [result.unit for result in results] == units
+  assert sorted(value for value, _ in executed) == list(range(5))
+  failed = [result for result in results if not result.succeeded]
+  assert len(failed) == 1
+  assert failed[0].unit.name == 'failing-unit'
+  assert str(failed[0].error) == 'failed'
+  assert 'failing-unit' in str(SyncError(results))
+  if workers > 1:
+    assert all(thread_name != threading.main_thread().name for _, thread_name in executed)
+
+
+def _wait_and_append(results, value, event):
+  # the unit which has to be executed first is the slowest one
+  event.wait(0.2)
+  _append(results, value)
+
+
+# units which wait for other units occupy their threads
+@pytest.mark.parametrize('workers', [1, 4])
+def test_run_sync_units_after(workers):
+  executed = []
+  never_set = threading.Event()
+  first = SyncUnit('first', _wait_and_append, executed, 'first', never_set)
+  second = SyncUnit('second', _fail, 'failed')
+  second.after = first
+  third = SyncUnit('third', _append, executed, 'third')
+  third.after = second
+  independent = SyncUnit('independent', _append, executed, 'independent')
+
+  results = run_sync_units([first, second, third, independent], workers=workers)
+
+  values = [value for value, _ in executed]
+  # units are executed after units they depend on, even if those fail
+  assert values.index('first') < values.index('third')
+  assert [result.succeeded for result in results] == [True, False, True, True]
+  if workers > 1:
+    assert values[0] == 'independent'
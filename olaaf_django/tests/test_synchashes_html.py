@@ -1,3 +1,7 @@
+import datetime
+import itertools
+import json
+import threading
 from collections import defaultdict
 from functools import reduce
 from operator import concat
@@ -5,9 +9,14 @@ from operator import concat
 import pytest
 from lxml import html
 
-from olaaf_django.models import Hash, Publication
-from olaaf_django.sync_hashes import sync_hashes
-from olaaf_django.tests.conftest import HTML_REPOSITORY_PATH
+from olaaf_django import hashing, profiling
+from olaaf_django import sync_hashes as sync_hashes_module
+from olaaf_django.intervals import OpenHashIndex
+from olaaf_django.models import Commit, Hash, HashMemo, Path, Publication, Repository
+from olaaf_django.pipeline import BackgroundIterator
+from olaaf_django.scheduler import SyncError, serialized_writes
+from olaaf_django.sync_hashes import PendingHash, sync_hashes
+from olaaf_django.tests.conftest import HTML_REPOSITORY_PATH, PUBLICATION_BRANCHES
 
 
 def _to_pub_branch_name(pub):
@@ -29,9 +38,11 @@ def _check_path_url(path):
     pytest.fail("Add '<meta property=\"expected:url\" content=\"...\" />' to test html file!")
 
 
-def test_synchashes(html_repository_and_input, non_publications, publications, repo_files, db):
+@pytest.mark.parametrize('hashing_workers', [1, 2])
+def test_synchashes(html_repository_and_input, non_publications, publications, repo_files, db,
+                    hashing_workers):
   html_repository, html_repo_input = html_repository_and_input
-  sync_hashes(html_repository.library_dir, html_repo_input)
+  sync_hashes(html_repository.library_dir, html_repo_input, hashing_workers=hashing_workers)
 
   pub_branches = list(publications.keys())
 
@@ -80,3 +91,392 @@ def test_synchashes(html_repository_and_input, non_publications, publications, r
         ).count()
 
         assert file_hashes_len == hash_len
+
+
+def _get_synced_data():
+  hashes = set(Hash.objects.values_list(
+      'path__publication__name', 'path__filesystem', 'hash_type', 'value', 'start_commit__sha',
+      'end_commit__sha'))
+  paths = set(Path.objects.values_list('publication__name', 'filesystem', 'url', 'search_path'))
+  return hashes, paths
+
+
+@pytest.fixture
+def default_sync_data(html_repository_and_input, db):
+  """
+  Paths and hashes synced using default options, which syncs using other options have to
+  reproduce. Synced publications and memoized hashes are deleted afterwards
+  """
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  synced_data = _get_synced_data()
+  Publication.objects.all().delete()
+  HashMemo.objects.all().delete()
+  return synced_data
+
+
+def test_synchashes_memoized_hashes(html_repository_and_input, default_sync_data, monkeypatch):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  memos_number = HashMemo.objects.count()
+  assert memos_number > 0
+  Publication.objects.all().delete()
+
+  def _hash_file(*args):
+    pytest.fail('Hashes of already synced blobs should not be calculated again')
+
+  monkeypatch.setattr(hashing, 'hash_file', _hash_file)
+  profile = profiling.SyncProfile()
+  sync_hashes(html_repository.library_dir, html_repo_input, profile=profile)
+  assert _get_synced_data() == default_sync_data
+
+  # blobs of all changed files were found in the memo, so none of them was read
+  stages = profile.to_dict()['stages']
+  assert stages[profiling.MEMO_LOOKUP]['count'] > 0
+  assert profiling.BLOB_READ not in stages
+  assert HashMemo.objects.count() == memos_number
+
+
+@pytest.mark.parametrize('sync_workers', [1, 3])
+def test_synchashes_incremental(html_repository_and_input, default_sync_data, publications,
+                                transactional_db,
+                                sync_workers):
+  html_repository, html_repo_input = html_repository_and_input
+  profile = profiling.SyncProfile()
+  sync_hashes(html_repository.library_dir, html_repo_input, incremental=True,
+              sync_workers=sync_workers, profile=profile)
+  assert _get_synced_data() == default_sync_data
+
+  # every publication but the first one was seeded from its fully synced predecessor, even
+  # if publications were synced concurrently
+  report = profile.to_dict()
+  assert report['stages'][profiling.SEED]['count'] == len(publications) - 1
+  first_unit = f'test/html-repo:{min(publications)}'
+  assert profiling.SEED not in report['publications'][first_unit]['stages']
+
+
+def test_synchashes_incremental_killed_while_seeding(html_repository_and_input, default_sync_data,
+                                                    monkeypatch):
+  html_repository, html_repo_input = html_repository_and_input
+  add_and_update_paths_and_hashes = sync_hashes_module._add_and_update_paths_and_hashes
+  seeded_publications = []
+
+  def _kill_seeded_batch(current_commit, *args, **kwargs):
+    seeded = args[4] if len(args) > 4 else kwargs.get('seeded', False)
+    if seeded:
+      seeded_publications.append(current_commit.publication)
+      raise KeyboardInterrupt
+    return add_and_update_paths_and_hashes(current_commit, *args, **kwargs)
+
+  monkeypatch.setattr(sync_hashes_module, '_add_and_update_paths_and_hashes',
+                      _kill_seeded_batch)
+  with pytest.raises(KeyboardInterrupt):
+    sync_hashes(html_repository.library_dir, html_repo_input, incremental=True)
+  # paths and hashes were already copied, but the seeding was rolled back
+  publication, = seeded_publications
+  assert not Commit.objects.filter(publication=publication).exists()
+  assert not Path.objects.filter(publication=publication).exists()
+  assert Path.objects.exists()
+
+  monkeypatch.undo()
+  sync_hashes(html_repository.library_dir, html_repo_input, incremental=True)
+  assert _get_synced_data() == default_sync_data
+
+
+def test_synchashes_sync_workers(html_repository_and_input, default_sync_data, publications,
+                                transactional_db, monkeypatch):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_publication_branch = sync_hashes_module._sync_publication_branch
+  threads_names = set()
+
+  def _sync_in_thread(*args, **kwargs):
+    threads_names.add(threading.current_thread().name)
+    return sync_publication_branch(*args, **kwargs)
+
+  monkeypatch.setattr(sync_hashes_module, '_sync_publication_branch', _sync_in_thread)
+  results = sync_hashes(html_repository.library_dir, html_repo_input, sync_workers=3)
+  assert all(result.succeeded for result in results)
+  assert _get_synced_data() == default_sync_data
+  # publications were synced by worker threads, not one after another by the main thread
+  assert len(results) == len(publications)
+  assert threading.main_thread().name not in threads_names
+  assert len(threads_names) > 1
+
+
+@pytest.fixture
+def background_hashing(monkeypatch):
+  """
+  Hash files in a background thread, which is otherwise only done with databases other
+  than SQLite. Returns the list of created `BackgroundIterator`s
+  """
+  iterators = []
+  get_memoized_files_hashes = sync_hashes_module._get_memoized_files_hashes
+
+  class _BackgroundIterator(BackgroundIterator):
+    def __init__(self, *args, **kwargs):
+      super().__init__(*args, **kwargs)
+      iterators.append(self)
+
+  def _get_memoized_files_hashes(*args, **kwargs):
+    # tables of the SQLite test database are locked while they are read by another
+    # connection, so memoized hashes are not read while hashes are being inserted
+    with serialized_writes():
+      return get_memoized_files_hashes(*args, **kwargs)
+
+  monkeypatch.setattr(sync_hashes_module, '_hash_in_background', lambda: True)
+  monkeypatch.setattr(sync_hashes_module, '_get_memoized_files_hashes',
+                      _get_memoized_files_hashes)
+  monkeypatch.setattr(sync_hashes_module, 'BackgroundIterator', _BackgroundIterator)
+  return iterators
+
+
+def test_synchashes_background_hashing(html_repository_and_input, default_sync_data,
+                                       publications, background_hashing, transactional_db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  assert _get_synced_data() == default_sync_data
+
+  assert len(background_hashing) == len(publications)
+  assert not any(iterator._thread.is_alive() for iterator in background_hashing)
+
+
+def test_synchashes_background_hashing_error(html_repository_and_input, background_hashing,
+                                             monkeypatch, transactional_db):
+  html_repository, html_repo_input = html_repository_and_input
+  hash_changed_files = sync_hashes_module._hash_changed_files
+  hashing_threads = set()
+
+  def _fail_after_first_file(*args, **kwargs):
+    hashing_threads.add(threading.current_thread().name)
+    for index, hashed_file in enumerate(hash_changed_files(*args, **kwargs)):
+      if index == 1:
+        raise ValueError('Hashing failed')
+      yield hashed_file
+
+  monkeypatch.setattr(sync_hashes_module, '_hash_changed_files', _fail_after_first_file)
+  with pytest.raises(SyncError) as error_info:
+    sync_hashes(html_repository.library_dir, html_repo_input)
+
+  # the error raised by the background thread fails its publication
+  assert {str(result.error) for result in error_info.value.results} == {'Hashing failed'}
+  assert hashing_threads == {f'hashing-{name.rsplit("/", 1)[1]}' for name in PUBLICATION_BRANCHES}
+  assert background_hashing
+  assert not any(iterator._thread.is_alive() for iterator in background_hashing)
+  assert not Commit.objects.exists()
+
+
+def test_synchashes_validity_dates(html_repository_and_input, db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  hashes = Hash.objects.values_list('valid_from', 'valid_to', 'start_commit__date',
+                                    'end_commit__date')
+  assert hashes
+  for valid_from, valid_to, start_date, end_date in hashes:
+    assert (valid_from, valid_to) == (start_date, end_date)
+
+
+def test_synchashes_small_memory_budget(html_repository_and_input, default_sync_data,
+                                        monkeypatch):
+  html_repository, html_repo_input = html_repository_and_input
+  add_and_update_paths_and_hashes = sync_hashes_module._add_and_update_paths_and_hashes
+  batches_sizes = []
+
+  def _insert_batch(current_commit, open_hashes, changed_files_paths, hashes_by_paths_and_types,
+                    added_files_paths, *args, **kwargs):
+    batches_sizes.append(len(changed_files_paths) + len(added_files_paths))
+    return add_and_update_paths_and_hashes(current_commit, open_hashes, changed_files_paths,
+                                           hashes_by_paths_and_types, added_files_paths,
+                                           *args, **kwargs)
+
+  monkeypatch.setattr(sync_hashes_module, '_add_and_update_paths_and_hashes', _insert_batch)
+  sync_hashes(html_repository.library_dir, html_repo_input, memory_budget=1)
+  assert _get_synced_data() == default_sync_data
+
+  # every file exceeds the budget, so each one is inserted in a separate batch
+  assert len(batches_sizes) > len(PUBLICATION_BRANCHES)
+  assert set(batches_sizes) == {1}
+
+
+def test_synchashes_resume_failed_commit(html_repository_and_input, default_sync_data,
+                                         monkeypatch):
+  html_repository, html_repo_input = html_repository_and_input
+  add_and_update_paths_and_hashes = sync_hashes_module._add_and_update_paths_and_hashes
+  batches = []
+
+  def _fail_third_batch(*args, **kwargs):
+    batches.append(args)
+    if len(batches) == 3:
+      raise ValueError('Interrupted')
+    return add_and_update_paths_and_hashes(*args, **kwargs)
+
+  monkeypatch.setattr(sync_hashes_module, '_add_and_update_paths_and_hashes',
+                      _fail_third_batch)
+  # every file is inserted in a separate batch
+  with pytest.raises(SyncError):
+    sync_hashes(html_repository.library_dir, html_repo_input, memory_budget=1)
+  assert Commit.objects.filter(applied_files__isnull=False).count() == 1
+
+  monkeypatch.undo()
+  sync_hashes(html_repository.library_dir, html_repo_input, memory_budget=1)
+  assert _get_synced_data() == default_sync_data
+  assert not Commit.objects.filter(applied_files__isnull=False).exists()
+
+
+def test_synchashes_resume_killed_commit(html_repository_and_input, default_sync_data,
+                                         monkeypatch):
+  html_repository, html_repo_input = html_repository_and_input
+  insert_diff_hashes = sync_hashes_module._insert_diff_hashes
+  commits = []
+
+  def _kill_second_commit(publication, current_commit, *args, **kwargs):
+    commits.append(current_commit)
+    if len(commits) == 2:
+      raise KeyboardInterrupt
+    return insert_diff_hashes(publication, current_commit, *args, **kwargs)
+
+  monkeypatch.setattr(sync_hashes_module, '_insert_diff_hashes', _kill_second_commit)
+  with pytest.raises(KeyboardInterrupt):
+    sync_hashes(html_repository.library_dir, html_repo_input)
+  # none of the hashes of the second commit were inserted, so it is not marked as complete
+  killed_commit = Commit.objects.get(sha=commits[1].sha)
+  assert killed_commit.applied_files == 0
+
+  monkeypatch.undo()
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  assert _get_synced_data() == default_sync_data
+  assert not Commit.objects.filter(applied_files__isnull=False).exists()
+
+
+def _stopping_clock():
+  """
+  Return a clock which advances by one second whenever it is read. The deadline is only
+  checked before each commit and after each changed file, so a time budget of `n` seconds
+  is exhausted after `n - 1` checks
+  """
+  return itertools.count().__next__
+
+
+def test_synchashes_time_budget(html_repository_and_input, default_sync_data):
+  html_repository, html_repo_input = html_repository_and_input
+  # the deadline passes once the second changed file of the first commit is processed
+  sync_hashes(html_repository.library_dir, html_repo_input, time_budget=3,
+              clock=_stopping_clock())
+  assert list(Commit.objects.values_list('publication__name', 'applied_files')) == [
+      ('2020-01-01', 2)]
+
+  sync_hashes(html_repository.library_dir, html_repo_input)
+  assert _get_synced_data() == default_sync_data
+  assert not Commit.objects.filter(applied_files__isnull=False).exists()
+
+
+@pytest.mark.parametrize('seeded', [False, True])
+def test_add_hashes_of_modified_files_without_open_hashes(seeded, db):
+  date = datetime.date(2020, 1, 1)
+  repository = Repository.objects.create(name='test/repo')
+  publication = Publication.objects.create(name='2020-01-01', date=date, repository=repository)
+  first_commit = Commit.objects.create(sha='1' * 40, date=date, publication=publication)
+  current_commit = Commit.objects.create(sha='2' * 40, date=datetime.date(2020, 2, 1),
+                                         publication=publication)
+  # only the bitstream hash of the first file exists, e.g. if it was copied from another
+  # publication, and the second file has no path in the publication
+  path = Path.objects.create(filesystem='a.html', url='a', publication=publication)
+  Hash.objects.create(value='a1', hash_type=Hash.BITSTREAM, path=path,
+                      start_commit=first_commit, valid_from=first_commit.date)
+  open_hashes = OpenHashIndex.load(publication)
+  new_hashes = {(filesystem, hash_type): PendingHash(f'{filesystem}-{hash_type}')
+                for filesystem in ('a.html', 'b.html') for hash_type in (Hash.BITSTREAM,
+                                                                         Hash.RENDERED)}
+  modified_files_paths = [{'filesystem': filesystem, 'url': filesystem[0], 'search_path': None}
+                          for filesystem in ('a.html', 'b.html')]
+
+  sync_hashes_module._add_and_update_paths_and_hashes(
+      current_commit, open_hashes, ['a.html', 'b.html'], new_hashes, [], seeded,
+      modified_files_paths, [])
+
+  assert set(Hash.objects.filter(start_commit=current_commit)
+             .values_list('path__filesystem', 'path__url', 'value')) == {
+      (filesystem, filesystem[0], new_hash.value)
+      for (filesystem, _), new_hash in new_hashes.items()}
+  assert Path.objects.filter(publication=publication).count() == 2
+  for (filesystem, hash_type), new_hash in new_hashes.items():
+    assert open_hashes.get(filesystem, hash_type).value == new_hash.value
+
+
+def _branches_input(html_repo_input, *branches):
+  """Return input data of `sync_hashes` which only contains the given publication branches"""
+  repos_data = json.loads(html_repo_input)
+  return json.dumps({repo_name: {branch: repo_data[branch] for branch in branches}
+                     for repo_name, repo_data in repos_data.items()})
+
+
+def test_synchashes_incremental_after_interrupted_sync(html_repository_and_input, db):
+  html_repository, html_repo_input = html_repository_and_input
+  first_input = _branches_input(html_repo_input, 'publication/2020-01-01')
+  next_input = _branches_input(html_repo_input, 'publication/2020-05-05')
+  sync_hashes(html_repository.library_dir, next_input)
+  next_data = _get_synced_data()
+  Publication.objects.all().delete()
+
+  sync_hashes(html_repository.library_dir, first_input, time_budget=3,
+              clock=_stopping_clock())
+  assert Commit.objects.filter(applied_files__isnull=False).exists()
+
+  # hashes of the interrupted publication are incomplete, so they must not be copied
+  sync_hashes(html_repository.library_dir, next_input, incremental=True)
+  assert {data for data in _get_synced_data()[0] if data[0] == '2020-05-05'} == next_data[0]
+
+
+def test_synchashes_time_budget_revocation(html_repository_and_input, db):
+  html_repository, html_repo_input = html_repository_and_input
+  sync_hashes(html_repository.library_dir,
+              _branches_input(html_repo_input, 'publication/2020-05-05'))
+  newer_input = _branches_input(html_repo_input, 'publication/2020-05-05-01')
+
+  # a partly synced publication does not revoke the synced one on the same date
+  sync_hashes(html_repository.library_dir, newer_input, time_budget=3,
+              clock=_stopping_clock())
+  assert Commit.objects.filter(publication__name='2020-05-05-01',
+                               applied_files__isnull=False).exists()
+  assert not Publication.objects.get(name='2020-05-05').revoked
+
+  sync_hashes(html_repository.library_dir, newer_input)
+  assert Publication.objects.get(name='2020-05-05').revoked
+  assert not Publication.objects.get(name='2020-05-05-01').revoked
+
+
+def test_synchashes_profile(html_repository_and_input, publications, db):
+  html_repository, html_repo_input = html_repository_and_input
+  profile = profiling.SyncProfile()
+  sync_hashes(html_repository.library_dir, html_repo_input, profile=profile)
+
+  report = profile.to_dict()
+  assert len(report['publications']) == len(publications)
+  for stage in (profiling.GIT_DIFF, profiling.BLOB_READ, profiling.HTML_PARSE,
+                profiling.SHA256, profiling.PATH_WRITES, profiling.HASH_INSERTS,
+                profiling.INTERVAL_CLOSES):
+    assert report['stages'][stage]['count'] > 0
+
+
+def test_synchashes_profile_hashing_workers(html_repository_and_input, db):
+  html_repository, html_repo_input = html_repository_and_input
+  worker_stages = (profiling.BLOB_READ, profiling.HTML_PARSE, profiling.METADATA_READ,
+                   profiling.AUTH_DIV_SERIALIZE, profiling.SHA256)
+
+  def _worker_stages_counts(hashing_workers):
+    profile = profiling.SyncProfile()
+    sync_hashes(html_repository.library_dir, html_repo_input, profile=profile,
+                hashing_workers=hashing_workers)
+    Publication.objects.all().delete()
+    HashMemo.objects.all().delete()
+    report = profile.to_dict()
+    return {
+        publication: {commit: {stage: stages[stage]['count'] for stage in worker_stages
+                               if stage in stages}
+                      for commit, stages in publication_report['commits'].items()}
+        for publication, publication_report in report['publications'].items()}
+
+  counts = _worker_stages_counts(1)
+  assert all(stage_counts for publication_counts in counts.values()
+             for stage_counts in publication_counts.values())
+  # stages executed by the worker processes are recorded into the commits they hashed
+  assert _worker_stages_counts(2) == counts
@@ -0,0 +1,46 @@
+import pytest
+
+from olaaf_django.metrics import FUNCTION_DURATION
+from olaaf_django.tests.conftest import DATA
+from olaaf_django.utils import calc_hash, hasher, strip_content, timed_run
+
+
+def _strip_decoded(content):
+  return content.decode('utf-8', 'surrogateescape').strip().encode('utf-8', 'surrogateescape')
+
+
+@pytest.mark.parametrize('content', [
+    *(path.read_bytes() for path in sorted(DATA.rglob('*'))),
+    b'',
+    b' \t\r\n',
+    b'\n<html></html>\n\n',
+    b'\x1c\x1f<p>separators</p>\x0b\x0c',
+    ' <p>non-breaking spaces</p>　\n'.encode(),
+    '<p>ends with a non-whitespace character</p>é'.encode(),
+    b'\xff<p>invalid utf-8</p>\xc2',
+    b'\n\x85<p>lone continuation byte</p>\n',
+    b'<p>no whitespace</p>',
+])
+def test_strip_content_bytes(content):
+  assert strip_content(content) == _strip_decoded(content)
+  assert calc_hash(content, 'html') == hasher(_strip_decoded(content)).hexdigest()
+
+
+def test_strip_content_is_not_copied():
+  content = b'<p>no whitespace</p>'
+  assert strip_content(content) is content
+  assert strip_content(' text\n') == 'text'
+  with pytest.raises(TypeError):
+    strip_content(None)
+
+
+def test_timed_run_observes_failed_calls():
+  @timed_run()
+  def _fail():
+    raise ValueError('Failed')
+
+  function_name = _fail.__qualname__
+  count = FUNCTION_DURATION.get_count(function=function_name)
+  with pytest.raises(ValueError):
+    _fail()
+  assert FUNCTION_DURATION.get_count(function=function_name) == count + 1
@@ -7,4 +7,5 @@ urlpatterns = [
     path('authenticate/', TemplateView.as_view(template_name='olaaf_django/index.html'), name='home'),
     path('authenticate', views.authenticate, name='authenticate'),
     path('check-hashes', views.check_hashes, name='check-hashes'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -5,12 +5,18 @@ import logging
 import time
 from functools import wraps
 
+from lxml import etree
 from lxml import html as et_html
 
+from olaaf_django.metrics import FUNCTION_DURATION
+
 hasher = hashlib.sha256
 
 logger = logging.getLogger(__name__)
 
+# first element with the tuf-authenticate class, the document is not walked any further
+_AUTH_DIV = etree.XPath("descendant::*[contains(@class, 'tuf-authenticate')][1]")
+
 
 def calc_hash(content, file_type):
   """
@@ -55,7 +61,7 @@ def get_auth_div_content(doc):
     <Returns>
       div lxml element with class tuf-authenticate if the document contains it, None otherwise
   """
-  auth_div = doc.xpath(".//*[contains(@class, 'tuf-authenticate')]")
+  auth_div = _AUTH_DIV(doc)
   if auth_div:
     return auth_div[0]
   return None
@@ -67,21 +73,41 @@ def strip_content(content):
     Git show removes an empty line at the end of files, meaning that hash inserted into the database
     is calculated based on content which does not have that new line.
     So, it is necessary to remove it from the provided binary content before calculating its hash.
-    surrogateescape is an error handler used to cope with encoding problems.
+    Binary content is stripped the same way as if it was decoded using the surrogateescape error
+    handler, stripped and encoded again, but without copying it more than once.
   <Arguments>
     content:
       binary string or string from which leading and trailing whitespaces should be stripped
   <Returns>
-    Stripped content
+    Stripped content. Binary content which does not need to be stripped is returned as is
   """
   if isinstance(content, bytes):
-    return content.decode('utf-8', 'surrogateescape').strip().encode('utf-8', 'surrogateescape')
+    return _strip_bytes(content)
   elif isinstance(content, str):
     return content.strip()
   else:
     raise TypeError("Incorrect content type.")
 
 
+# single byte characters which are stripped by str.strip
+_ASCII_WHITESPACE = frozenset(b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f')
+
+
+def _strip_bytes(content):
+  start, end = 0, len(content)
+  while start < end and content[start] in _ASCII_WHITESPACE:
+    start += 1
+  while end > start and content[end - 1] in _ASCII_WHITESPACE:
+    end -= 1
+  if (start < end and content[start] >= 0x80) or (end > start and content[end - 1] >= 0x80):
+    # the content might start or end with a multi-byte whitespace character, e.g. a
+    # non-breaking space, which is rare enough to be stripped by decoding the content
+    return content.decode('utf-8', 'surrogateescape').strip().encode('utf-8', 'surrogateescape')
+  if start == 0 and end == len(content):
+    return content
+  return content[start:end]
+
+
 def is_iso_date(date):
   """Check if input date is a valid iso date.
   """
@@ -102,30 +128,30 @@ def remove_endings(input_str, endings=('index.html', 'index.full.html', '.full.h
 
 class timed_run:
   """Decorator to let us capture the elapsed time and optionally print a timer and start/end
-     messages around function calls"""
+     messages around function calls. The same decorated function can be called concurrently,
+     so start times are kept per call and elapsed times are observed by a histogram metric"""
 
   def __init__(self, start_message=None, end_message='  completed in {} seconds'):
     self.start_message = start_message
     self.end_message = end_message
-    self.start_time = None
-    self.elapsed_time = None
-
-  def start(self):
-    self.start_time = time.time()
-    if self.start_message is not None:
-      logger.info('\n%s', self.start_message)
-
-  def end(self):
-    self.elapsed_time = time.time() - self.start_time
-    if self.end_message is not None:
-      logger.info('\n%s', self.end_message.format(int(self.elapsed_time)))
 
   def __call__(self, orig_func=None):
+    function_name = getattr(orig_func, '__qualname__', None)
+
     @wraps(orig_func)
     def wrapper_func(*args, **kwargs):
-      self.start()
-      result = orig_func(*args, **kwargs) if orig_func else None
-      self.end()
+      start_time = time.time()
+      if self.start_message is not None:
+        logger.info('\n%s', self.start_message)
+      try:
+        result = orig_func(*args, **kwargs) if orig_func else None
+      finally:
+        # failed calls are observed as well, since they are often the slowest ones
+        elapsed_time = time.time() - start_time
+        if function_name is not None:
+          FUNCTION_DURATION.observe(elapsed_time, function=function_name)
+      if self.end_message is not None:
+        logger.info('\n%s', self.end_message.format(int(elapsed_time)))
       return result
     return wrapper_func
 
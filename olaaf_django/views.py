@@ -1,17 +1,27 @@
 import json
 import re
+import time
+from functools import wraps
 
+from django.conf import settings
+from django.db import connection
 from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from . import get_repo_info
+from . import auth_cache, get_repo_by_host, get_repo_info
 from .authentication import AuthenticationResponse, check_authenticity
 from .messages import (VALID_CURRENT_DOC_MSG, VALID_OUTDATED_HTML_DOC_MSG,
                        VALID_OUTDATED_PDF_DOC_MSG, format_message)
+from .metrics import (CONTENT_TYPE, REQUEST_DB_DURATION, REQUEST_DURATION, REQUESTS,
+                      registry)
 from .models import Hash, Publication
+from .publication_cache import get_repository_publications
 from .utils import URL_PREFIX
 
+# maximum number of files checked by one request, unless set by the CHECK_HASHES_MAX_FILES setting
+CHECK_HASHES_MAX_FILES = 500
+
 URL_RE = re.compile(
     r'((\/)?_publication\/(?P<pub>(\d{4}-\d{2}(-\d{2})?(-\d{2})?)))?' +  # backwards compatible
     r'((\/)?_date\/(?P<date>(\d{4}-\d{2}-\d{2})))?' +
@@ -19,8 +29,42 @@ URL_RE = re.compile(
 )
 
 
+def _observed(view_name):
+  """Decorator which observes duration, time spent in database queries and status of requests"""
+  def decorator(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+      db_duration = 0
+
+      def _timed_query(execute, sql, params, many, context):
+        nonlocal db_duration
+        start_time = time.perf_counter()
+        try:
+          return execute(sql, params, many, context)
+        finally:
+          db_duration += time.perf_counter() - start_time
+
+      status = 500
+      start_time = time.perf_counter()
+      try:
+        with connection.execute_wrapper(_timed_query):
+          response = view(request, *args, **kwargs)
+        status = response.status_code
+        return response
+      except Http404:
+        status = 404
+        raise
+      finally:
+        REQUEST_DURATION.observe(time.perf_counter() - start_time, view=view_name)
+        REQUEST_DB_DURATION.observe(db_duration, view=view_name)
+        REQUESTS.inc(view=view_name, status=status)
+    return wrapper
+  return decorator
+
+
 @csrf_exempt
 @require_http_methods(['POST'])
+@_observed('authenticate')
 def authenticate(request):
   url = request.POST.get('url')
 
@@ -28,55 +72,79 @@ def authenticate(request):
     return AuthenticationResponse(url, authenticable=False).to_http_response(request)
 
   pub_name, date, path = _extract_url(url)
-
-  try:
-    repo_name, content_type = get_repo_info(request.get_host(), path)
-    publication = Publication.for_partner(repo_name).by_name_or_latest(pub_name, strict=True)
-  except Publication.DoesNotExist:
-    raise Http404()
+  repo_name, content_type = get_repo_info(request.get_host(), path)
 
   content = request.POST.get('content')
   if content is None:
-    content = request.FILES['content'].file.getvalue()
-
-  auth_response = check_authenticity(publication, pub_name, date, path, url, content, content_type)
+    # uploaded files are read by the hasher, larger ones are streamed from a temporary file
+    content = request.FILES['content']
+
+  # results are cached until the next sync, so popular documents are not looked up again
+  cache_key = auth_cache.response_key(repo_name, url, content)
+  auth_response = auth_cache.get_response(cache_key)
+  if auth_response is None:
+    repository_publications = get_repository_publications(repo_name)
+    try:
+      if repository_publications is not None:
+        publication = repository_publications.by_name_or_latest(pub_name)
+      else:
+        publication = Publication.for_partner(repo_name).by_name_or_latest(pub_name,
+                                                                            strict=True)
+    except Publication.DoesNotExist:
+      raise Http404()
+    auth_response = check_authenticity(publication, pub_name, date, path, url, content,
+                                       content_type)
+    auth_cache.set_response(cache_key, auth_response)
 
   return auth_response.to_http_response(request)
 
 
 @csrf_exempt
 @require_http_methods(['POST'])
+@_observed('check_hashes')
 def check_hashes(request):
-  results = []
+  files = []
   try:
     data = json.loads(request.body)
     for file_info in data:
-      file_name = file_info.get('name')
-      file_hash = file_info.get('hash')
+      files.append((file_info.get('name'), file_info.get('hash')))
+  except Exception:
+    pass
 
-      authentic = False
-      current = False
-      msg = None
-      url = None
+  max_files = getattr(settings, 'CHECK_HASHES_MAX_FILES', CHECK_HASHES_MAX_FILES)
+  if len(files) > max_files:
+    return JsonResponse({'error': f'At most {max_files} files can be checked at once'},
+                        status=400)
 
-      try:
-        hash_obj = (
-            Hash.objects
-            .filter(value=file_hash)
-            .order_by("-path__publication_id")
-        )[0]
+  try:
+    repo_name = get_repo_by_host(request.get_host())
+  except KeyError:
+    # hosts which are not mapped to a repository can check hashes of all repositories
+    repo_name = None
 
+  hashes_data = _find_hashes({file_hash for _, file_hash in files if isinstance(file_hash, str)},
+                             repo_name)
+  results = []
+  for file_name, file_hash in files:
+    authentic = False
+    current = False
+    msg = None
+    url = None
+
+    hash_data = hashes_data.get(file_hash) if isinstance(file_hash, str) else None
+    if hash_data is not None:
+      try:
         authentic = True
 
-        start_date = hash_obj.start_commit.date
-        end_date = hash_obj.end_commit.date if hash_obj.end_commit else None
-        doc_path = hash_obj.path.url
-        doc_fs_path = hash_obj.path.filesystem
+        start_date = hash_data['valid_from']
+        end_date = hash_data['valid_to']
+        doc_path = hash_data['path__url']
+        doc_fs_path = hash_data['path__filesystem']
 
         # html files
         if doc_fs_path.endswith('html'):
           # url
-          pub_name = hash_obj.path.publication.name
+          pub_name = hash_data['path__publication__name']
           doc_date = start_date.strftime('%Y-%m-%d')
           url = f'{URL_PREFIX(pub_name, doc_date)}/{doc_path}'
 
@@ -101,24 +169,48 @@ def check_hashes(request):
             current = True
             msg = format_message(VALID_CURRENT_DOC_MSG, start_date=start_date)
 
-      except IndexError:
-        pass
       except Exception as e:
         msg = f'An error ocurred: {e}'
 
-      results.append(dict(
-          authentic=authentic,
-          current=current,
-          msg=msg,
-          name=file_name,
-          url=url,
-      ))
-  except Exception:
-    pass
+    results.append(dict(
+        authentic=authentic,
+        current=current,
+        msg=msg,
+        name=file_name,
+        url=url,
+    ))
 
   return JsonResponse(results, safe=False)
 
 
+def _find_hashes(values, repo_name=None):
+  """
+  Find hashes with the given values using a single query, optionally only hashes of the
+  given repository. If there are multiple hashes with the same value, the one belonging to
+  the newest publication is used. Return their data by value
+  """
+  hashes_data = {}
+  if not values:
+    return hashes_data
+  hashes = Hash.objects.filter(value__in=values)
+  if repo_name is not None:
+    hashes = hashes.filter(path__publication__repository__name=repo_name)
+  rows = (
+      hashes
+      .order_by('value', '-path__publication_id', '-id')
+      .values('value', 'valid_from', 'valid_to', 'path__url',
+              'path__filesystem', 'path__publication__name')
+  )
+  for row in rows.iterator():
+    hashes_data.setdefault(row['value'], row)
+  return hashes_data
+
+
+@require_http_methods(['GET'])
+def metrics(request):
+  return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
 def _extract_url(url):
   """Extract publication name, version (date) and path from url
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "olaafsite.settings")
 
 application = get_wsgi_application()
+
+# load publications before the first request, once apps are ready
+from olaaf_django.publication_cache import warm_up  # noqa: E402
+
+warm_up()